@@ -0,0 +1 @@
+# Extraction benchmarks package
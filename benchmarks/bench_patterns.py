@@ -0,0 +1,100 @@
+"""
+Benchmark for per-receipt field extraction
+Compares the old re.search-on-pattern-strings loop with precompiled matchers
+and with the single-pass field scanner, then reports worst-case extraction
+latency on long noisy inputs
+
+Run with: python -m benchmarks.bench_patterns
+"""
+import logging
+import re
+import sys
+import time
+from typing import Callable
+
+from extractors.document import DocumentView
+from extractors.extractor_manager import ExtractorManager
+from extractors.pattern_matcher import default_registry
+from test_extractors import awash_sample, awash_url, cbe_url
+
+ROUNDS = 2000
+
+
+def legacy_extract_field(extractor, text: str, field_name: str):
+    """Field lookup as it was done before patterns were precompiled"""
+    for pattern in extractor.patterns.get(field_name, []):
+        match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
+        if match:
+            return match.group(1).strip()
+    return None
+
+
+def time_per_receipt(extract: Callable[[], None], rounds: int = ROUNDS) -> float:
+    """Average microseconds per call"""
+    extract()  # warm up caches
+    start = time.perf_counter()
+    for _ in range(rounds):
+        extract()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    # Extractors log every field they find; keep that out of the timings
+    logging.disable(logging.INFO)
+
+    manager = ExtractorManager()
+    samples = [
+        ("Awash sample", awash_sample, awash_url),
+        ("CBE URL only", "", cbe_url),
+    ]
+
+    print(f"{'sample':<16}{'extractor':<30}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}{'scan (us)':>14}")
+    for label, text, url in samples:
+        extractor = manager._find_best_extractor(DocumentView(text, url))
+        fields = list(extractor.patterns.keys())
+
+        def before():
+            for field_name in fields:
+                legacy_extract_field(extractor, text, field_name)
+
+        def after():
+            for field_name in fields:
+                extractor.matcher.search(text, field_name)
+
+        def scan():
+            extractor.matcher.scan(text)
+
+        before_us = time_per_receipt(before)
+        after_us = time_per_receipt(after)
+        scan_us = time_per_receipt(scan)
+        print(f"{label:<16}{extractor.bank_name:<30}{before_us:>14.1f}{after_us:>14.1f}"
+              f"{before_us / after_us:>9.2f}x{scan_us:>14.1f}")
+
+    worst_case(manager)
+    return 0
+
+
+def worst_case(manager: ExtractorManager):
+    """Extraction latency on inputs that make backtracking patterns slow"""
+    noisy_inputs = {
+        "digit run": "1" * 50_000,
+        "letter run": "A" * 50_000,
+        "repeated labels": "Transaction ID Amount " * 5_000,
+        "OCR noise": "Sender Name : " + "AB 1, " * 10_000,
+    }
+    print(f"\nWorst case (regex backend: {default_registry.backend.name})")
+    print(f"{'input':<18}{'extractor':<30}{'ms':>10}{'scan ms':>10}")
+    for label, text in noisy_inputs.items():
+        for extractor in manager.extractors:
+            timings = []
+            for single_pass in (False, True):
+                extractor.single_pass_scan = single_pass
+                start = time.perf_counter()
+                extractor.extract(DocumentView(text))
+                timings.append((time.perf_counter() - start) * 1000)
+            del extractor.single_pass_scan
+            print(f"{label:<18}{extractor.bank_name:<30}{timings[0]:>10.1f}{timings[1]:>10.1f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
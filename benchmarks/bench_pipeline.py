@@ -0,0 +1,267 @@
+"""
+Benchmark suite for the receipt pipeline on a synthetic corpus
+Measures throughput, p50/p99 latency, peak memory and accuracy for
+ExtractorManager.extract_transaction_data, extract_content_text and
+extract_pdf_text (per installed PDF engine), and writes the results as JSON
+
+Run with: python -m benchmarks.bench_pipeline --count 1000
+Compare:  python -m benchmarks.bench_pipeline --compare bench_results.json
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Sequence
+
+from benchmarks.corpus import SyntheticReceipt, generate_corpus
+from extractors.extractor_manager import ExtractorManager
+from extractors.pattern_matcher import default_registry
+from pipeline.content import extract_content_text, extract_pdf_text, iter_pdf_pages
+from pipeline.pdf_engines import PdfDocument, available_engines, get_engines
+
+# Relative slowdown (or memory growth) that counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def is_correct(result, receipt: SyntheticReceipt) -> bool:
+    """Extracted transaction id and amount match what the generator wrote"""
+    if result.get('transaction_id') != receipt.expected['transaction_id']:
+        return False
+    amount = getattr(result, 'amount', None)
+    return amount is not None and amount == Decimal(receipt.expected['amount'])
+
+
+def measure(name: str, inputs: List, run: Callable, check: Optional[Callable] = None) -> Dict:
+    """Time `run` over every input, then measure peak memory in a second pass"""
+    latencies = []
+    correct = 0
+    start = time.perf_counter()
+    for item in inputs:
+        call_start = time.perf_counter()
+        output = run(item)
+        latencies.append(time.perf_counter() - call_start)
+        if check is not None and check(output, item):
+            correct += 1
+    total = time.perf_counter() - start
+
+    # tracemalloc slows every allocation down, so it gets its own pass
+    tracemalloc.start()
+    for item in inputs:
+        run(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    stats = {
+        'name': name,
+        'count': len(inputs),
+        'throughput_per_s': len(inputs) / total if total else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1e3,
+        'p99_ms': percentile(latencies, 0.99) * 1e3,
+        'peak_memory_kb': peak / 1024,
+    }
+    if check is not None:
+        stats['accuracy'] = correct / len(inputs) if inputs else 0.0
+    return stats
+
+
+def _available(module: str) -> bool:
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def measure_batch(manager: ExtractorManager, corpus: List[SyntheticReceipt], workers: int) -> Dict:
+    """Throughput of extract_many over the whole corpus"""
+    pairs = [(receipt.text, receipt.url) for receipt in corpus]
+    start = time.perf_counter()
+    correct = sum(1 for result, receipt in zip(manager.extract_many(pairs, workers=workers), corpus)
+                  if is_correct(result, receipt))
+    total = time.perf_counter() - start
+    return {
+        'name': f'extract_many[workers={workers}]',
+        'count': len(corpus),
+        'throughput_per_s': len(corpus) / total if total else 0.0,
+        'accuracy': correct / len(corpus) if corpus else 0.0,
+    }
+
+
+def engine_text(engine, content: bytes) -> str:
+    return " ".join(iter_pdf_pages(PdfDocument.open(engine, content)))
+
+
+def measure_engines(manager: ExtractorManager, documents: List) -> Dict[str, Dict]:
+    """Speed and accuracy of every installed PDF engine on the same documents
+
+    `agreement` is the share of documents whose transaction id and amount
+    equal what PyPDF2's text gives, so a faster engine that reads receipts
+    differently shows up even where both are "correct".
+    """
+    results = {}
+    reference = None
+    engines = sorted(available_engines(), key=lambda engine: engine.name != 'pypdf2')
+    for engine in engines:
+        name = f'extract_pdf_text[{engine.name}]'
+        results[name] = measure(
+            name, documents,
+            lambda document: manager.extract_transaction_data(
+                engine_text(engine, document[1]), document[0].url),
+            lambda result, document: is_correct(result, document[0]),
+        )
+        extracted = [manager.extract_transaction_data(engine_text(engine, document[1]), document[0].url)
+                     for document in documents]
+        fields = [(result.get('transaction_id'), result.get('amount')) for result in extracted]
+        if reference is None:
+            reference = fields
+        results[name]['agreement'] = (sum(1 for a, b in zip(fields, reference) if a == b) / len(fields)
+                                      if fields else 0.0)
+    return results
+
+
+def run_suite(count: int, seed: int, workers: Sequence[int] = ()) -> Dict:
+    corpus = generate_corpus(count, seed)
+    manager = ExtractorManager()
+    results = {}
+
+    for bank in sorted({receipt.bank for receipt in corpus}):
+        receipts = [receipt for receipt in corpus if receipt.bank == bank]
+        results[f'extract_transaction_data[{bank}]'] = measure(
+            f'extract_transaction_data[{bank}]', receipts,
+            lambda receipt: manager.extract_transaction_data(receipt.text, receipt.url),
+            is_correct,
+        )
+
+    for worker_count in workers:
+        stats = measure_batch(manager, corpus, worker_count)
+        results[stats['name']] = stats
+
+    payloads = [receipt.text.encode('utf-8') for receipt in corpus]
+    results['extract_content_text[text]'] = measure(
+        'extract_content_text[text]', payloads,
+        lambda payload: extract_content_text(payload, 'text/plain'),
+    )
+
+    skipped = []
+    if _available('bs4'):
+        pages = [(receipt, receipt.html) for receipt in corpus]
+        results['extract_content_text[html]'] = measure(
+            'extract_content_text[html]', pages,
+            lambda page: extract_content_text(page[1], 'text/html'),
+        )
+    else:
+        skipped.append('extract_content_text[html]: bs4 not installed')
+
+    if get_engines().engines:
+        documents = [(receipt, receipt.pdf) for receipt in corpus]
+        results.update(measure_engines(manager, documents))
+        results['extract_pdf_text'] = measure(
+            'extract_pdf_text', documents,
+            lambda document: extract_pdf_text(document[1]),
+        )
+        results['end_to_end[pdf]'] = measure(
+            'end_to_end[pdf]', documents,
+            lambda document: manager.extract_transaction_data(
+                extract_content_text(document[1], 'application/pdf'), document[0].url),
+            lambda result, document: is_correct(result, document[0]),
+        )
+    else:
+        skipped.append('extract_pdf_text: no PDF engine installed (PyPDF2 or PyMuPDF)')
+
+    return {
+        'meta': {
+            'count_per_bank': count,
+            'seed': seed,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'regex_backend': default_registry.backend.name,
+            'pdf_engine': get_engines().primary,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+        'skipped': skipped,
+    }
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Regressions of `current` against `baseline`, one message per metric"""
+    regressions = []
+    for name, stats in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        if stats['throughput_per_s'] < before['throughput_per_s'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput_per_s']:.0f}/s -> "
+                               f"{stats['throughput_per_s']:.0f}/s")
+        for metric in ('p50_ms', 'p99_ms', 'peak_memory_kb'):
+            if metric in stats and metric in before and stats[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {before[metric]:.3f} -> {stats[metric]:.3f}")
+        for metric in ('accuracy', 'agreement'):
+            if metric in before and stats.get(metric, 0.0) < before[metric]:
+                regressions.append(f"{name}: {metric} {before[metric]:.3f} -> {stats.get(metric, 0.0):.3f}")
+    return regressions
+
+
+def print_report(report: Dict):
+    print(f"{'stage':<36}{'n':>7}{'per s':>11}{'p50 ms':>10}{'p99 ms':>10}{'peak KB':>11}{'accuracy':>10}{'agree':>8}")
+    for stats in report['results'].values():
+        accuracy = f"{stats['accuracy']:.3f}" if 'accuracy' in stats else '-'
+        agreement = f"{stats['agreement']:.3f}" if 'agreement' in stats else '-'
+        latency = (f"{stats['p50_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['peak_memory_kb']:>11.1f}"
+                   if 'p50_ms' in stats else f"{'-':>10}{'-':>10}{'-':>11}")
+        print(f"{stats['name']:<36}{stats['count']:>7}{stats['throughput_per_s']:>11.0f}{latency}{accuracy:>10}{agreement:>8}")
+    for reason in report['skipped']:
+        print(f"skipped {reason}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=1000, help='receipts per bank')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', metavar='BASELINE', help='earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--workers', type=int, nargs='*', default=[],
+                        help='also time extract_many with these worker counts')
+    args = parser.parse_args(argv)
+
+    # Extractors log every field they find; keep that out of the timings
+    logging.disable(logging.INFO)
+
+    report = run_suite(args.count, args.seed, args.workers)
+    print_report(report)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(baseline, report, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            return 1
+        print("No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
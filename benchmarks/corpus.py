@@ -0,0 +1,191 @@
+"""
+Synthetic receipt corpus for the extraction benchmarks
+Generates realistic receipts per bank as raw text, HTML and PDF
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional
+import random
+import string
+
+from pipeline.pdf_engines import render_pdf
+
+BANKS = ('awash', 'cbe', 'generic')
+
+FIRST_NAMES = ['ABEBE', 'ALMAZ', 'BEKELE', 'CHALTU', 'DAWIT', 'EYASU', 'HANNA', 'KEBEDE',
+               'MERON', 'SELAM', 'TOLA', 'YOHANNES', 'ZERIHUN', 'TSION', 'GIRMA', 'LEMLEM']
+BANK_NAMES = ['COMMERCIAL BANK OF ETHIOPIA', 'DASHEN BANK', 'BANK OF ABYSSINIA', 'AWASH BANK',
+              'COOPERATIVE BANK OF OROMIA', 'WEGAGEN BANK']
+
+# OCR-style confusions applied to noisy receipts
+OCR_CONFUSIONS = {'O': '0', '0': 'O', 'I': '1', 'l': '1', 'S': '5', 'B': '8', ':': ';'}
+
+
+@dataclass
+class SyntheticReceipt:
+    """One generated receipt and the values an extractor should find"""
+    bank: str
+    layout: str
+    noisy: bool
+    url: str
+    expected: Dict[str, str]
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+    @property
+    def html(self) -> bytes:
+        return render_html(self.lines)
+
+    @property
+    def pdf(self) -> bytes:
+        return render_pdf(self.lines)
+
+
+def _name(rng: random.Random) -> str:
+    return " ".join(rng.sample(FIRST_NAMES, 3))
+
+
+def _amount(rng: random.Random) -> Decimal:
+    return Decimal(rng.randint(10, 500_000)) + Decimal(rng.choice([0, 0, 0, 50, 25, 99])) / 100
+
+
+def _format_amount(amount: Decimal, with_cents: bool) -> str:
+    return f"{amount:,.2f}" if with_cents else f"{int(amount):,}"
+
+
+def _awash(rng: random.Random, layout: str) -> SyntheticReceipt:
+    txn = ''.join(rng.choices('0123456789ABCDEF', k=12))
+    amount = _amount(rng).quantize(Decimal(1))
+    sender = _name(rng)
+    rows = [
+        ("Company Name", "Awash Bank Share company"),
+        ("TIN No", "0000030100"),
+        ("Customer Name", sender.title()),
+        ("Account No", f"0132{rng.randint(0, 9)}******{rng.randint(100, 999)}/BANK"),
+        ("Transaction Time", f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+                             f"{rng.randint(1, 12)}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d} "
+                             f"{rng.choice(['AM', 'PM'])}"),
+        ("Transaction Type", "Other Bank Transfer"),
+        ("Amount", f"{_format_amount(amount, False)} ETB"),
+        ("Charge", f"{rng.randint(1, 20)} ETB"),
+        ("Sender Name", sender),
+        ("Beneficiary name", _name(rng)),
+        ("Beneficiary Account", str(rng.randint(10 ** 12, 10 ** 13 - 1))),
+        ("Beneficiary Bank", rng.choice(BANK_NAMES)),
+        ("Transaction ID", txn),
+    ]
+    if layout == 'pipe':
+        lines = ["Company Information | Customer Information |"] + [f"{k} | : | {v} |" for k, v in rows]
+    else:
+        lines = ["Awash Bank"] + [f"{k} : {v}" for k, v in rows]
+    return SyntheticReceipt(
+        bank='awash', layout=layout, noisy=False,
+        url=f"https://awashpay.awashbank.com:8225/-{txn}-{''.join(rng.choices(string.ascii_uppercase, k=6))}",
+        expected={'transaction_id': txn, 'amount': str(amount)},
+        lines=lines,
+    )
+
+
+def _cbe(rng: random.Random, layout: str) -> SyntheticReceipt:
+    txn = f"FT{rng.randint(10 ** 5, 10 ** 6 - 1)}{''.join(rng.choices(string.ascii_uppercase, k=4))}"
+    amount = _amount(rng)
+    rows = [
+        ("Payer", _name(rng)),
+        ("Account", f"1{'*' * 4}{rng.randint(1000, 9999)}"),
+        ("Receiver", _name(rng)),
+        ("Payment Date & Time", f"{rng.randint(1, 12)}/{rng.randint(1, 28)}/2025"),
+        ("Reference No. (VAT Invoice No)", txn),
+        ("Transferred Amount", f"{_format_amount(amount, True)} ETB"),
+    ]
+    separator = " " if layout == 'spaced' else ": "
+    lines = ["Commercial Bank of Ethiopia", "VAT Invoice / Customer Receipt"]
+    lines += [f"{k}{separator}{v}" for k, v in rows]
+    return SyntheticReceipt(
+        bank='cbe', layout=layout, noisy=False,
+        url=f"https://apps.cbe.com.et:100/?id={txn}{rng.randint(10 ** 7, 10 ** 8 - 1)}",
+        expected={'transaction_id': txn, 'amount': str(amount)},
+        lines=lines,
+    )
+
+
+def _generic(rng: random.Random, layout: str) -> SyntheticReceipt:
+    txn = ''.join(rng.choices(string.ascii_uppercase + string.digits, k=10))
+    amount = _amount(rng)
+    rows = [
+        ("Bank", rng.choice(BANK_NAMES[1:])),
+        ("Transaction ID", txn),
+        ("Sender Name", _name(rng)),
+        ("Beneficiary name", _name(rng)),
+        ("Account No", str(rng.randint(10 ** 9, 10 ** 10 - 1))),
+        ("Date", f"{rng.randint(1, 28)}/{rng.randint(1, 12)}/2025"),
+        ("Amount", f"{_format_amount(amount, True)} ETB"),
+        ("Status", "Transfer completed"),
+    ]
+    if layout == 'columns':
+        lines = [f"{k:<20}{v}" for k, v in rows]
+    else:
+        lines = [f"{k}: {v}" for k, v in rows]
+    return SyntheticReceipt(
+        bank='generic', layout=layout, noisy=False, url="",
+        expected={'transaction_id': txn, 'amount': str(amount)},
+        lines=lines,
+    )
+
+
+GENERATORS = {
+    'awash': (_awash, ('pipe', 'colon')),
+    'cbe': (_cbe, ('spaced', 'colon')),
+    'generic': (_generic, ('colon', 'columns')),
+}
+
+
+def add_ocr_noise(line: str, rng: random.Random, rate: float = 0.02) -> str:
+    """Character confusions, doubled spaces and dropped separators"""
+    noisy = []
+    for char in line:
+        roll = rng.random()
+        if roll < rate and char in OCR_CONFUSIONS:
+            noisy.append(OCR_CONFUSIONS[char])
+        elif roll < rate * 1.5 and char == ' ':
+            noisy.append('  ')
+        elif roll < rate * 1.8 and char == '|':
+            continue
+        else:
+            noisy.append(char)
+    return ''.join(noisy)
+
+
+def generate_receipts(bank: str, count: int, seed: int = 0,
+                      noise_ratio: float = 0.2) -> Iterator[SyntheticReceipt]:
+    """Yield `count` receipts for a bank, cycling through its layouts"""
+    generator, layouts = GENERATORS[bank]
+    rng = random.Random(f"{bank}:{seed}")
+    for i in range(count):
+        receipt = generator(rng, layouts[i % len(layouts)])
+        if rng.random() < noise_ratio:
+            receipt.noisy = True
+            receipt.lines = [add_ocr_noise(line, rng) for line in receipt.lines]
+        yield receipt
+
+
+def generate_corpus(count_per_bank: int, seed: int = 0,
+                    banks: Optional[List[str]] = None) -> List[SyntheticReceipt]:
+    corpus = []
+    for bank in banks or BANKS:
+        corpus.extend(generate_receipts(bank, count_per_bank, seed))
+    return corpus
+
+
+def render_html(lines: List[str]) -> bytes:
+    """Receipt rows as an HTML table, as the bank receipt pages serve them"""
+    rows = []
+    for line in lines:
+        cells = [cell.strip() for cell in line.split('|') if cell.strip()]
+        rows.append("<tr>" + "".join(f"<td>{cell}</td>" for cell in cells) + "</tr>")
+    body = "\n".join(rows)
+    return (f"<!DOCTYPE html><html><head><title>Receipt</title>"
+            f"<style>td {{ padding: 2px; }}</style></head>"
+            f"<body><table>\n{body}\n</table></body></html>").encode('utf-8')
@@ -2,16 +2,18 @@ import logging
 import os
 import io
 import re
-import requests
-import PyPDF2
-import pytesseract
-import cv2
-import numpy as np
 from PIL import Image
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 from telegram.constants import ParseMode
 import asyncio
+from pipeline.admission import AdmissionControl
+from pipeline.content import iter_pdf_pages
+from pipeline.executor import StageExecutor
+from pipeline.fetch import Fetcher
+from pipeline.ocr import ocr_image
+from pipeline.pdf_engines import PdfDocument, PyPDF2Engine
+from pipeline.webhook import WebhookConfig, serve_application
 
 # Configure logging
 logging.basicConfig(
@@ -23,6 +25,15 @@ logger = logging.getLogger(__name__)
 # Bot configuration
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 
+# Shared HTTP client for receipt downloads
+fetcher = Fetcher.from_env()
+
+# PDF parsing, OCR and extraction run here so the update loop stays responsive
+stage_executor = StageExecutor.from_env()
+
+# Per-user and global rate limits, checked before any download or parse
+admission = AdmissionControl.from_env()
+
 def extract_transaction_data(text: str) -> dict:
     """Extract transaction information from text using regex patterns"""
     logger.info(f"Extracting transaction data from text: {text[:200]}...")
@@ -84,39 +95,36 @@ def extract_transaction_data(text: str) -> dict:
         'raw_text': text
     }
 
-def extract_pdf_text(pdf_content: bytes) -> str:
-    """Extract text from PDF using PyPDF2"""
+def extract_pdf_transaction(pdf_content) -> dict:
+    """Extract transaction data page by page, stopping once ID and amount are found
+    
+    Extraction runs after pages 1, 2, 4, 8, ... and after the last page, so
+    later pages of a long statement are usually never parsed.
+    """
+    pages = []
+    result = None
     try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-        text = ""
-        
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text += page.extract_text() + " "
-            
-        logger.info(f"Extracted {len(text)} characters from PDF")
-        return text
-        
+        for text in iter_pdf_pages(PdfDocument.open(PyPDF2Engine(), pdf_content)):
+            pages.append(text)
+            if len(pages) & (len(pages) - 1) == 0:
+                result = extract_transaction_data(" ".join(pages))
+                if result.get('transaction_id') and result.get('amount'):
+                    return result
     except Exception as e:
         logger.error(f"PDF extraction failed: {e}")
         raise Exception(f"Failed to extract text from PDF: {str(e)}")
+    
+    # Extract from the full text unless the last checkpoint already covered it
+    if result is None or len(pages) & (len(pages) - 1):
+        result = extract_transaction_data(" ".join(pages))
+    return result
 
-def process_image_ocr(image_data: bytes) -> str:
+def process_image_ocr(image_data) -> str:
     """Process image using OCR to extract text"""
     try:
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(image_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Preprocess image for better OCR
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Apply threshold to get binary image
-        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        # Use Tesseract to extract text
-        custom_config = r'--oem 3 --psm 6'
-        text = pytesseract.image_to_string(thresh, config=custom_config)
+        # Grayscale + Otsu threshold, then Tesseract; shared with the
+        # scanned-PDF fallback
+        text = ocr_image(image_data)
         
         logger.info(f"OCR extracted {len(text)} characters from image")
         return text
@@ -273,6 +281,15 @@ async def handle_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     elif query.data == 'about':
         await about_command(update, context)
 
+async def admitted(update: Update) -> bool:
+    """Check the sender's rate limit; over the limit they get one short reply."""
+    decision = admission.admit(update.effective_user.id)
+    if not decision.allowed and decision.notify:
+        await update.message.reply_text(
+            f"🚦 Too many receipts at once. Please wait {max(1, round(decision.retry_after))}s and try again."
+        )
+    return decision.allowed
+
 async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle PDF URL messages."""
     url = update.message.text.strip()
@@ -285,6 +302,9 @@ async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         )
         return
     
+    if not await admitted(update):
+        return
+    
     # Send processing message
     processing_msg = await update.message.reply_text(
         "⏳ **Processing PDF URL...**\n\n🔄 Downloading and extracting data...",
@@ -294,8 +314,7 @@ async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     try:
         # Download PDF
         logger.info(f"Processing PDF from URL: {url}")
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
+        response = await fetcher.download(url, accept=('pdf',))
         
         # Update progress
         await processing_msg.edit_text(
@@ -303,17 +322,8 @@ async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
             parse_mode=ParseMode.MARKDOWN
         )
         
-        # Extract text from PDF
-        text = extract_pdf_text(response.content)
-        
-        # Update progress
-        await processing_msg.edit_text(
-            "⏳ **Processing PDF URL...**\n\n🔍 Analyzing transaction data...",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
-        # Extract transaction data
-        result = extract_transaction_data(text)
+        # Extract transaction data, reading only as many pages as needed
+        result = await stage_executor.run(extract_pdf_transaction, response.content)
         
         # Format and send result
         result_message = format_transaction_result(result)
@@ -349,6 +359,9 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
     
+    if not await admitted(update):
+        return
+    
     # Send processing message
     processing_msg = await update.message.reply_text(
         f"⏳ **Processing PDF File...**\n\n📁 File: {document.file_name}\n🔄 Downloading and extracting data...",
@@ -358,7 +371,9 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     try:
         # Download file
         file = await context.bot.get_file(document.file_id)
-        file_data = await file.download_as_bytearray()
+        file_data = io.BytesIO()
+        await file.download_to_memory(file_data)
+        file_data.seek(0)
         
         # Update progress
         await processing_msg.edit_text(
@@ -366,17 +381,8 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             parse_mode=ParseMode.MARKDOWN
         )
         
-        # Extract text from PDF
-        text = extract_pdf_text(bytes(file_data))
-        
-        # Update progress
-        await processing_msg.edit_text(
-            f"⏳ **Processing PDF File...**\n\n📁 File: {document.file_name}\n🔍 Analyzing transaction data...",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
-        # Extract transaction data
-        result = extract_transaction_data(text)
+        # Extract transaction data, reading only as many pages as needed
+        result = await stage_executor.run(extract_pdf_transaction, file_data)
         
         # Format and send result
         result_message = format_transaction_result(result)
@@ -396,6 +402,9 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     """Handle photo uploads for OCR processing."""
     photo = update.message.photo[-1]  # Get the highest resolution version
     
+    if not await admitted(update):
+        return
+    
     # Send processing message
     processing_msg = await update.message.reply_text(
         "⏳ **Processing Image...**\n\n📷 Analyzing image with OCR...",
@@ -414,7 +423,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
         
         # Extract text using OCR
-        text = process_image_ocr(bytes(file_data))
+        text = await stage_executor.run(process_image_ocr, file_data)
         
         # Update progress
         await processing_msg.edit_text(
@@ -423,7 +432,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
         
         # Extract transaction data
-        result = extract_transaction_data(text)
+        result = await stage_executor.run(extract_transaction_data, text)
         
         # Format and send result
         result_message = format_transaction_result(result)
@@ -455,6 +464,18 @@ Use /help for detailed instructions! 📖
     
     await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
+async def close_pipeline(application: Application) -> None:
+    """Close pooled HTTP connections and worker pools when the application shuts down."""
+    await fetcher.aclose()
+    stage_executor.shutdown(wait=False)
+
+async def serve_webhook(application: Application, config: WebhookConfig) -> None:
+    """Run the bot in webhook mode, then release the shared clients."""
+    try:
+        await serve_application(application, config, lambda: {'stages_pending': stage_executor.pending})
+    finally:
+        await close_pipeline(application)
+
 def main() -> None:
     """Start the bot."""
     if BOT_TOKEN == 'YOUR_BOT_TOKEN_HERE':
@@ -463,7 +484,7 @@ def main() -> None:
         return
     
     # Create the Application
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = Application.builder().token(BOT_TOKEN).post_shutdown(close_pipeline).build()
     
     # Add handlers
     application.add_handler(CommandHandler("start", start))
@@ -480,7 +501,17 @@ def main() -> None:
     # Start the bot
     print("🚀 NextVerify Telegram Bot is starting...")
     print("✅ Bot is running! Send /start to begin.")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    
+    # Webhook mode when WEBHOOK_URL is set, long polling otherwise
+    webhook = WebhookConfig.from_env()
+    if webhook:
+        print(f"🌐 Receiving updates via webhook at {webhook.webhook_url}")
+        try:
+            asyncio.run(serve_webhook(application, webhook))
+        except KeyboardInterrupt:
+            print("\n🛑 Bot stopped by user")
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main()
@@ -1,20 +1,58 @@
+import asyncio
+import io
 import logging
 import os
-import io
 import re
-import requests
-import PyPDF2
+import time
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 from telegram.constants import ParseMode
 from dotenv import load_dotenv
-from extractors.extractor_manager import ExtractorManager
+from extractors.transaction_result import TransactionResult
+from pipeline.admission import AdmissionControl
+from pipeline.cache import ResultCache, content_key, file_key, result_keys, url_key, url_keys
+from pipeline.executor import StageExecutor
+from pipeline.fetch import Fetcher
+from pipeline.jobs import PRIORITY_DOCUMENT, PRIORITY_HEAVY, PRIORITY_URL, Job, JobQueue, QueueFull
+from pipeline.ledger import ReceiptLedger, Sighting
+from pipeline.progress import ProgressReporter
+from pipeline.singleflight import SingleFlight
+from pipeline.webhook import WebhookConfig, serve_application
+from pipeline.content import page_ranges
+from pipeline.pdf_engines import get_engines
+from pipeline.ocr import get_ocr
+from pipeline.stages import extract_transaction, get_manager, is_final, ocr_pdf_pages, parse_content, parse_pdf_pages, scan_pdf
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize the extraction manager
-extractor_manager = ExtractorManager()
+# Initialize the extraction manager (shared with the stage functions)
+extractor_manager = get_manager()
+
+# Parsing and extraction are CPU-bound; they run here, not on the event loop
+stage_executor = StageExecutor.from_env()
+
+# Verification results for resent links and forwarded files
+result_cache = ResultCache.from_env()
+
+# Concurrent submissions of the same link or file share one job; the chat
+# that started it sees its progress, every chat gets its own reply
+in_flight = SingleFlight()
+
+# Every verified receipt, to flag transaction IDs that are submitted again
+ledger = ReceiptLedger.from_env()
+
+# Per-user and global rate limits, checked before any work is queued
+admission = AdmissionControl.from_env()
+
+# Handlers only queue verifications; a pool of workers runs them, links
+# ahead of large files, taking turns between chats
+job_queue = JobQueue.from_env()
+
+# Shared HTTP client for receipt downloads; some bank servers have
+# certificate problems, so TLS verification stays off as before
+fetcher = Fetcher.from_env(verify=False)
 
 # Configure logging
 logging.basicConfig(
@@ -26,85 +64,24 @@ logger = logging.getLogger(__name__)
 # Bot configuration - REPLACE WITH YOUR ACTUAL TOKEN
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 
-# Transaction extraction is now handled by the ExtractorManager
+# Status messages only appear for verifications slower than this, and are
+# edited at most this often
+PROGRESS_SHOW_AFTER = float(os.getenv('PROGRESS_SHOW_AFTER', '1.0'))
+PROGRESS_MIN_INTERVAL = float(os.getenv('PROGRESS_MIN_INTERVAL', '2.0'))
 
-def extract_pdf_text(pdf_content: bytes) -> str:
-    """Extract text from PDF using PyPDF2"""
-    try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-        text = ""
-        
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text += page.extract_text() + " "
-            
-        logger.info(f"Extracted {len(text)} characters from PDF")
-        return text
-        
-    except Exception as e:
-        logger.error(f"PDF extraction failed: {e}")
-        raise Exception(f"Failed to extract text from PDF: {str(e)}")
+# PDF pages read in order before the rest of a long document is split across
+# the stage workers
+PDF_SEQUENTIAL_PAGES = int(os.getenv('PDF_SEQUENTIAL_PAGES', '4'))
 
-def extract_html_text(html_content: bytes) -> str:
-    """Extract text from HTML content"""
-    try:
-        from bs4 import BeautifulSoup
-        
-        # Decode HTML content
-        html_text = html_content.decode('utf-8', errors='ignore')
-        
-        # Parse HTML
-        soup = BeautifulSoup(html_text, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-        
-        # Get text content
-        text = soup.get_text()
-        
-        # Clean up whitespace
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
-        
-        logger.info(f"Extracted {len(text)} characters from HTML")
-        return text
-        
-    except Exception as e:
-        logger.error(f"HTML extraction failed: {e}")
-        raise Exception(f"Failed to extract text from HTML: {str(e)}")
+# Finds the pages of scanned PDFs that need OCR
+ocr = get_ocr()
 
-def extract_content_text(content: bytes, content_type: str) -> str:
-    """Extract text from content - handles both PDF and HTML"""
-    content_type = content_type.lower()
-    
-    logger.info(f"Processing content type: {content_type}")
-    
-    # Try PDF first
-    if 'pdf' in content_type or content.startswith(b'%PDF'):
-        try:
-            return extract_pdf_text(content)
-        except Exception as e:
-            logger.warning(f"PDF extraction failed, trying HTML: {e}")
-    
-    # Try HTML
-    if 'html' in content_type or b'<html' in content.lower() or b'<!doctype' in content.lower():
-        try:
-            return extract_html_text(content)
-        except Exception as e:
-            logger.warning(f"HTML extraction failed: {e}")
-    
-    # Fallback: treat as plain text
-    try:
-        text = content.decode('utf-8', errors='ignore')
-        logger.info(f"Extracted {len(text)} characters as plain text")
-        return text
-    except Exception as e:
-        logger.error(f"All content extraction methods failed: {e}")
-        raise Exception("Failed to extract text from content")
+# Uploads above this size queue behind links and small files
+HEAVY_DOCUMENT_BYTES = int(os.getenv('JOB_HEAVY_BYTES', str(2 * 1024 * 1024)))
+
+# Transaction extraction is now handled by the ExtractorManager
 
-def format_transaction_result(result: dict) -> str:
+def format_transaction_result(result: dict, sighting: Optional[Sighting] = None) -> str:
     """Format transaction result for Telegram message"""
     if result['is_valid']:
         bank_name = result.get('extractor_used', 'Unknown Bank')
@@ -133,6 +110,17 @@ def format_transaction_result(result: dict) -> str:
             message += f"💳 **Charge:** {result['charge']} ETB\n"
         if result.get('branch'):
             message += f"🏢 **Branch:** {result['branch']}\n"
+        
+        if sighting is not None and sighting.is_duplicate:
+            entry = sighting.entry
+            first_seen = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.first_seen))
+            if sighting.same_chat:
+                message += f"\nℹ️ **Already verified** in this chat on {first_seen} ({entry.seen_count} submissions)\n"
+            else:
+                message += (f"\n⚠️ **Possible receipt reuse:** this transaction ID was already submitted "
+                            f"{entry.seen_count - 1} time(s), first on {first_seen}\n")
+            if sighting.amount_changed:
+                message += f"⚠️ **Amount differs** from the first submission ({entry.amount} ETB)\n"
             
         message += "\n🎉 **Status:** Transaction details successfully extracted and verified!"
         
@@ -260,6 +248,122 @@ async def handle_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     elif query.data == 'about':
         await about_command(update, context)
 
+async def extract_pdf(content: bytes, url: str, report_progress) -> TransactionResult:
+    """Extract a receipt page by page, stopping once the result is settled; scanned pages are OCRed."""
+    scan = await stage_executor.run(scan_pdf, content, url, PDF_SEQUENTIAL_PAGES)
+    if scan.page_count == 0:
+        return TransactionResult.failure("The PDF has no pages")
+    if scan.settled:
+        return scan.result
+    pages, result = scan.pages, scan.result
+    
+    if len(pages) < scan.page_count:
+        # Long document without a settled result: parse the remaining pages
+        # in parallel ranges, then extract from the whole text
+        await report_progress(f"📄 Reading all {scan.page_count} pages...")
+        ranges = page_ranges(len(pages), scan.page_count, stage_executor.max_workers)
+        chunks = await asyncio.gather(*(
+            stage_executor.run(parse_pdf_pages, content, start, stop) for start, stop in ranges
+        ))
+        pages = pages + [page for chunk in chunks for page in chunk]
+        
+        await report_progress("🔍 Analyzing transaction data...")
+        result = await stage_executor.run(extract_transaction, " ".join(pages), url)
+    
+    # Scanned receipts have pages without a text layer; only those are OCRed
+    if not result['is_valid'] and ocr.blank_pages(pages):
+        await report_progress("🔎 Scanned PDF, reading it with OCR...")
+        pages = await stage_executor.run(ocr_pdf_pages, content, pages)
+        result = await stage_executor.run(extract_transaction, " ".join(pages), url)
+    return result
+
+async def verify_url(url: str, report_progress) -> TransactionResult:
+    """Download and verify a receipt URL; resent receipts come from the cache."""
+    keys = url_keys(url, extractor_manager)
+    cached = result_cache.get(*keys)
+    if cached is not None:
+        logger.info(f"Cache hit for URL: {url}")
+        return cached
+    
+    # Download PDF
+    logger.info(f"Processing PDF from URL: {url}")
+    response = await fetcher.download(url)
+    
+    # The same receipt may have been seen under another link
+    hash_key = content_key(response.content)
+    result = result_cache.get(hash_key)
+    if result is None:
+        await report_progress("📄 PDF downloaded, extracting text...")
+        
+        if response.kind == 'pdf':
+            result = await extract_pdf(response.content, url, report_progress)
+        else:
+            # HTML receipt page or plain text
+            text = await stage_executor.run(parse_content, response.content, response.kind)
+            
+            await report_progress("🔍 Analyzing transaction data...")
+            
+            # Extract transaction data using the appropriate extractor
+            result = await stage_executor.run(extract_transaction, text, url)
+    
+    if is_final(result):
+        result_cache.put(keys + [hash_key] + result_keys(result, url, extractor_manager), result)
+    return result
+
+async def verify_document(bot, document: dict, report_progress) -> TransactionResult:
+    """Download and verify an uploaded PDF; forwarded copies come from the cache."""
+    keys = [file_key(document['file_unique_id'])]
+    cached = result_cache.get(*keys)
+    if cached is not None:
+        logger.info(f"Cache hit for file: {document['file_name']}")
+        return cached
+    
+    # Download file
+    file = await bot.get_file(document['file_id'])
+    file_data = io.BytesIO()
+    await file.download_to_memory(file_data)
+    
+    hash_key = content_key(file_data.getbuffer())
+    result = result_cache.get(hash_key)
+    if result is None:
+        await report_progress("📄 Extracting text...")
+        
+        # Page ranges may be parsed concurrently, so each stage gets the bytes
+        # rather than the shared stream
+        result = await extract_pdf(file_data.getvalue(), "", report_progress)
+    
+    if is_final(result):
+        # No transaction key: an upload's content cannot vouch for a bank link
+        result_cache.put(keys + [hash_key], result)
+    return result
+
+async def queue_job(update: Update, job: Job) -> None:
+    """Queue a verification, or tell the user right away that the bot is busy."""
+    decision = admission.admit(update.effective_user.id)
+    if not decision.allowed:
+        # One reply per burst; further messages are dropped silently
+        if decision.notify:
+            await update.message.reply_text(
+                f"🚦 Too many receipts at once. Please wait {max(1, round(decision.retry_after))}s and try again."
+            )
+        return
+    
+    try:
+        waiting = job_queue.submit(job)
+    except QueueFull as e:
+        await update.message.reply_text(
+            f"🚦 **Busy right now**\n\n{e}. Please try again in a minute.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    
+    # Only worth a message when every worker is busy
+    if waiting:
+        await update.message.reply_text(
+            f"📥 **Queued** - {waiting} receipt(s) ahead of yours. I'll reply here when it's done.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
 async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle PDF URL messages."""
     url = update.message.text.strip()
@@ -272,59 +376,11 @@ async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         )
         return
     
-    # Send processing message
-    processing_msg = await update.message.reply_text(
-        "⏳ **Processing PDF URL...**\n\n🔄 Downloading and extracting data...",
-        parse_mode=ParseMode.MARKDOWN
-    )
-    
-    try:
-        # Download PDF
-        logger.info(f"Processing PDF from URL: {url}")
-        # Handle SSL issues with verify=False for problematic certificates
-        response = requests.get(url, timeout=30, verify=False)
-        response.raise_for_status()
-        
-        # Update progress
-        await processing_msg.edit_text(
-            "⏳ **Processing PDF URL...**\n\n📄 PDF downloaded, extracting text...",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
-        # Try to extract text - could be PDF or HTML
-        text = extract_content_text(response.content, response.headers.get('content-type', ''))
-        
-        # Update progress
-        await processing_msg.edit_text(
-            "⏳ **Processing PDF URL...**\n\n🔍 Analyzing transaction data...",
-            parse_mode=ParseMode.MARKDOWN
-        )
-        
-        # Extract transaction data using the appropriate extractor
-        result = extractor_manager.extract_transaction_data(text, url)
-        
-        # Format and send result
-        result_message = format_transaction_result(result)
-        
-        # Delete processing message and send result
-        await processing_msg.delete()
-        await update.message.reply_text(result_message, parse_mode=ParseMode.MARKDOWN)
-        
-    except Exception as e:
-        logger.error(f"URL processing failed: {e}")
-        error_msg = str(e)
-        # Escape markdown characters in error message
-        error_msg = error_msg.replace('_', '\\_').replace('*', '\\*').replace('[', '\\[').replace(']', '\\]').replace('(', '\\(').replace(')', '\\)')
-        try:
-            await processing_msg.edit_text(
-                f"❌ **Processing Failed**\n\n⚠️ Error: {error_msg}\n\nPlease check the URL and try again.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-        except Exception:
-            # Fallback without markdown if still failing
-            await processing_msg.edit_text(
-                f"❌ Processing Failed\n\nError: {str(e)}\n\nPlease check the URL and try again."
-            )
+    await queue_job(update, Job(
+        'url', update.effective_chat.id,
+        {'url': url, 'message_id': update.message.message_id},
+        priority=PRIORITY_URL
+    ))
 
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle PDF document uploads."""
@@ -346,41 +402,96 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
     
-    # Send processing message
-    processing_msg = await update.message.reply_text(
-        f"⏳ **Processing PDF File...**\n\n📁 File: {document.file_name}\n🔄 Downloading and extracting data...",
+    heavy = (document.file_size or 0) > HEAVY_DOCUMENT_BYTES
+    await queue_job(update, Job(
+        'document', update.effective_chat.id,
+        {
+            'file_id': document.file_id,
+            'file_unique_id': document.file_unique_id,
+            'file_name': document.file_name,
+            'message_id': update.message.message_id,
+        },
+        priority=PRIORITY_HEAVY if heavy else PRIORITY_DOCUMENT
+    ))
+
+def reply_to(bot, job: Job):
+    """Send function replying to the job's original message."""
+    async def send(text: str, **options):
+        return await bot.send_message(
+            job.chat_id, text, reply_to_message_id=job.payload['message_id'], **options
+        )
+    return send
+
+async def process_url_job(bot, job: Job) -> None:
+    """Verify a queued receipt URL and reply in its chat."""
+    url = job.payload['url']
+    
+    # The status message is only sent if verification turns out to be slow;
+    # the download starts right away
+    progress = ProgressReporter(
+        reply_to(bot, job), PROGRESS_SHOW_AFTER, PROGRESS_MIN_INTERVAL,
         parse_mode=ParseMode.MARKDOWN
     )
+    progress.start("⏳ **Processing PDF URL...**\n\n🔄 Downloading and extracting data...")
+    
+    async def report_progress(step: str) -> None:
+        await progress.update(f"⏳ **Processing PDF URL...**\n\n{step}")
     
     try:
-        # Download file
-        file = await context.bot.get_file(document.file_id)
-        file_data = await file.download_as_bytearray()
+        result = await in_flight.do(url_key(url), lambda: verify_url(url, report_progress))
         
-        # Update progress
-        await processing_msg.edit_text(
-            f"⏳ **Processing PDF File...**\n\n📁 File: {document.file_name}\n📄 Extracting text...",
-            parse_mode=ParseMode.MARKDOWN
-        )
+        # Remember the receipt and flag reused transaction IDs
+        sighting = ledger.record(result, job.chat_id) if is_final(result) else None
         
-        # Extract text from PDF
-        text = extract_pdf_text(bytes(file_data))
+        # Format and send result
+        result_message = format_transaction_result(result, sighting)
         
-        # Update progress
-        await processing_msg.edit_text(
-            f"⏳ **Processing PDF File...**\n\n📁 File: {document.file_name}\n🔍 Analyzing transaction data...",
-            parse_mode=ParseMode.MARKDOWN
+        # Edit the result into the status message, or send it if none was shown
+        await progress.finish(result_message)
+        
+    except Exception as e:
+        logger.error(f"URL processing failed: {e}")
+        error_msg = str(e)
+        # Escape markdown characters in error message
+        error_msg = error_msg.replace('_', '\\_').replace('*', '\\*').replace('[', '\\[').replace(']', '\\]').replace('(', '\\(').replace(')', '\\)')
+        try:
+            await progress.finish(f"❌ **Processing Failed**\n\n⚠️ Error: {error_msg}\n\nPlease check the URL and try again.")
+        except Exception:
+            # Fallback without markdown if still failing
+            await progress.finish(
+                f"❌ Processing Failed\n\nError: {str(e)}\n\nPlease check the URL and try again.",
+                parse_mode=None
+            )
+
+async def process_document_job(bot, job: Job) -> None:
+    """Verify a queued PDF upload and reply in its chat."""
+    document = job.payload
+    
+    # The status message is only sent if verification turns out to be slow;
+    # the download starts right away
+    progress = ProgressReporter(
+        reply_to(bot, job), PROGRESS_SHOW_AFTER, PROGRESS_MIN_INTERVAL,
+        parse_mode=ParseMode.MARKDOWN
+    )
+    progress.start(f"⏳ **Processing PDF File...**\n\n📁 File: {document['file_name']}\n🔄 Downloading and extracting data...")
+    
+    async def report_progress(step: str) -> None:
+        await progress.update(f"⏳ **Processing PDF File...**\n\n📁 File: {document['file_name']}\n{step}")
+    
+    try:
+        result = await in_flight.do(
+            file_key(document['file_unique_id']),
+            lambda: verify_document(bot, document, report_progress)
         )
         
-        # Extract transaction data using the appropriate extractor
-        result = extractor_manager.extract_transaction_data(text, "")
+        # Remember the receipt and flag reused transaction IDs
+        sighting = ledger.record(result, job.chat_id) if is_final(result) else None
         
         # Format and send result
-        result_message = format_transaction_result(result)
+        result_message = format_transaction_result(result, sighting)
         
-        # Delete processing message and send result
-        await processing_msg.delete()
-        await update.message.reply_text(result_message, parse_mode=ParseMode.MARKDOWN)
+        # Edit the result into the status message, or send it if none was shown
+        await progress.finish(result_message)
         
     except Exception as e:
         logger.error(f"Document processing failed: {e}")
@@ -388,16 +499,23 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         # Escape markdown characters in error message
         error_msg = error_msg.replace('_', '\\_').replace('*', '\\*').replace('[', '\\[').replace(']', '\\]').replace('(', '\\(').replace(')', '\\)')
         try:
-            await processing_msg.edit_text(
-                f"❌ **Processing Failed**\n\n⚠️ Error: {error_msg}\n\nPlease try again with a different PDF file.",
-                parse_mode=ParseMode.MARKDOWN
-            )
+            await progress.finish(f"❌ **Processing Failed**\n\n⚠️ Error: {error_msg}\n\nPlease try again with a different PDF file.")
         except Exception:
             # Fallback without markdown if still failing
-            await processing_msg.edit_text(
-                f"❌ Processing Failed\n\nError: {str(e)}\n\nPlease try again with a different PDF file."
+            await progress.finish(
+                f"❌ Processing Failed\n\nError: {str(e)}\n\nPlease try again with a different PDF file.",
+                parse_mode=None
             )
 
+JOB_PROCESSORS = {
+    'url': process_url_job,
+    'document': process_document_job,
+}
+
+async def run_job(bot, job: Job) -> None:
+    """Worker entry point: run one queued verification."""
+    await JOB_PROCESSORS[job.kind](bot, job)
+
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle photo uploads - OCR coming soon."""
     await update.message.reply_text(
@@ -426,6 +544,18 @@ Use /help for detailed instructions! 📖
     
     await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
 
+def pipeline_health() -> dict:
+    """Load figures reported by the webhook health endpoint."""
+    return {
+        'stages_pending': stage_executor.pending,
+        'stages_rejected': stage_executor.rejected,
+        'in_flight': in_flight.in_flight,
+        'jobs_queued': len(job_queue.backend),
+        'jobs_running': job_queue.running,
+        'admission_refused': admission.refused,
+        'cache_hit_rate': round(result_cache.stats()['hit_rate'], 3),
+    }
+
 async def main() -> None:
     """Start the bot."""
     if BOT_TOKEN == 'YOUR_BOT_TOKEN_HERE':
@@ -449,29 +579,47 @@ async def main() -> None:
     application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
     application.add_handler(MessageHandler(~filters.TEXT & ~filters.Document.PDF & ~filters.PHOTO, handle_other_messages))
     
-    # Initialize the bot
-    await application.initialize()
-    await application.start()
+    # Webhook mode when WEBHOOK_URL is set, long polling otherwise
+    webhook = WebhookConfig.from_env()
+    
+    # Benchmark the installed PDF engines now rather than on the first upload
+    logger.info(f"PDF text engine: {get_engines().primary}")
+    
+    # Workers reply through the bot; jobs left by a previous run start now
+    job_queue.start(lambda job: run_job(application.bot, job))
     
     # Start the bot
     print("🚀 NextVerify Telegram Bot is starting...")
     print("✅ Bot is running! Send /start to begin.")
     print("🔧 Note: Image OCR support coming soon!")
     
-    # Run the bot
-    await application.updater.start_polling()
-    
-    # Keep the bot running
     try:
-        import asyncio
-        await asyncio.Event().wait()
+        if webhook:
+            print(f"🌐 Receiving updates via webhook at {webhook.webhook_url}")
+            await serve_application(application, webhook, pipeline_health)
+        else:
+            # Initialize the bot
+            await application.initialize()
+            await application.start()
+            
+            # Run the bot
+            await application.updater.start_polling()
+            
+            # Keep the bot running
+            await asyncio.Event().wait()
     except KeyboardInterrupt:
         print("\n🛑 Bot stopped by user")
     finally:
-        await application.updater.stop()
-        await application.stop()
-        await application.shutdown()
+        if not webhook:
+            await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+        await job_queue.stop()
+        await fetcher.aclose()
+        stage_executor.shutdown(wait=False)
+        logger.info(f"Result cache stats: {result_cache.stats()}")
+        result_cache.close()
+        ledger.close()
 
 if __name__ == '__main__':
-    import asyncio
     asyncio.run(main())
@@ -2,8 +2,11 @@
 Awash Bank transaction extractor
 Handles receipts from awashpay.awashbank.com
 """
-from typing import Dict
+from typing import Optional
 from .base_extractor import BaseExtractor
+from .document import DocumentView
+from .transaction_result import TransactionResult
+from .pattern_matcher import PatternRegistry
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,98 +14,92 @@ logger = logging.getLogger(__name__)
 class AwashExtractor(BaseExtractor):
     """Extractor for Awash Bank transactions"""
     
-    def __init__(self):
+    hosts = ('awashpay.awashbank.com',)
+    keywords = {
+        'awash bank': 1.0,
+        'awash bank share company': 1.0,
+        # Awash receipt rows; neither is conclusive on its own
+        'transaction time': 0.5,
+        'beneficiary': 0.5,
+    }
+    # Awash URL format: ...-E43406CDD679-...
+    url_transaction_id = r'-([A-Z0-9]+)-'
+    
+    def __init__(self, registry: Optional[PatternRegistry] = None):
         patterns = {
             'transaction_id': [
                 r'Transaction ID\s*[:\|]*\s*([A-Z0-9]+)',
-                r'Transaction ID\s*\|\s*:\s*\|\s*([A-Z0-9]+)',
-                r'Transaction ID.*?([A-Z0-9]{8,})',
+                r'Transaction ID.{0,200}?([A-Z0-9]{8,})',
                 r'ID\s*[:\|]*\s*([A-Z0-9]+)',
                 r'([A-Z0-9]{8,})',  # Any 8+ alphanumeric (from URL)
             ],
             'amount': [
                 r'Amount\s*[:\|]*\s*([\d,]+(?:\.\d{2})?)\s*ETB',
-                r'Amount\s*\|\s*:\s*\|\s*([\d,]+(?:\.\d{2})?)\s*ETB',
-                r'([\d,]+(?:\.\d{2})?)\s*ETB',
-                r'Amount.*?([\d,]+)',  # More flexible amount matching
+                r'([\d,]{1,20}(?:\.\d{2})?)\s*ETB',
+                r'Amount.{0,200}?([\d,]+)',  # More flexible amount matching
             ],
             'date': [
                 r'Transaction Time\s*:\s*(\d{4}-\d{2}-\d{2}\s+\d{1,2}:\d{2}:\d{2}\s*(?:AM|PM)?)',
-                r'Transaction Time\s*\|\s*:\s*\|\s*(\d{4}-\d{2}-\d{2}\s+\d{1,2}:\d{2}:\d{2}\s*(?:AM|PM)?)',
                 r'(\d{4}-\d{2}-\d{2}\s+\d{1,2}:\d{2}:\d{2})',
                 r'(\d{1,2}/\d{1,2}/\d{4})',
             ],
             'payer_name': [
                 r'Sender Name\s*:\s*([A-Z\s]+)',
-                r'Sender Name\s*\|\s*:\s*\|\s*([A-Z\s]+)',
                 r'Customer Name\s*:\s*([A-Z\s]+)',
-                r'Customer Name\s*\|\s*:\s*\|\s*([A-Z\s]+)',
             ],
             'receiver': [
                 r'Beneficiary name\s*:\s*([A-Z\s]+)',
-                r'Beneficiary name\s*\|\s*:\s*\|\s*([A-Z\s]+)',
                 r'Beneficiary\s*:\s*([A-Z\s]+)',
             ],
             'sender_account': [
                 r'Sender Account\s*:\s*([0-9\*]+)',
-                r'Sender Account\s*\|\s*:\s*\|\s*([0-9\*]+)',
                 r'Account No\s*:\s*([0-9\*\/A-Z]+)',
-                r'Account No\s*\|\s*:\s*\|\s*([0-9\*\/A-Z]+)',
             ],
             'receiver_account': [
                 r'Beneficiary Account\s*:\s*([0-9]+)',
-                r'Beneficiary Account\s*\|\s*:\s*\|\s*([0-9]+)',
             ],
             'receiver_bank': [
                 r'Beneficiary Bank\s*:\s*([A-Z\s]+)',
-                r'Beneficiary Bank\s*\|\s*:\s*\|\s*([A-Z\s]+)',
             ],
             'transaction_type': [
                 r'Transaction Type\s*:\s*([A-Z\s]+)',
-                r'Transaction Type\s*\|\s*:\s*\|\s*([A-Z\s]+)',
             ],
             'charge': [
                 r'Charge\s*:\s*([\d,]+(?:\.\d{2})?)\s*ETB',
-                r'Charge\s*\|\s*:\s*\|\s*([\d,]+(?:\.\d{2})?)\s*ETB',
             ],
             'branch': [
                 r'Branch\s*:\s*([A-Z\s]+)',
-                r'Branch\s*\|\s*:\s*\|\s*([A-Z\s]+)',
             ]
         }
-        super().__init__("Awash Bank", patterns)
-    
-    def can_handle(self, url: str, text: str = "") -> bool:
-        """Check if this is an Awash Bank transaction"""
-        awash_indicators = [
-            'awashpay.awashbank.com' in url.lower(),
-            'awash bank' in text.lower(),
-            'awash bank share company' in text.lower(),
-            'transaction time' in text.lower() and 'beneficiary' in text.lower(),
-        ]
-        
-        return any(awash_indicators)
+        # Labelled rows ("Key | : | Value" or "Key : Value") and the format each value must have
+        labels = {
+            'transaction_id': {'Transaction ID': r'([A-Z0-9]+)'},
+            'amount': {'Amount': r'([\d,]+(?:\.\d{2})?)\s*ETB'},
+            'date': {'Transaction Time': r'(\d{4}-\d{2}-\d{2}\s+\d{1,2}:\d{2}:\d{2}\s*(?:AM|PM)?)'},
+            'payer_name': {'Sender Name': r'([A-Z\s]+)', 'Customer Name': r'([A-Z\s]+)'},
+            'receiver': {'Beneficiary name': r'([A-Z\s]+)', 'Beneficiary': r'([A-Z\s]+)'},
+            'sender_account': {'Sender Account': r'([0-9\*]+)', 'Account No': r'([0-9\*\/A-Z]+)'},
+            'receiver_account': {'Beneficiary Account': r'([0-9]+)'},
+            'receiver_bank': {'Beneficiary Bank': r'([A-Z\s]+)'},
+            'transaction_type': {'Transaction Type': r'([A-Z\s]+)'},
+            'charge': {'Charge': r'([\d,]+(?:\.\d{2})?)\s*ETB'},
+            'branch': {'Branch': r'([A-Z\s]+)'},
+        }
+        super().__init__("Awash Bank", patterns, registry, labels)
     
-    def extract(self, text: str, url: str = "") -> Dict:
+    def extract(self, doc: DocumentView) -> TransactionResult:
         """Extract Awash Bank transaction data"""
-        logger.info(f"[Awash Bank] Extracting transaction data from text length: {len(text)}")
-        
-        extracted_data = {}
+        logger.info(f"[Awash Bank] Extracting transaction data from text length: {len(doc)}")
         
         # Extract all fields using patterns
-        for field_name in self.patterns.keys():
-            value = self._extract_field(text, field_name)
-            if value:
-                extracted_data[field_name] = value
+        extracted_data = self._extract_fields(doc)
         
         # If no transaction ID found in text, try to extract from URL
-        if not extracted_data.get('transaction_id') and url:
-            import re
-            # Extract from Awash URL format: -E43406CDD679-
-            url_match = re.search(r'-([A-Z0-9]+)-', url)
-            if url_match:
-                extracted_data['transaction_id'] = url_match.group(1)
-                logger.info(f"[Awash Bank] Found transaction ID in URL: {extracted_data['transaction_id']}")
+        if not extracted_data.get('transaction_id'):
+            url_transaction_id = self.transaction_id_from_url(doc)
+            if url_transaction_id:
+                extracted_data['transaction_id'] = url_transaction_id
+                logger.info(f"[Awash Bank] Found transaction ID in URL: {url_transaction_id}")
         
         # Map to standard field names for compatibility
         result = {
@@ -121,8 +118,4 @@ class AwashExtractor(BaseExtractor):
             'status': 'Completed',
         }
         
-        # Clean up amount (remove commas)
-        if result.get('amount'):
-            result['amount'] = result['amount'].replace(',', '')
-        
-        return self._format_result(result, text)
+        return self._format_result(result, doc)
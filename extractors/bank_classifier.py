@@ -0,0 +1,118 @@
+"""
+Keyword classifier that ranks bank extractors for a document
+All banks' indicator keywords are matched in a single scan of the text
+"""
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class KeywordAutomaton:
+    """Multi-keyword matcher over lowercased text
+
+    Uses an Aho-Corasick automaton from pyahocorasick when it is installed.
+    Otherwise a single regex of all keywords is used; it finds every position
+    where some keyword starts, and keywords that are prefixes of the longest
+    match at that position are credited as well.
+
+    Keywords match anywhere, as substrings. Keywords in `whole_words` only
+    count when they are not part of a larger word, so "cbe" does not match
+    inside "subscribed".
+    """
+
+    def __init__(self, keywords: Sequence[str], whole_words: Iterable[str] = ()):
+        self.keywords = sorted({keyword.lower() for keyword in keywords}, key=len, reverse=True)
+        self.whole_words = {keyword.lower() for keyword in whole_words}
+        self._automaton = None
+        self._regex = None
+        # keyword -> shorter keywords that are prefixes of it
+        self._prefixes: Dict[str, List[str]] = {
+            keyword: [other for other in self.keywords if other != keyword and keyword.startswith(other)]
+            for keyword in self.keywords
+        }
+
+        if not self.keywords:
+            return
+        try:
+            import ahocorasick
+            automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                automaton.add_word(keyword, keyword)
+            automaton.make_automaton()
+            self._automaton = automaton
+        except ImportError:
+            alternatives = "|".join(re.escape(keyword) for keyword in self.keywords)
+            self._regex = re.compile(f"(?=({alternatives}))")
+
+    def _bounded(self, text: str, start: int, end: int) -> bool:
+        """True unless text[start:end] is a whole-word keyword glued to a neighbouring word"""
+        if text[start:end] not in self.whole_words:
+            return True
+        if start > 0 and text[start].isalnum() and text[start - 1].isalnum():
+            return False
+        if end < len(text) and text[end - 1].isalnum() and text[end].isalnum():
+            return False
+        return True
+
+    def find(self, text: str) -> Set[str]:
+        """Distinct keywords present in already lowercased text"""
+        found: Set[str] = set()
+
+        if self._automaton is not None:
+            for end_index, keyword in self._automaton.iter(text):
+                end = end_index + 1
+                if keyword not in found and self._bounded(text, end - len(keyword), end):
+                    found.add(keyword)
+            return found
+
+        if self._regex is not None:
+            for match in self._regex.finditer(text):
+                start = match.start()
+                longest = match.group(1)
+                for keyword in [longest] + self._prefixes[longest]:
+                    if keyword not in found and self._bounded(text, start, start + len(keyword)):
+                        found.add(keyword)
+        return found
+
+
+class BankClassifier:
+    """Rank extractors by how strongly a document matches their keywords
+
+    Each extractor declares `keywords` (keyword -> weight) and `min_score`.
+    An extractor's score is the sum of the weights of its distinct keywords
+    found in the text; extractors below their `min_score` are left out.
+    """
+
+    def __init__(self, extractors: Sequence):
+        self.extractors = list(extractors)
+        # keyword -> [(extractor position, weight)]
+        self._weights: Dict[str, List[Tuple[int, float]]] = {}
+        whole_words: Set[str] = set()
+        for position, extractor in enumerate(self.extractors):
+            for keyword, weight in getattr(extractor, 'keywords', {}).items():
+                self._weights.setdefault(keyword.lower(), []).append((position, weight))
+            whole_words.update(getattr(extractor, 'whole_words', ()))
+        self.automaton = KeywordAutomaton(list(self._weights), whole_words)
+
+    def scores(self, lower_text: str) -> List[float]:
+        """Score of every extractor for lowercased text, in extractor order"""
+        totals = [0.0] * len(self.extractors)
+        if not lower_text or not self._weights:
+            return totals
+        for keyword in self.automaton.find(lower_text):
+            for position, weight in self._weights[keyword]:
+                totals[position] += weight
+        return totals
+
+    def rank(self, lower_text: str) -> List[Tuple[object, float]]:
+        """(extractor, score) for extractors that reach their min_score, best first"""
+        ranked = [
+            (extractor, score)
+            for extractor, score in zip(self.extractors, self.scores(lower_text))
+            if score > 0 and score >= extractor.min_score
+        ]
+        # list.sort is stable, so equal scores keep extractor order
+        ranked.sort(key=lambda entry: entry[1], reverse=True)
+        return ranked
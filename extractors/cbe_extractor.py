@@ -2,8 +2,11 @@
 Commercial Bank of Ethiopia (CBE) transaction extractor
 Handles receipts from CBE systems
 """
-from typing import Dict
+from typing import Optional
 from .base_extractor import BaseExtractor
+from .document import DocumentView
+from .transaction_result import TransactionResult
+from .pattern_matcher import PatternRegistry
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,7 +14,20 @@ logger = logging.getLogger(__name__)
 class CBEExtractor(BaseExtractor):
     """Extractor for CBE transactions"""
     
-    def __init__(self):
+    hosts = ('apps.cbe.com.et',)
+    keywords = {
+        'commercial bank of ethiopia': 1.0,
+        'combanketh': 1.0,
+        # "CBE" alone also shows up as a beneficiary bank on other receipts
+        'cbe': 0.5,
+        'payment date & time': 0.5,
+        'reference no. (vat invoice no)': 0.5,
+    }
+    whole_words = ('cbe',)
+    # CBE URL format: ...?id=FT25...
+    url_transaction_id = r'id=([A-Z0-9]+)'
+    
+    def __init__(self, registry: Optional[PatternRegistry] = None):
         patterns = {
             'transaction_id': [
                 r'(?:Transaction|Txn|Ref|Reference)(?:\s+)?(?:ID|No|Number)[:\s]+([A-Z0-9]+)',
@@ -24,7 +40,7 @@ class CBEExtractor(BaseExtractor):
             'amount': [
                 r'(?:Amount|Total|Sum)[:\s]+([\d,]+\.?\d*)',
                 r'ETB[:\s]+([\d,]+\.?\d*)',
-                r'([\d,]+\.?\d*)\s*ETB',
+                r'([\d,]{1,20}(?:\.\d*)?)\s*ETB',
                 r'Transferred Amount\s+([\d,]+\.\d{2})\s+ETB',
             ],
             'date': [
@@ -47,38 +63,41 @@ class CBEExtractor(BaseExtractor):
                 r'Account\s+(\d+\*+\d+)',
             ]
         }
-        super().__init__("Commercial Bank of Ethiopia", patterns)
+        # Labelled rows ("Label Value" or "Label: Value") and the format each value must have
+        labels = {
+            'transaction_id': {
+                'Reference No. (VAT Invoice No)': r'([A-Z0-9]+)',
+                'Transaction ID': r'([A-Z0-9]+)',
+                'Reference No': r'([A-Z0-9]+)',
+            },
+            'amount': {'Transferred Amount': r'([\d,]+\.?\d*)', 'Amount': r'([\d,]+\.?\d*)'},
+            'date': {'Payment Date & Time': r'(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})', 'Date': r'(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})'},
+            'payer_name': {'Payer': r'([A-Z\s]+)', 'Account Holder': r'([A-Z\s]+)'},
+            'receiver': {'Receiver': r'([A-Z\s]+)', 'Beneficiary': r'([A-Z\s]+)'},
+            'account': {'Account': r'(\d+[\*\-]*\d*)'},
+        }
+        super().__init__("Commercial Bank of Ethiopia", patterns, registry, labels)
     
-    def can_handle(self, url: str, text: str = "") -> bool:
-        """Check if this is a CBE transaction"""
-        cbe_indicators = [
-            'apps.cbe.com.et' in url.lower(),
-            'commercial bank of ethiopia' in text.lower(),
-            'cbe' in text.lower(),
-            'FT' in url and len([c for c in url if c.isdigit()]) > 8,  # CBE format
-        ]
-        
-        return any(cbe_indicators)
+    def matches_url(self, doc: DocumentView) -> bool:
+        """Check if the URL is a CBE receipt link"""
+        if super().matches_url(doc):
+            return True
+        url = doc.url
+        return 'FT' in url and len([c for c in url if c.isdigit()]) > 8  # CBE format
     
-    def extract(self, text: str, url: str = "") -> Dict:
+    def extract(self, doc: DocumentView) -> TransactionResult:
         """Extract CBE transaction data"""
-        logger.info(f"[CBE] Extracting transaction data from text length: {len(text)}")
-        
-        extracted_data = {}
+        logger.info(f"[CBE] Extracting transaction data from text length: {len(doc)}")
         
         # Extract all fields using patterns
-        for field_name in self.patterns.keys():
-            value = self._extract_field(text, field_name)
-            if value:
-                extracted_data[field_name] = value
+        extracted_data = self._extract_fields(doc)
         
         # If no transaction ID found in text, try to extract from URL
-        if not extracted_data.get('transaction_id') and url:
-            import re
-            url_match = re.search(r'id=([A-Z0-9]+)', url)
-            if url_match:
-                extracted_data['transaction_id'] = url_match.group(1)
-                logger.info(f"[CBE] Found transaction ID in URL: {extracted_data['transaction_id']}")
+        if not extracted_data.get('transaction_id'):
+            url_transaction_id = self.transaction_id_from_url(doc)
+            if url_transaction_id:
+                extracted_data['transaction_id'] = url_transaction_id
+                logger.info(f"[CBE] Found transaction ID in URL: {url_transaction_id}")
         
         # Standard mapping
         result = {
@@ -92,8 +111,4 @@ class CBEExtractor(BaseExtractor):
             'status': 'Completed',
         }
         
-        # Clean up amount (remove commas)
-        if result.get('amount'):
-            result['amount'] = result['amount'].replace(',', '')
-        
-        return self._format_result(result, text)
+        return self._format_result(result, doc)
@@ -0,0 +1,88 @@
+"""
+Document view shared by every extractor that looks at a receipt
+Derived forms of the text are computed on first use and then reused
+"""
+from bisect import bisect_right
+from functools import cached_property
+from typing import List, Optional, Union
+from urllib.parse import SplitResult, urlsplit
+from .label_table import LabelTable
+
+
+class DocumentView:
+    """A receipt's text and source URL, with lazily cached derived forms"""
+
+    def __init__(self, text: str = "", url: str = ""):
+        self.text = text or ""
+        self.url = (url or "").strip()
+        # Set when an extractor's regex search budget ran out on this document
+        self.search_exhausted = False
+
+    @classmethod
+    def coerce(cls, text: Union[str, "DocumentView"], url: str = "") -> "DocumentView":
+        """Wrap raw text in a view, or return an existing view unchanged"""
+        if isinstance(text, DocumentView):
+            return text
+        return cls(text, url)
+
+    @cached_property
+    def lower(self) -> str:
+        """Lowercased text"""
+        return self.text.lower()
+
+    @cached_property
+    def collapsed(self) -> str:
+        """Text with every run of whitespace replaced by one space"""
+        return " ".join(self.text.split())
+
+    @cached_property
+    def collapsed_lower(self) -> str:
+        """Lowercased text with whitespace runs collapsed"""
+        return " ".join(self.lower.split())
+
+    @cached_property
+    def lines(self) -> List[str]:
+        return self.text.splitlines()
+
+    @cached_property
+    def line_offsets(self) -> List[int]:
+        """Offset of the first character of every line"""
+        offsets = [0]
+        position = self.text.find("\n")
+        while position != -1:
+            offsets.append(position + 1)
+            position = self.text.find("\n", position + 1)
+        return offsets
+
+    def line_number(self, offset: int) -> int:
+        """Zero-based line containing the given text offset"""
+        return bisect_right(self.line_offsets, offset) - 1
+
+    @cached_property
+    def label_table(self) -> LabelTable:
+        return LabelTable.parse(self.text)
+
+    @cached_property
+    def url_lower(self) -> str:
+        return self.url.lower()
+
+    @cached_property
+    def parsed_url(self) -> Optional[SplitResult]:
+        """urlsplit() of the URL, or None when there is no usable URL"""
+        if not self.url:
+            return None
+        try:
+            parts = urlsplit(self.url)
+            # Accessing the port validates it; a bad port raises ValueError
+            parts.port
+        except ValueError:
+            return None
+        return parts
+
+    @cached_property
+    def host(self) -> Optional[str]:
+        """Lowercased URL host without port"""
+        return self.parsed_url.hostname if self.parsed_url else None
+
+    def __len__(self) -> int:
+        return len(self.text)
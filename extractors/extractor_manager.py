@@ -1,63 +1,243 @@
 """
 Manager for handling multiple bank extractors
 """
-from typing import Dict, List, Optional
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 import logging
+import os
 from .awash_extractor import AwashExtractor
 from .cbe_extractor import CBEExtractor
 from .generic_extractor import GenericExtractor
+from .bank_classifier import BankClassifier
 from .base_extractor import BaseExtractor
+from .document import DocumentView
+from .pattern_matcher import PatternRegistry
+from .transaction_result import TransactionResult
 
 logger = logging.getLogger(__name__)
 
+# A batch item: receipt text, a (text, url) pair or a DocumentView
+BatchItem = Union[str, Tuple[str, str], DocumentView]
+
+# Manager owned by each extract_many worker process
+_worker_manager: Optional["ExtractorManager"] = None
+
+
+def _init_worker(manager_factory: Callable[[], "ExtractorManager"]):
+    """Build the worker's manager once, so patterns compile once per process"""
+    global _worker_manager
+    _worker_manager = manager_factory()
+
+
+def _extract_chunk(chunk: List[Tuple[str, str]], include_raw_text: bool) -> List[TransactionResult]:
+    return _worker_manager._extract_batch(chunk, include_raw_text)
+
+
+def _as_text_url(item: BatchItem) -> Tuple[str, str]:
+    """Reduce a batch item to a picklable (text, url) pair"""
+    if isinstance(item, DocumentView):
+        return item.text, item.url
+    if isinstance(item, str):
+        return item, ""
+    text, url = item
+    return text or "", url or ""
+
+
 class ExtractorManager:
     """Manages multiple bank extractors and selects the best one"""
     
-    def __init__(self):
+    def __init__(self, registry: Optional[PatternRegistry] = None):
         self.extractors: List[BaseExtractor] = [
-            AwashExtractor(),
-            CBEExtractor(),
-            GenericExtractor(),  # Keep as fallback
+            AwashExtractor(registry),
+            CBEExtractor(registry),
+            GenericExtractor(registry),  # Keep as fallback
         ]
+        # host -> [(path prefix, extractor)], longest prefix first
+        self._host_index: Dict[str, List[Tuple[str, BaseExtractor]]] = {}
+        for extractor in self.extractors:
+            self._register_hosts(extractor)
+        self.classifier = BankClassifier(self.extractors)
         logger.info(f"Initialized ExtractorManager with {len(self.extractors)} extractors")
     
-    def extract_transaction_data(self, text: str, url: str = "") -> Dict:
-        """Extract transaction data using the best matching extractor"""
-        logger.info(f"Extracting transaction data from URL: {url[:50]}...")
+    def extract_transaction_data(self, text: Union[str, DocumentView], url: str = "",
+                                 include_raw_text: bool = False) -> TransactionResult:
+        """Extract transaction data using the best matching extractor
+
+        The document text is only kept on the result when include_raw_text is set.
+        """
+        # One view per receipt; every extractor shares its cached derived forms
+        doc = DocumentView.coerce(text, url)
+        logger.info(f"Extracting transaction data from URL: {doc.url[:50]}...")
         
         # Find the best extractor
-        best_extractor = self._find_best_extractor(url, text)
+        best_extractor = self._find_best_extractor(doc)
         
         if best_extractor:
             logger.info(f"Using {best_extractor.bank_name} extractor")
-            result = best_extractor.extract(text, url)
+            result = best_extractor.extract(doc)
             
             # Add extractor info to result
-            result['extractor_used'] = best_extractor.bank_name
-            
-            return result
+            result.extractor_used = best_extractor.bank_name
+        else:
+            # Fallback if no extractor found
+            logger.warning("No suitable extractor found, using generic patterns")
+            result = TransactionResult.failure('No suitable extractor found for this transaction format')
         
-        # Fallback if no extractor found
-        logger.warning("No suitable extractor found, using generic patterns")
-        return {
-            'is_valid': False,
-            'error': 'No suitable extractor found for this transaction format',
-            'extractor_used': 'None',
-            'raw_text': text
-        }
+        if include_raw_text:
+            result.raw_text = doc.text
+        return result
     
-    def _find_best_extractor(self, url: str, text: str) -> Optional[BaseExtractor]:
-        """Find the best extractor for the given URL and text"""
+    def extract_many(self, items: Iterable[BatchItem], workers: Optional[int] = None,
+                     chunksize: int = 64, ordered: bool = True, include_raw_text: bool = False,
+                     manager_factory: Optional[Callable[[], "ExtractorManager"]] = None,
+                     ) -> Iterator[Union[TransactionResult, Tuple[int, TransactionResult]]]:
+        """Extract a stream of documents, yielding results as they are ready
+
+        Items are receipt texts, (text, url) pairs or DocumentViews. Work is
+        sent to a process pool in chunks of `chunksize` documents, with at
+        most two chunks per worker in flight, so the input is consumed lazily
+        and memory stays bounded for arbitrarily long streams.
+
+        With `ordered=True` results come back in input order. With
+        `ordered=False` they come back as completed, as (index, result) pairs.
+        A document whose extraction raises becomes a failure result instead
+        of ending the batch.
+
+        `workers` defaults to the CPU count; 1 or less extracts in this
+        process. Worker processes build their own manager from
+        `manager_factory` (a picklable callable, ExtractorManager by default);
+        pass one when extractors were added with add_extractor.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        chunksize = max(1, chunksize)
+        pairs = (_as_text_url(item) for item in items)
+
+        if workers <= 1:
+            for index, (text, url) in enumerate(pairs):
+                result = self._extract_batch([(text, url)], include_raw_text)[0]
+                yield result if ordered else (index, result)
+            return
+
+        chunks = iter(lambda: list(islice(pairs, chunksize)), [])
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(manager_factory or ExtractorManager,)) as pool:
+            pending = deque()  # (start index, future) in submission order
+            next_index = 0
+
+            def submit(count: int):
+                nonlocal next_index
+                for chunk in islice(chunks, count):
+                    pending.append((next_index, pool.submit(_extract_chunk, chunk, include_raw_text)))
+                    next_index += len(chunk)
+
+            submit(workers * 2)
+            try:
+                while pending:
+                    if ordered:
+                        start, future = pending.popleft()
+                        yield from future.result()
+                        submit(1)
+                        continue
+                    done, _ = wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+                    for start, future in [entry for entry in pending if entry[1] in done]:
+                        pending.remove((start, future))
+                        for offset, result in enumerate(future.result()):
+                            yield start + offset, result
+                    submit(len(done))
+            finally:
+                # The consumer stopped early: drop chunks that have not started
+                for _, future in pending:
+                    future.cancel()
+
+    def _extract_batch(self, pairs: List[Tuple[str, str]], include_raw_text: bool) -> List[TransactionResult]:
+        """Extract each (text, url) pair, turning exceptions into failure results"""
+        results = []
+        for text, url in pairs:
+            try:
+                results.append(self.extract_transaction_data(text, url, include_raw_text))
+            except Exception as e:
+                logger.error(f"Extraction failed for {url[:50]!r}: {e}")
+                results.append(TransactionResult.failure(f'Extraction failed: {e}'))
+        return results
+
+    def transaction_id_from_url(self, url: str) -> Optional[Tuple[str, str]]:
+        """(bank name, transaction ID) when the URL alone identifies the receipt
+
+        Only the URL is looked at, so this can run before downloading. The
+        URL must be on a known bank host: the ID of a look-alike URL on any
+        other host proves nothing about the receipt.
+        """
+        doc = DocumentView("", url)
+        extractor = self._lookup_host(doc)
+        if extractor is None:
+            return None
+        transaction_id = extractor.transaction_id_from_url(doc)
+        return (extractor.bank_name, transaction_id) if transaction_id else None
+
+    def bank_for_url(self, url: str) -> Optional[str]:
+        """Bank whose known receipt host serves `url`, or None"""
+        extractor = self._lookup_host(DocumentView("", url))
+        return extractor.bank_name if extractor is not None else None
+
+    def _register_hosts(self, extractor: BaseExtractor):
+        """Add an extractor's dispatch keys to the host index"""
+        for key in extractor.hosts:
+            host, _, path = key.lower().partition('/')
+            entries = self._host_index.setdefault(host, [])
+            entries.append(('/' + path if path else '', extractor))
+            entries.sort(key=lambda entry: len(entry[0]), reverse=True)
+    
+    def _lookup_host(self, doc: DocumentView) -> Optional[BaseExtractor]:
+        """Resolve an extractor from the URL host and path signature"""
+        host = doc.host
+        if not host:
+            return None
+        
+        path = doc.parsed_url.path or '/'
+        labels = host.split('.')
+        # Exact host first, then parent domains (receipts.bank.com -> bank.com)
+        for i in range(len(labels) - 1):
+            for prefix, extractor in self._host_index.get('.'.join(labels[i:]), ()):
+                if path.startswith(prefix):
+                    return extractor
+        return None
+    
+    def _find_best_extractor(self, doc: DocumentView) -> Optional[BaseExtractor]:
+        """Find the best extractor for the given document"""
         
-        # First, try specific bank extractors (not generic)
-        for extractor in self.extractors[:-1]:  # Exclude generic
-            if extractor.can_handle(url, text):
+        # Known receipt hosts resolve without looking at the text
+        extractor = self._lookup_host(doc)
+        if extractor:
+            logger.info(f"Found extractor by host: {extractor.bank_name}")
+            return extractor
+        
+        specific_extractors = self.extractors[:-1]  # Exclude generic
+        generic_extractor = self.extractors[-1]
+        
+        # URL formats that identify a bank without a known host
+        for extractor in specific_extractors:
+            if extractor.matches_url(doc):
+                logger.info(f"Found extractor by URL format: {extractor.bank_name}")
+                return extractor
+        
+        # Extractors that bring their own text detection
+        for extractor in specific_extractors:
+            if type(extractor).can_handle is not BaseExtractor.can_handle and extractor.can_handle(doc):
                 logger.info(f"Found specific extractor: {extractor.bank_name}")
                 return extractor
         
+        # Keyword classification: one scan of the text scores every bank
+        ranked = self.classifier.rank(doc.collapsed_lower)
+        for extractor, score in ranked:
+            if extractor is not generic_extractor:
+                logger.info(f"Found specific extractor: {extractor.bank_name} (score {score:.1f})")
+                return extractor
+        
         # If no specific extractor found, try generic as fallback
-        generic_extractor = self.extractors[-1]
-        if generic_extractor.can_handle(url, text):
+        if any(extractor is generic_extractor for extractor, _ in ranked):
             logger.info("Using generic extractor as fallback")
             return generic_extractor
         
@@ -67,6 +247,8 @@ class ExtractorManager:
         """Add a new extractor to the manager"""
         # Insert before generic extractor (keep generic as last)
         self.extractors.insert(-1, extractor)
+        self._register_hosts(extractor)
+        self.classifier = BankClassifier(self.extractors)
         logger.info(f"Added new extractor: {extractor.bank_name}")
     
     def list_supported_banks(self) -> List[str]:
@@ -0,0 +1,105 @@
+"""
+Single-pass scanner that fills every extractor field in one walk of the text
+"""
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+import re
+import threading
+
+# Combined regexes kept per scanner, keyed by the set of patterns still needed
+MAX_CACHED_COMBINATIONS = 256
+
+
+class FieldScanner:
+    """Scan a document once for all field patterns of an extractor
+
+    Gives the same answer as trying each field's patterns in priority order
+    with re.search: for every field the highest priority pattern that matches
+    anywhere wins, and its leftmost match supplies the value.
+
+    The text is walked left to right with one combined regex. Whenever some
+    patterns match, the combined regex is narrowed to the patterns that could
+    still improve a field, so there are at most as many hits as patterns.
+    """
+
+    def __init__(self, compiled: Dict[str, Tuple[Pattern, ...]]):
+        self.fields = list(compiled.keys())
+        # (field, priority, pattern) in declaration order
+        self._slots: List[Tuple[str, int, Pattern]] = [
+            (field_name, priority, pattern)
+            for field_name, patterns in compiled.items()
+            for priority, pattern in enumerate(patterns)
+        ]
+        self._combined: Dict[Tuple[int, ...], Tuple[Pattern, Pattern, List[Tuple[int, int]]]] = {}
+        self._lock = threading.Lock()
+
+    def _combine(self, active: Tuple[int, ...]) -> Tuple[Pattern, Pattern, List[Tuple[int, int]]]:
+        """Build (finder, capture, [(slot, group)]) for the active slots"""
+        combined = self._combined.get(active)
+        if combined is not None:
+            return combined
+
+        alternatives = []
+        lookaheads = []
+        groups = []
+        group = 0
+        flags = 0
+        for slot in active:
+            pattern = self._slots[slot][2]
+            flags |= pattern.flags
+            alternatives.append(f"(?:{pattern.pattern})")
+            # Each pattern gets its own wrapping group so a successful
+            # lookahead is visible even when the pattern's capture is empty
+            lookaheads.append(f"(?:(?=({pattern.pattern}))|)")
+            groups.append((slot, group + 1))
+            group += 1 + pattern.groups
+
+        # Finds the next position where any active pattern can start
+        finder = re.compile("|".join(alternatives), flags)
+        # Records every active pattern that matches at that position
+        capture = re.compile("".join(lookaheads), flags)
+        combined = (finder, capture, groups)
+
+        with self._lock:
+            if len(self._combined) >= MAX_CACHED_COMBINATIONS:
+                self._combined.clear()
+            self._combined[active] = combined
+        return combined
+
+    def scan(self, text: str, fields: Optional[Iterable[str]] = None, budget=None) -> Dict[str, str]:
+        """Return field -> value for every field (of `fields`) that has a match
+
+        Each step of the walk counts as one search against `budget` (a
+        SearchBudget); the walk stops early once it is spent.
+        """
+        wanted = set(self.fields if fields is None else fields)
+        best: Dict[str, int] = {}
+        values: Dict[str, str] = {}
+        active = tuple(slot for slot, (field_name, _, _) in enumerate(self._slots) if field_name in wanted)
+        pos = 0
+
+        while active:
+            if budget is not None and not budget.allow():
+                break
+            finder, capture, groups = self._combine(active)
+            found = finder.search(text, pos)
+            if not found:
+                break
+            pos = found.start()
+            captures = capture.match(text, pos)
+
+            for slot, group in groups:
+                if captures.group(group) is None:
+                    continue
+                field_name, priority, _ = self._slots[slot]
+                if priority < best.get(field_name, priority + 1):
+                    best[field_name] = priority
+                    values[field_name] = captures.group(group + 1).strip()
+
+            # Only patterns that outrank a field's current winner still matter
+            active = tuple(
+                slot for slot in active
+                if self._slots[slot][1] < best.get(self._slots[slot][0], len(self._slots))
+            )
+            pos += 1
+
+        return values
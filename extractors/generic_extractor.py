@@ -2,8 +2,11 @@
 Generic transaction extractor
 Fallback for unknown bank formats
 """
-from typing import Dict
+from typing import Optional
 from .base_extractor import BaseExtractor
+from .document import DocumentView
+from .transaction_result import TransactionResult
+from .pattern_matcher import PatternRegistry
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,7 +14,17 @@ logger = logging.getLogger(__name__)
 class GenericExtractor(BaseExtractor):
     """Generic extractor for unknown bank formats"""
     
-    def __init__(self):
+    # Only used as fallback when at least 2 transaction indicators are found
+    keywords = {
+        'transaction': 1.0,
+        'amount': 1.0,
+        'etb': 1.0,
+        'bank': 1.0,
+        'transfer': 1.0,
+    }
+    min_score = 2.0
+    
+    def __init__(self, registry: Optional[PatternRegistry] = None):
         patterns = {
             'transaction_id': [
                 r'(?:Transaction|Txn|Ref|Reference|ID)(?:\s+)?(?:ID|No|Number|:)[:\s]*([A-Z0-9]{6,})',
@@ -20,11 +33,11 @@ class GenericExtractor(BaseExtractor):
                 r'REF[:\s]*([A-Z0-9]+)',
             ],
             'amount': [
-                r'([\d,]+(?:\.\d{2})?)\s*ETB',
+                r'([\d,]{1,20}(?:\.\d{2})?)\s*ETB',
                 r'ETB[:\s]*([\d,]+(?:\.\d{2})?)',
                 r'Amount[:\s]*([\d,]+(?:\.\d{2})?)',
                 r'Total[:\s]*([\d,]+(?:\.\d{2})?)',
-                r'([\d,]+\.\d{2})',  # Any decimal amount
+                r'([\d,]{1,20}\.\d{2})',  # Any decimal amount
             ],
             'date': [
                 r'(\d{4}-\d{2}-\d{2}\s+\d{1,2}:\d{2}:\d{2})',
@@ -44,32 +57,26 @@ class GenericExtractor(BaseExtractor):
                 r'Account\s+(?:No|Number)[:\s]*(\d+[\*\-]*\d*)',
             ]
         }
-        super().__init__("Generic Bank", patterns)
-    
-    def can_handle(self, url: str, text: str = "") -> bool:
-        """Generic extractor can handle any transaction as fallback"""
-        # Only use as fallback if we find some transaction indicators
-        transaction_indicators = [
-            'transaction' in text.lower(),
-            'amount' in text.lower(),
-            'etb' in text.lower(),
-            'bank' in text.lower(),
-            'transfer' in text.lower(),
-        ]
-        
-        return sum(transaction_indicators) >= 2  # At least 2 indicators
+        # Labelled rows ("Label: Value" or "Label | : | Value") and the format each value must have
+        labels = {
+            'transaction_id': {
+                'Transaction ID': r'([A-Z0-9]{6,})',
+                'Reference No': r'([A-Z0-9]{6,})',
+                'Reference': r'([A-Z0-9]{6,})',
+            },
+            'amount': {'Amount': r'([\d,]+(?:\.\d{2})?)', 'Total': r'([\d,]+(?:\.\d{2})?)'},
+            'payer_name': {'Sender Name': r'([A-Z][A-Z\s]{2,})', 'Payer': r'([A-Z][A-Z\s]{2,})'},
+            'receiver': {'Beneficiary name': r'([A-Z][A-Z\s]{2,})', 'Receiver': r'([A-Z][A-Z\s]{2,})'},
+            'account': {'Account No': r'(\d+[\*\-]*\d*)', 'Account': r'(\d+[\*\-]*\d*)'},
+        }
+        super().__init__("Generic Bank", patterns, registry, labels)
     
-    def extract(self, text: str, url: str = "") -> Dict:
+    def extract(self, doc: DocumentView) -> TransactionResult:
         """Extract generic transaction data"""
-        logger.info(f"[Generic] Extracting transaction data from text length: {len(text)}")
-        
-        extracted_data = {}
+        logger.info(f"[Generic] Extracting transaction data from text length: {len(doc)}")
         
         # Extract all fields using patterns
-        for field_name in self.patterns.keys():
-            value = self._extract_field(text, field_name)
-            if value:
-                extracted_data[field_name] = value
+        extracted_data = self._extract_fields(doc)
         
         # Standard mapping
         result = {
@@ -83,8 +90,4 @@ class GenericExtractor(BaseExtractor):
             'status': 'Completed',
         }
         
-        # Clean up amount (remove commas)
-        if result.get('amount'):
-            result['amount'] = result['amount'].replace(',', '')
-        
-        return self._format_result(result, text)
+        return self._format_result(result, doc)
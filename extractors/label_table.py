@@ -0,0 +1,98 @@
+"""
+Label/value table parser for receipt text
+Turns the row layouts PyPDF2 and the bank web pages produce into a lookup table
+"""
+from typing import Dict, Optional
+import re
+
+# Longest label, in words, recognised in single-space "Label Value" rows
+MAX_LABEL_WORDS = 6
+
+_LABEL_RE = re.compile(r"[A-Za-z][A-Za-z0-9 .&/()'#-]{0,48}")
+_COLUMN_SPLIT_RE = re.compile(r"\s{2,}|\t")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_label(label: str) -> str:
+    """Lowercase a label and collapse its whitespace"""
+    return _WHITESPACE_RE.sub(" ", label).strip(" :").lower()
+
+
+class LabelTable:
+    """Label -> value pairs found in a document
+
+    Rows are read in three layouts, first occurrence of a label wins:
+      Key | : | Value |      pipe delimited (Awash receipt pages)
+      Key : Value            colon separated
+      Key    Value           columns separated by runs of whitespace
+    Lines that fit none of these are also indexed by their first few words,
+    so "Payer ABEBE KEBEDE" answers a lookup for "payer". Those guesses never
+    shadow a label found in one of the layouts above.
+    """
+
+    def __init__(self, rows: Dict[str, str], guesses: Dict[str, str]):
+        self.rows = rows
+        self.guesses = guesses
+
+    @classmethod
+    def parse(cls, text: str) -> "LabelTable":
+        """Parse every line of the text once"""
+        rows: Dict[str, str] = {}
+        guesses: Dict[str, str] = {}
+
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if "|" in line:
+                cls._parse_pipe_row(line, rows)
+                continue
+            if ":" in line:
+                label, value = line.split(":", 1)
+                if cls._parse_pair(label, value, rows):
+                    continue
+            if not cls._parse_columns(line, rows):
+                cls._index_prefixes(line, guesses)
+
+        return cls(rows, guesses)
+
+    @staticmethod
+    def _parse_pair(label: str, value: str, rows: Dict[str, str]) -> bool:
+        label = label.strip()
+        value = value.strip()
+        if not value or not _LABEL_RE.fullmatch(label):
+            return False
+        rows.setdefault(normalize_label(label), value)
+        return True
+
+    @classmethod
+    def _parse_pipe_row(cls, line: str, rows: Dict[str, str]) -> None:
+        cells = [cell.strip() for cell in line.split("|")]
+        for i in range(1, len(cells) - 1):
+            if cells[i] == ":":
+                cls._parse_pair(cells[i - 1], cells[i + 1], rows)
+
+    @classmethod
+    def _parse_columns(cls, line: str, rows: Dict[str, str]) -> bool:
+        columns = _COLUMN_SPLIT_RE.split(line, 1)
+        return len(columns) == 2 and cls._parse_pair(columns[0], columns[1], rows)
+
+    @staticmethod
+    def _index_prefixes(line: str, guesses: Dict[str, str]) -> None:
+        words = line.split()
+        for count in range(1, min(MAX_LABEL_WORDS, len(words) - 1) + 1):
+            label = " ".join(words[:count]).lower()
+            guesses.setdefault(label, " ".join(words[count:]))
+
+    def get(self, label: str) -> Optional[str]:
+        """Value for a normalized label, or None"""
+        value = self.rows.get(label)
+        if value is None:
+            value = self.guesses.get(label)
+        return value
+
+    def __contains__(self, label: str) -> bool:
+        return label in self.rows or label in self.guesses
+
+    def __len__(self) -> int:
+        return len(self.rows)
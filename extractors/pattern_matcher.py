@@ -0,0 +1,187 @@
+"""
+Precompiled regex patterns for transaction extractors
+Patterns are compiled once and shared between extractor instances
+"""
+from typing import Dict, List, Optional, Pattern, Tuple
+import logging
+import os
+import re
+import threading
+import time
+from .field_scanner import FieldScanner
+
+logger = logging.getLogger(__name__)
+
+# Flags used by every extractor pattern
+DEFAULT_FLAGS = re.IGNORECASE | re.MULTILINE
+
+
+class StdlibBackend:
+    """Python's re module (backtracking, worst case is not linear)"""
+
+    name = 're'
+    linear_time = False
+
+    def compile(self, pattern: str, flags: int):
+        return re.compile(pattern, flags)
+
+
+class RE2Backend:
+    """Google RE2 through the `re2` module (google-re2 or pyre2)
+
+    Matching time is linear in the length of the text. Patterns RE2 cannot
+    express (lookarounds, backreferences) fall back to the re module.
+    """
+
+    name = 're2'
+    linear_time = True
+
+    def __init__(self):
+        import re2
+        self._re2 = re2
+        self._fallback = StdlibBackend()
+
+    def compile(self, pattern: str, flags: int):
+        # Pass flags inline; both re2 wrappers understand (?ims)
+        inline = ''.join(letter for flag, letter in (
+            (re.IGNORECASE, 'i'), (re.MULTILINE, 'm'), (re.DOTALL, 's'),
+        ) if flags & flag)
+        try:
+            return self._re2.compile(f"(?{inline}){pattern}" if inline else pattern)
+        except Exception as e:
+            logger.warning(f"RE2 cannot compile {pattern!r} ({e}), using re")
+            return self._fallback.compile(pattern, flags)
+
+
+def default_backend():
+    """RE2 when it is installed, unless EXTRACTOR_REGEX_BACKEND=re"""
+    choice = os.getenv('EXTRACTOR_REGEX_BACKEND', 'auto').lower()
+    if choice in ('auto', 're2'):
+        try:
+            return RE2Backend()
+        except ImportError:
+            if choice == 're2':
+                logger.warning("EXTRACTOR_REGEX_BACKEND=re2 but re2 is not installed, using re")
+    return StdlibBackend()
+
+
+class SearchBudget:
+    """Limits on the regex work spent on one document
+
+    The budget is checked before each pattern search, so a document stops
+    costing more once the time or search count is used up. A single search
+    cannot be interrupted; the text window bounds how long one can take, and
+    with RE2 that bound is linear in the window size.
+
+    Time is the CPU time of the calling thread, so a document does not lose
+    budget while its thread waits for the GIL behind other work.
+    """
+
+    def __init__(self, max_seconds: Optional[float] = None, max_searches: Optional[int] = None):
+        self.max_seconds = max_seconds
+        self.max_searches = max_searches
+        self.started = time.thread_time()
+        self.searches = 0
+        self.exhausted = False
+
+    @property
+    def elapsed(self) -> float:
+        return time.thread_time() - self.started
+
+    def allow(self) -> bool:
+        """Account for one more search, or return False if the budget is spent"""
+        if self.exhausted:
+            return False
+        if ((self.max_searches is not None and self.searches >= self.max_searches) or
+                (self.max_seconds is not None and self.elapsed >= self.max_seconds)):
+            self.exhausted = True
+            return False
+        self.searches += 1
+        return True
+
+
+class PatternMatcher:
+    """Compiled field patterns for a single extractor, in priority order"""
+
+    def __init__(self, compiled: Dict[str, Tuple[object, ...]], sources: Dict[str, List[str]],
+                 flags: int = DEFAULT_FLAGS, linear_time: bool = False):
+        self.compiled = compiled
+        self.sources = sources
+        self.flags = flags
+        self.linear_time = linear_time
+        self._scanner: Optional[FieldScanner] = None
+
+    @property
+    def scanner(self) -> FieldScanner:
+        """Single-pass scanner; it needs lookaheads, so it always uses the re module"""
+        if self._scanner is None:
+            self._scanner = FieldScanner({
+                field_name: tuple(re.compile(pattern, self.flags) for pattern in patterns)
+                for field_name, patterns in self.sources.items()
+            })
+        return self._scanner
+
+    def fields(self) -> List[str]:
+        """Field names in declaration order"""
+        return list(self.compiled.keys())
+
+    def search(self, text: str, field_name: str, budget: Optional[SearchBudget] = None) -> Optional[str]:
+        """Return the first capture of the highest priority matching pattern"""
+        for pattern in self.compiled.get(field_name, ()):
+            if budget is not None and not budget.allow():
+                return None
+            match = pattern.search(text)
+            if match:
+                return match.group(1).strip()
+        return None
+
+    def search_all(self, text: str, fields: Optional[List[str]] = None,
+                   budget: Optional[SearchBudget] = None) -> Dict[str, str]:
+        """Field -> value for every field, searching one field at a time"""
+        values = {}
+        for field_name in (self.compiled if fields is None else fields):
+            value = self.search(text, field_name, budget)
+            if value is not None:
+                values[field_name] = value
+        return values
+
+    def scan(self, text: str, fields: Optional[List[str]] = None,
+             budget: Optional[SearchBudget] = None) -> Dict[str, str]:
+        """Same result as search_all, from a single walk over the text"""
+        return self.scanner.scan(text, fields, budget)
+
+
+class PatternRegistry:
+    """Cache of compiled patterns that can be shared across extractors"""
+
+    def __init__(self, flags: int = DEFAULT_FLAGS, backend=None):
+        self.flags = flags
+        self.backend = backend or default_backend()
+        self._compiled: Dict[str, Pattern] = {}
+        self._lock = threading.Lock()
+
+    def compile(self, pattern: str):
+        """Compile a pattern, reusing an earlier compilation if there is one"""
+        compiled = self._compiled.get(pattern)
+        if compiled is None:
+            with self._lock:
+                compiled = self._compiled.get(pattern)
+                if compiled is None:
+                    compiled = self.backend.compile(pattern, self.flags)
+                    self._compiled[pattern] = compiled
+        return compiled
+
+    def matcher_for(self, patterns: Dict[str, List[str]]) -> PatternMatcher:
+        """Build a matcher for an extractor's field -> patterns mapping"""
+        compiled = {
+            field_name: tuple(self.compile(pattern) for pattern in field_patterns)
+            for field_name, field_patterns in patterns.items()
+        }
+        return PatternMatcher(compiled, patterns, self.flags, self.backend.linear_time)
+
+    def __len__(self) -> int:
+        return len(self._compiled)
+
+
+# Registry used by extractors unless one is passed explicitly
+default_registry = PatternRegistry()
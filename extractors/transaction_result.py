@@ -0,0 +1,152 @@
+"""
+Typed transaction result returned by the extractors
+"""
+from collections.abc import Mapping
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterator, Optional
+
+# Receipt date formats, most specific first. Slash dates are read month-first
+# as the CBE web receipts print them; day-first is tried when that fails.
+DATE_FORMATS = (
+    '%Y-%m-%d %I:%M:%S %p',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d',
+    '%m/%d/%Y',
+    '%d/%m/%Y',
+    '%m-%d-%Y',
+    '%d-%m-%Y',
+    '%m/%d/%y',
+    '%d/%m/%y',
+)
+
+
+def parse_amount(value) -> Optional[Decimal]:
+    """Parse an amount such as "1,000.50" into a Decimal"""
+    if value is None or isinstance(value, Decimal):
+        return value
+    try:
+        return Decimal(str(value).replace(',', '').strip())
+    except InvalidOperation:
+        return None
+
+
+def parse_date(value) -> Optional[datetime]:
+    """Parse a receipt date string, or return None if no format fits"""
+    if value is None or isinstance(value, datetime):
+        return value
+    text = ' '.join(str(value).split()).upper()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    return None
+
+
+class TransactionResult(Mapping):
+    """Compact extraction result
+
+    Attributes are typed: `amount` and `charge` are Decimals and `date` is a
+    datetime (the original text is kept in `date_text`). The raw document
+    text is only attached when explicitly requested. `incomplete` is set
+    when the search budget ran out before every field was tried, so another
+    run may find more; such results are not cached or recorded.
+
+    The mapping interface is the dict the extractors used to return, with
+    amounts and dates as display strings, so code written against that dict
+    (result['is_valid'], result.get('amount')) keeps working.
+    """
+
+    __slots__ = (
+        'transaction_id', 'amount', 'date', 'date_text', 'payer_name', 'receiver',
+        'account', 'receiver_account', 'receiver_bank', 'transaction_type',
+        'charge', 'branch', 'payment_method', 'status', 'is_valid', 'bank_name',
+        'extractor_used', 'error', 'raw_text', 'incomplete',
+    )
+
+    # Keys of the mapping view, in the order the result dict used to have
+    FIELDS = (
+        'transaction_id', 'amount', 'date', 'payer_name', 'receiver', 'account',
+        'receiver_account', 'receiver_bank', 'transaction_type', 'charge', 'branch',
+        'payment_method', 'status', 'is_valid', 'bank_name', 'extractor_used',
+    )
+    # Only present in the mapping view when set
+    OPTIONAL_FIELDS = ('error', 'raw_text', 'incomplete')
+
+    def __init__(self, transaction_id: Optional[str] = None, amount=None, date=None,
+                 payer_name: Optional[str] = None, receiver: Optional[str] = None,
+                 account: Optional[str] = None, receiver_account: Optional[str] = None,
+                 receiver_bank: Optional[str] = None, transaction_type: Optional[str] = None,
+                 charge=None, branch: Optional[str] = None, payment_method: Optional[str] = None,
+                 status: Optional[str] = None, is_valid: Optional[bool] = None,
+                 bank_name: Optional[str] = None, extractor_used: Optional[str] = None,
+                 error: Optional[str] = None, raw_text: Optional[str] = None,
+                 date_text: Optional[str] = None, incomplete: Optional[bool] = None):
+        self.transaction_id = transaction_id
+        self.amount = parse_amount(amount)
+        self.date = parse_date(date)
+        if date_text is None and date is not None and not isinstance(date, datetime):
+            date_text = str(date)
+        self.date_text = date_text
+        self.payer_name = payer_name
+        self.receiver = receiver
+        self.account = account
+        self.receiver_account = receiver_account
+        self.receiver_bank = receiver_bank
+        self.transaction_type = transaction_type
+        self.charge = parse_amount(charge)
+        self.branch = branch
+        self.payment_method = payment_method
+        self.status = status
+        if is_valid is None:
+            # More lenient validation - just need transaction_id and amount
+            is_valid = bool(self.transaction_id) and self.amount is not None
+        self.is_valid = is_valid
+        self.bank_name = bank_name
+        self.extractor_used = extractor_used
+        self.error = error
+        self.raw_text = raw_text
+        self.incomplete = incomplete
+
+    @classmethod
+    def failure(cls, error: str, extractor_used: str = 'None') -> "TransactionResult":
+        """Result for a document that could not be extracted"""
+        return cls(is_valid=False, error=error, extractor_used=extractor_used)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TransactionResult":
+        """Rebuild a result from its mapping view (e.g. after JSON storage)"""
+        return cls(**{key: data[key] for key in cls.__slots__ if key in data})
+
+    def _display(self, key: str):
+        if key == 'date':
+            if self.date_text is not None:
+                return self.date_text
+            return str(self.date) if self.date is not None else None
+        value = getattr(self, key)
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    def __getitem__(self, key: str):
+        if key in self.FIELDS or (key in self.OPTIONAL_FIELDS and getattr(self, key) is not None):
+            return self._display(key)
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.FIELDS
+        for key in self.OPTIONAL_FIELDS:
+            if getattr(self, key) is not None:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict:
+        """Plain dict copy of the mapping view"""
+        return dict(self)
+
+    def __repr__(self) -> str:
+        return (f"TransactionResult(bank_name={self.bank_name!r}, transaction_id={self.transaction_id!r}, "
+                f"amount={self.amount!r}, is_valid={self.is_valid!r})")
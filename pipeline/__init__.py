@@ -0,0 +1 @@
+# Verification pipeline package
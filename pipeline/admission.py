@@ -0,0 +1,112 @@
+"""
+Admission control in front of the verification pipeline
+Token buckets per user and for the whole bot; a user over their limit gets
+an immediate refusal instead of a download and parse.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Decision:
+    """Outcome of one admission check
+
+    `notify` is true only for the first refusal after an admitted request,
+    so a flood of messages gets one "slow down" reply rather than one each.
+    """
+    allowed: bool
+    retry_after: float = 0.0
+    reason: Optional[str] = None
+    notify: bool = False
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, burst: float) -> float:
+    return min(burst, tokens + (now - updated) * rate)
+
+
+class AdmissionControl:
+    """Per-user and global token buckets
+
+    Each user costs one small tuple (tokens, last update, notified). A
+    bucket left idle long enough to refill completely holds no information,
+    so it is dropped; `max_users` bounds memory even under a flood of
+    distinct IDs by evicting the least recently active users first.
+    """
+
+    def __init__(self, user_rate: float = 0.2, user_burst: float = 5, global_rate: float = 50.0,
+                 global_burst: float = 200, max_users: int = 100000, clock=time.monotonic):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_users = max_users
+        self.clock = clock
+        self.admitted = 0
+        self.refused = 0
+        self._users: "OrderedDict[int, Tuple[float, float, bool]]" = OrderedDict()
+        self._global = (float(global_burst), clock())
+        # A bucket idle this long is full again
+        self._idle_expiry = user_burst / user_rate if user_rate > 0 else float('inf')
+
+    @classmethod
+    def from_env(cls, **overrides) -> "AdmissionControl":
+        """Limits from ADMIT_* environment variables (rates are per second)"""
+        settings = {
+            'user_rate': float(os.getenv('ADMIT_USER_RATE', '0.2')),
+            'user_burst': float(os.getenv('ADMIT_USER_BURST', '5')),
+            'global_rate': float(os.getenv('ADMIT_GLOBAL_RATE', '50')),
+            'global_burst': float(os.getenv('ADMIT_GLOBAL_BURST', '200')),
+            'max_users': int(os.getenv('ADMIT_MAX_USERS', '100000')),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def _expire(self, now: float):
+        # Least recently active users are at the front
+        while self._users:
+            user_id, (_, updated, _) = next(iter(self._users.items()))
+            if now - updated < self._idle_expiry and len(self._users) < self.max_users:
+                break
+            del self._users[user_id]
+
+    def admit(self, user_id: int, cost: float = 1.0) -> Decision:
+        """Take `cost` tokens from the user's and the global bucket, or refuse"""
+        now = self.clock()
+        self._expire(now)
+
+        tokens, updated, notified = self._users.pop(user_id, (self.user_burst, now, False))
+        tokens = _refill(tokens, updated, now, self.user_rate, self.user_burst)
+        global_tokens = _refill(*self._global, now, self.global_rate, self.global_burst)
+        self._global = (global_tokens, now)
+
+        if tokens < cost:
+            decision = Decision(False, (cost - tokens) / self.user_rate, 'user', not notified)
+        elif global_tokens < cost:
+            decision = Decision(False, (cost - global_tokens) / self.global_rate, 'global', not notified)
+        else:
+            tokens -= cost
+            self._global = (global_tokens - cost, now)
+            decision = Decision(True)
+
+        self._users[user_id] = (tokens, now, not decision.allowed)
+        if decision.allowed:
+            self.admitted += 1
+        else:
+            self.refused += 1
+            if decision.notify:
+                logger.info(f"Refused user {user_id} ({decision.reason} limit), "
+                            f"retry in {decision.retry_after:.0f}s")
+        return decision
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'admitted': self.admitted,
+            'refused': self.refused,
+            'tracked_users': len(self._users),
+        }
@@ -0,0 +1,254 @@
+"""
+Verification result cache
+An in-memory LRU tier in front of a persistent SQLite tier, both with a TTL.
+Results are stored under every key that identifies the receipt: the
+normalized URL, the transaction ID read from the URL, the Telegram
+file_unique_id and the SHA-256 of the downloaded content.
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from extractors.transaction_result import TransactionResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 24 * 60 * 60
+# Seconds between sweeps of expired rows from the SQLite tier
+DEFAULT_PURGE_INTERVAL = 60 * 60
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a receipt URL for cache and coalescing keys
+
+    Scheme and host are lowercased, default ports, fragments and a trailing
+    slash are dropped, and query parameters are sorted. Paths keep their
+    case because receipt IDs in paths are case-sensitive.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and not ((scheme == 'http' and port == 80) or (scheme == 'https' and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ''))
+
+
+def url_key(url: str) -> str:
+    return f"url:{normalize_url(url)}"
+
+
+def transaction_key(bank_name: str, transaction_id: str) -> str:
+    return f"txn:{bank_name.lower()}:{transaction_id}"
+
+
+def file_key(file_unique_id: str) -> str:
+    return f"file:{file_unique_id}"
+
+
+def content_key(content) -> str:
+    return f"sha256:{hashlib.sha256(content).hexdigest()}"
+
+
+def url_keys(url: str, manager=None) -> List[str]:
+    """Keys known before downloading: the URL and, for URLs on a known bank
+    host, the transaction ID read from it"""
+    keys = [url_key(url)]
+    if manager is not None:
+        found = manager.transaction_id_from_url(url)
+        if found:
+            keys.append(transaction_key(*found))
+    return keys
+
+
+def result_keys(result: Mapping, url: str, manager) -> List[str]:
+    """Keys derived from an extracted result
+
+    The transaction key comes from the document's content, which anyone can
+    forge, and real bank links are answered from it without downloading.
+    So it is only written for a result downloaded from its own bank's known
+    host; uploads and pages from any other host never get one.
+    """
+    bank_name = result.get('bank_name')
+    if result.get('transaction_id') and bank_name and manager.bank_for_url(url) == bank_name:
+        return [transaction_key(bank_name, result['transaction_id'])]
+    return []
+
+
+class LRUTier:
+    """Bounded in-memory tier; the least recently used entry goes first"""
+
+    def __init__(self, capacity: int = 1024, ttl: float = DEFAULT_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str, expires: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (expires or time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteTier:
+    """Persistent tier shared by restarts of the bot
+
+    Expired rows are deleted when the tier is opened and then by the first
+    write after every `purge_interval` seconds, so the file stays bounded by
+    what was stored within one TTL.
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, purge_interval: float = DEFAULT_PURGE_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self._db.commit()
+        removed = self.purge_expired()
+        if removed:
+            logger.info(f"Purged {removed} expired cache entries from {path}")
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        """(expiry time, value) for a live entry"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT expires, value FROM results WHERE key = ? AND expires > ?",
+                (key, time.time()),
+            ).fetchone()
+        return row
+
+    def put_many(self, keys: Iterable[str], value: str, expires: Optional[float] = None):
+        expires = expires or time.time() + self.ttl
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO results (key, value, expires) VALUES (?, ?, ?)",
+                [(key, value, expires) for key in keys],
+            )
+            self._db.commit()
+        if time.time() - self._last_purge >= self.purge_interval:
+            self.purge_expired()
+
+    def purge_expired(self) -> int:
+        """Delete expired rows and return how many were removed"""
+        with self._lock:
+            self._last_purge = time.time()
+            removed = self._db.execute("DELETE FROM results WHERE expires <= ?", (self._last_purge,)).rowcount
+            self._db.commit()
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResultCache:
+    """Two-tier cache of verification results with hit-rate statistics"""
+
+    def __init__(self, path: Optional[str] = None, memory_size: int = 1024, ttl: float = DEFAULT_TTL,
+                 purge_interval: float = DEFAULT_PURGE_INTERVAL):
+        self.ttl = ttl
+        self.memory = LRUTier(memory_size, ttl)
+        self.disk = SQLiteTier(path, ttl, purge_interval) if path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, **overrides) -> "ResultCache":
+        """Cache configured from CACHE_* environment variables
+
+        CACHE_PATH is the SQLite file; set it to an empty string to keep
+        the cache in memory only.
+        """
+        settings = {
+            'path': os.getenv('CACHE_PATH', 'verify_cache.sqlite3') or None,
+            'memory_size': int(os.getenv('CACHE_MEMORY_SIZE', '1024')),
+            'ttl': float(os.getenv('CACHE_TTL', str(DEFAULT_TTL))),
+            'purge_interval': float(os.getenv('CACHE_PURGE_INTERVAL', str(DEFAULT_PURGE_INTERVAL))),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def get(self, *keys: str) -> Optional[TransactionResult]:
+        """Result stored under the first of `keys` that has one"""
+        for key in keys:
+            value = self.memory.get(key)
+            if value is not None:
+                self.memory_hits += 1
+                return self._load(value)
+        if self.disk is not None:
+            for key in keys:
+                row = self.disk.get(key)
+                if row is not None:
+                    self.disk_hits += 1
+                    expires, value = row
+                    self.memory.put(key, value, expires)
+                    return self._load(value)
+        self.misses += 1
+        return None
+
+    def put(self, keys: Iterable[str], result: Mapping):
+        """Store a result under every key; the raw document text is not kept"""
+        keys = [key for key in dict.fromkeys(keys) if key]
+        if not keys:
+            return
+        data = {key: value for key, value in dict(result).items() if key != 'raw_text'}
+        value = json.dumps(data, default=str)
+        expires = time.time() + self.ttl
+        for key in keys:
+            self.memory.put(key, value, expires)
+        if self.disk is not None:
+            self.disk.put_many(keys, value, expires)
+
+    @staticmethod
+    def _load(value: str) -> TransactionResult:
+        return TransactionResult.from_dict(json.loads(value))
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'lookups': lookups,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            'memory_entries': len(self.memory),
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
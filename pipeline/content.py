@@ -0,0 +1,138 @@
+"""
+Text extraction from downloaded receipt content (PDF, HTML or plain text)
+"""
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+import logging
+
+from .pdf_engines import get_engines
+
+logger = logging.getLogger(__name__)
+
+# How much of the start of a body is looked at to tell PDF from HTML.
+# PDF readers accept the %PDF header anywhere in the first 1024 bytes.
+SNIFF_BYTES = 1024
+
+HTML_MARKERS = (b'<!doctype', b'<html', b'<head', b'<body', b'<table')
+
+
+def sniff_content_type(head: Union[bytes, bytearray, memoryview]) -> Optional[str]:
+    """'pdf', 'html' or None, judged from the first bytes of a body"""
+    head = bytes(head[:SNIFF_BYTES])
+    if b'%PDF' in head:
+        return 'pdf'
+    lowered = head.lower()
+    if any(marker in lowered for marker in HTML_MARKERS):
+        return 'html'
+    return None
+
+
+def iter_pdf_pages(document, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """Text of each page in [start, stop), extracted only as it is consumed"""
+    stop = len(document) if stop is None else min(stop, len(document))
+    for page_num in range(start, stop):
+        yield document.page_text(page_num)
+
+
+def page_ranges(start: int, stop: int, parts: int) -> List[Tuple[int, int]]:
+    """Split pages [start, stop) into at most `parts` contiguous ranges"""
+    count = stop - start
+    if count <= 0:
+        return []
+    parts = max(1, min(parts, count))
+    size, extra = divmod(count, parts)
+    ranges = []
+    for part in range(parts):
+        end = start + size + (1 if part < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def extract_pdf_pages(pdf_content: Union[bytes, bytearray, memoryview, BinaryIO],
+                      start: int = 0, stop: Optional[int] = None) -> List[str]:
+    """Text of pages [start, stop); ranges of one document can run in parallel"""
+    try:
+        return get_engines().run(pdf_content, lambda document: list(iter_pdf_pages(document, start, stop)))
+    except Exception as e:
+        logger.error(f"PDF extraction failed: {e}")
+        raise Exception(f"Failed to extract text from PDF: {str(e)}")
+
+
+def extract_pdf_text(pdf_content: Union[bytes, bytearray, memoryview, BinaryIO]) -> str:
+    """Extract text from PDF with the fastest installed engine
+
+    Accepts the PDF bytes or a binary stream. If the engine fails on this
+    document the next one is tried.
+    """
+    try:
+        text = get_engines().run(pdf_content, lambda document: " ".join(iter_pdf_pages(document)))
+        logger.info(f"Extracted {len(text)} characters from PDF")
+        return text
+
+    except Exception as e:
+        logger.error(f"PDF extraction failed: {e}")
+        raise Exception(f"Failed to extract text from PDF: {str(e)}")
+
+
+def extract_html_text(html_content: bytes) -> str:
+    """Extract text from HTML content"""
+    try:
+        from bs4 import BeautifulSoup
+
+        # Decode HTML content
+        html_text = html_content.decode('utf-8', errors='ignore')
+
+        # Parse HTML
+        soup = BeautifulSoup(html_text, 'html.parser')
+
+        # Remove script and style elements
+        for script in soup(["script", "style"]):
+            script.decompose()
+
+        # Get text content
+        text = soup.get_text()
+
+        # Clean up whitespace
+        lines = (line.strip() for line in text.splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        text = ' '.join(chunk for chunk in chunks if chunk)
+
+        logger.info(f"Extracted {len(text)} characters from HTML")
+        return text
+
+    except Exception as e:
+        logger.error(f"HTML extraction failed: {e}")
+        raise Exception(f"Failed to extract text from HTML: {str(e)}")
+
+
+def extract_content_text(content: bytes, content_type: str) -> str:
+    """Extract text from content - handles both PDF and HTML"""
+    content_type = content_type.lower()
+
+    logger.info(f"Processing content type: {content_type}")
+
+    # Only the head is inspected, so the body is never lowercased or copied
+    sniffed = sniff_content_type(content)
+
+    # Try PDF first
+    if 'pdf' in content_type or sniffed == 'pdf':
+        try:
+            return extract_pdf_text(content)
+        except Exception as e:
+            logger.warning(f"PDF extraction failed, trying HTML: {e}")
+
+    # Try HTML
+    if 'html' in content_type or sniffed == 'html':
+        try:
+            return extract_html_text(content)
+        except Exception as e:
+            logger.warning(f"HTML extraction failed: {e}")
+
+    # Fallback: treat as plain text
+    try:
+        text = content.decode('utf-8', errors='ignore')
+        logger.info(f"Extracted {len(text)} characters as plain text")
+        return text
+    except Exception as e:
+        logger.error(f"All content extraction methods failed: {e}")
+        raise Exception("Failed to extract text from content")
@@ -0,0 +1,90 @@
+"""
+Execution layer for CPU-bound verification stages
+PDF/HTML parsing and regex extraction run here instead of on the event loop
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Optional, TypeVar
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class ExecutorBusy(Exception):
+    """Raised when too many jobs are already waiting for the executor"""
+
+
+class StageExecutor:
+    """Thread or process pool with a cap on queued work
+
+    At most `max_pending` jobs are submitted or running at once. A caller
+    that arrives when the cap is reached waits up to `queue_timeout`
+    seconds for a slot and then gets ExecutorBusy, so a burst of heavy
+    documents turns into quick "busy" replies instead of an unbounded
+    queue. Process pools need picklable, module-level functions (see
+    pipeline.stages).
+    """
+
+    def __init__(self, kind: str = 'thread', max_workers: Optional[int] = None,
+                 max_pending: int = 64, queue_timeout: float = 5.0):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown executor kind: {kind!r}")
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._pool: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.pending = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, **overrides) -> "StageExecutor":
+        """Executor configured from PARSE_* environment variables"""
+        workers = os.getenv('PARSE_WORKERS')
+        settings = {
+            'kind': os.getenv('PARSE_EXECUTOR', 'thread').lower(),
+            'max_workers': int(workers) if workers else None,
+            'max_pending': int(os.getenv('PARSE_MAX_PENDING', '64')),
+            'queue_timeout': float(os.getenv('PARSE_QUEUE_TIMEOUT', '5')),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    @property
+    def pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == 'process':
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='verify-stage')
+            logger.info(f"Started {self.kind} executor with {self.max_workers} workers")
+        return self._pool
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run func(*args, **kwargs) on the pool and await its result"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ExecutorBusy(f"{self.max_pending} documents are already being processed")
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, partial(func, *args, **kwargs))
+        finally:
+            self.pending -= 1
+            self._slots.release()
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
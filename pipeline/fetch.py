@@ -0,0 +1,170 @@
+"""
+Async receipt downloads over a shared, pooled HTTP client
+"""
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import logging
+import os
+from .content import SNIFF_BYTES, sniff_content_type
+from .host_policy import HostPolicies
+
+logger = logging.getLogger(__name__)
+
+# Receipts are small; anything larger is not worth downloading
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+
+
+class FetchError(Exception):
+    """A download was refused before it completed"""
+
+
+class ContentTooLarge(FetchError):
+    pass
+
+
+class UnsupportedContent(FetchError):
+    pass
+
+
+@dataclass
+class FetchResult:
+    """A downloaded receipt body"""
+    url: str
+    status_code: int
+    content_type: str
+    content: bytes
+    kind: Optional[str] = None  # 'pdf' or 'html', sniffed from the first bytes
+
+
+class Fetcher:
+    """Shared httpx.AsyncClient with keep-alive and per-host connection caps
+
+    One client (and so one connection pool) serves every handler, so
+    downloads reuse connections and many can be in flight on one event
+    loop. httpx only limits connections globally; every download also goes
+    through the host's HostPolicy, which caps concurrent requests per bank
+    server (`per_host`), fails fast while a host is down, adapts the
+    attempt deadline to observed latency and hedges slow requests.
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive: int = 20, per_host: int = 8,
+                 connect_timeout: float = 5.0, read_timeout: float = 20.0,
+                 pool_timeout: float = 10.0, verify: bool = True,
+                 max_bytes: int = DEFAULT_MAX_BYTES, policies: Optional[HostPolicies] = None):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.per_host = per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_timeout = pool_timeout
+        self.verify = verify
+        self.max_bytes = max_bytes
+        self._client = None
+        self.policies = policies or HostPolicies(max_concurrency=per_host, max_timeout=connect_timeout + read_timeout)
+
+    @classmethod
+    def from_env(cls, **overrides) -> "Fetcher":
+        """Fetcher configured from FETCH_* environment variables
+
+        Host policies come from HostPolicies.from_env (HOST_* variables)
+        unless `policies` is passed in.
+        """
+        settings = {
+            'max_connections': int(os.getenv('FETCH_MAX_CONNECTIONS', '100')),
+            'max_keepalive': int(os.getenv('FETCH_MAX_KEEPALIVE', '20')),
+            'per_host': int(os.getenv('FETCH_PER_HOST', '8')),
+            'connect_timeout': float(os.getenv('FETCH_CONNECT_TIMEOUT', '5')),
+            'read_timeout': float(os.getenv('FETCH_READ_TIMEOUT', '20')),
+            'max_bytes': int(os.getenv('FETCH_MAX_BYTES', str(DEFAULT_MAX_BYTES))),
+        }
+        settings.update(overrides)
+        if settings.get('policies') is None:
+            settings['policies'] = HostPolicies.from_env()
+        return cls(**settings)
+
+    @property
+    def client(self):
+        """The pooled client, created on first use"""
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_keepalive),
+                timeout=httpx.Timeout(connect=self.connect_timeout, read=self.read_timeout,
+                                      write=self.read_timeout, pool=self.pool_timeout),
+                verify=self.verify,
+                follow_redirects=True,
+            )
+        return self._client
+
+    @staticmethod
+    def _is_host_failure(error: BaseException) -> bool:
+        """Whether an error says the host is unhealthy (not that the receipt is bad)"""
+        import httpx
+
+        # Refused receipts and malformed links are the request's fault
+        if isinstance(error, (FetchError, httpx.InvalidURL, httpx.UnsupportedProtocol)):
+            return False
+        response = getattr(error, 'response', None)
+        status = getattr(response, 'status_code', None)
+        return status is None or status >= 500 or status == 429
+
+    async def download(self, url: str, accept: Tuple[str, ...] = ('pdf', 'html'),
+                       max_bytes: Optional[int] = None) -> FetchResult:
+        """Stream a receipt body, refusing it as early as possible
+
+        The type is sniffed from the first bytes, so a body that is not one
+        of `accept` is abandoned after the first chunk. A declared or actual
+        size over `max_bytes` aborts the download. Chunks are joined once at
+        the end, so the parsers get a single bytes object with no further
+        copies.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        return await self.policies.call(
+            url, lambda: self._download_once(url, accept, max_bytes), self._is_host_failure)
+
+    async def _download_once(self, url: str, accept: Tuple[str, ...], max_bytes: int) -> FetchResult:
+        async with self.client.stream('GET', url) as response:
+            response.raise_for_status()
+            declared = response.headers.get('content-length')
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise ContentTooLarge(f"Receipt is {int(declared) // 1024} KB, limit is {max_bytes // 1024} KB")
+
+            chunks = []
+            size = 0
+            kind = None
+            async for chunk in response.aiter_bytes():
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ContentTooLarge(f"Receipt is larger than {max_bytes // 1024} KB")
+                if kind is None and (size >= SNIFF_BYTES or len(chunks) == 1):
+                    head = chunks[0] if len(chunks) == 1 else b"".join(chunks)[:SNIFF_BYTES]
+                    kind = sniff_content_type(head)
+                    if kind is None and size >= SNIFF_BYTES:
+                        raise UnsupportedContent("The link did not return a PDF or HTML receipt")
+                    if kind is not None and kind not in accept:
+                        raise UnsupportedContent(f"Expected {' or '.join(accept).upper()}, got {kind.upper()}")
+
+            content = b"".join(chunks)
+            if kind is None:
+                # Short bodies are sniffed once they are complete
+                kind = sniff_content_type(content)
+                if kind not in accept:
+                    raise UnsupportedContent("The link did not return a PDF or HTML receipt")
+
+            logger.info(f"Fetched {size} bytes ({kind}) from {url[:50]}")
+            return FetchResult(
+                url=str(response.url),
+                status_code=response.status_code,
+                content_type=response.headers.get('content-type', ''),
+                content=content,
+                kind=kind,
+            )
+
+    async def aclose(self):
+        """Close pooled connections; call on shutdown"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
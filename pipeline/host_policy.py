@@ -0,0 +1,277 @@
+"""
+Outbound policy for bank receipt hosts
+Per-host concurrency caps, a circuit breaker, adaptive timeouts and hedged
+retries around each download attempt
+"""
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from urllib.parse import urlsplit
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class HostUnavailable(Exception):
+    """The host's circuit is open; requests fail fast until it is retried"""
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures
+
+    While open every request fails immediately. After `reset_timeout`
+    seconds one trial request is let through (half-open); its outcome
+    closes the circuit or opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def retry_in(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def release_trial(self):
+        """The half-open trial ended without an outcome (it was cancelled)"""
+        self._trial_running = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+
+class LatencyTracker:
+    """Recent successful latencies of one host"""
+
+    def __init__(self, window: int = 100):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class HostPolicy:
+    """Limits and state for a single host"""
+
+    def __init__(self, host: str, max_concurrency: int = 8, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, min_timeout: float = 2.0, max_timeout: float = 30.0,
+                 timeout_multiplier: float = 3.0, hedge: bool = True, hedge_percentile: float = 0.95,
+                 min_samples: int = 20, retries: int = 1, retry_backoff: float = 0.5):
+        self.host = host
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = LatencyTracker()
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.in_flight = 0
+
+    def _warmed_up(self) -> bool:
+        return len(self.latency.samples) >= self.min_samples
+
+    def timeout(self) -> float:
+        """Attempt deadline: a multiple of the observed p99, within bounds"""
+        if not self._warmed_up():
+            return self.max_timeout
+        p99 = self.latency.percentile(0.99)
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+    def hedge_delay(self) -> Optional[float]:
+        """How long to wait before sending a second copy of a slow request"""
+        if not self.hedge or not self._warmed_up():
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    async def _attempt(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        async with self.slots:
+            started = time.monotonic()
+            result = await asyncio.wait_for(attempt(), self.timeout())
+            self.latency.record(time.monotonic() - started)
+            return result
+
+    async def _hedged(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        primary = asyncio.ensure_future(self._attempt(attempt))
+        delay = self.hedge_delay()
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        self.hedges_sent += 1
+        logger.info(f"Hedging slow request to {self.host} after {delay:.2f}s")
+        backup = asyncio.ensure_future(self._attempt(attempt))
+        pending = {primary, backup}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, attempt: Callable[[], Awaitable[T]],
+                   is_failure: Callable[[BaseException], bool] = lambda e: True) -> T:
+        """Run `attempt` under this host's limits
+
+        Exceptions for which `is_failure` is false (a 404, a refused content
+        type) are passed through without retrying or counting against the
+        host.
+        """
+        self.in_flight += 1
+        try:
+            return await self._call(attempt, is_failure)
+        finally:
+            self.in_flight -= 1
+
+    async def _call(self, attempt: Callable[[], Awaitable[T]],
+                    is_failure: Callable[[BaseException], bool]) -> T:
+        for retry in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise HostUnavailable(
+                    f"{self.host} is not responding; try again in {self.breaker.retry_in():.0f}s")
+            try:
+                result = await self._hedged(attempt)
+            except asyncio.CancelledError:
+                # Let the next request run the half-open trial instead
+                self.breaker.release_trial()
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = asyncio.TimeoutError(f"{self.host} did not answer within {self.timeout():.1f}s")
+                if not is_failure(e):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                logger.warning(f"Request to {self.host} failed ({e!r}), attempt {retry + 1}")
+                if retry == self.retries or self.breaker.state != 'closed':
+                    raise e
+                await asyncio.sleep(self.retry_backoff * (2 ** retry))
+            else:
+                self.breaker.record_success()
+                return result
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'state': self.breaker.state,
+            'failures': self.breaker.failures,
+            'p50': self.latency.percentile(0.5),
+            'p99': self.latency.percentile(0.99),
+            'timeout': self.timeout(),
+            'hedges_sent': self.hedges_sent,
+            'hedges_won': self.hedges_won,
+        }
+
+
+class HostPolicies:
+    """HostPolicy per URL host, created on first use
+
+    Hosts come from user-submitted URLs, so at most `max_hosts` policies are
+    kept: the least recently used host without a request in flight is
+    dropped first. Hosts with configured overrides are never dropped.
+    """
+
+    def __init__(self, overrides: Optional[Dict[str, Dict]] = None, max_hosts: int = 256, **defaults):
+        self.defaults = defaults
+        self.overrides = {host.lower(): settings for host, settings in (overrides or {}).items()}
+        self.max_hosts = max_hosts
+        self._policies: "OrderedDict[str, HostPolicy]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls, **overrides) -> "HostPolicies":
+        """Policies configured from HOST_* environment variables"""
+        settings = {
+            'max_concurrency': int(os.getenv('HOST_MAX_CONCURRENCY', os.getenv('FETCH_PER_HOST', '8'))),
+            'failure_threshold': int(os.getenv('HOST_FAILURE_THRESHOLD', '5')),
+            'reset_timeout': float(os.getenv('HOST_RESET_TIMEOUT', '30')),
+            'max_timeout': float(os.getenv('HOST_MAX_TIMEOUT', '30')),
+            'retries': int(os.getenv('HOST_RETRIES', '1')),
+            'hedge': os.getenv('HOST_HEDGE', '1') not in ('0', 'false', 'no'),
+            'max_hosts': int(os.getenv('HOST_MAX_TRACKED', '256')),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def for_host(self, host: str) -> HostPolicy:
+        host = host.lower()
+        policy = self._policies.get(host)
+        if policy is None:
+            settings = {**self.defaults, **self.overrides.get(host, {})}
+            policy = self._policies[host] = HostPolicy(host, **settings)
+            self._evict(keep=host)
+        else:
+            self._policies.move_to_end(host)
+        return policy
+
+    def _evict(self, keep: str):
+        excess = len(self._policies) - self.max_hosts
+        if excess <= 0:
+            return
+        idle = [host for host, policy in self._policies.items()
+                if not policy.in_flight and host != keep and host not in self.overrides]
+        for host in idle[:excess]:
+            del self._policies[host]
+
+    def for_url(self, url: str) -> HostPolicy:
+        return self.for_host(urlsplit(url).hostname or '')
+
+    async def call(self, url: str, attempt: Callable[[], Awaitable[T]],
+                   is_failure: Callable[[BaseException], bool] = lambda e: True) -> T:
+        return await self.for_url(url).call(attempt, is_failure)
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {host: policy.stats() for host, policy in self._policies.items()}
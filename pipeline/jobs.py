@@ -0,0 +1,261 @@
+"""
+Internal job queue between the Telegram handlers and verification workers
+Handlers only enqueue; a pool of workers drains the queue by priority, taking
+turns between chats so one chat's burst cannot starve the others.
+"""
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+PRIORITY_URL = 0
+PRIORITY_DOCUMENT = 1
+PRIORITY_HEAVY = 2  # large PDFs and OCR images
+
+
+class QueueFull(Exception):
+    """The queue, or this chat's share of it, is at capacity"""
+
+
+@dataclass
+class Job:
+    """One verification request; the payload must be JSON-serializable"""
+    kind: str
+    chat_id: int
+    payload: Dict
+    priority: int = PRIORITY_URL
+    created_at: float = field(default_factory=time.time)
+    id: Optional[int] = None
+
+
+class MemoryBackend:
+    """In-process queue: per priority, a round-robin of per-chat FIFOs"""
+
+    def __init__(self):
+        self._levels: Dict[int, "OrderedDict[int, Deque[Job]]"] = {}
+        self._per_chat: Dict[int, int] = {}
+        self._ids = itertools.count(1)
+        self._size = 0
+
+    def push(self, job: Job):
+        job.id = next(self._ids)
+        chats = self._levels.setdefault(job.priority, OrderedDict())
+        chats.setdefault(job.chat_id, deque()).append(job)
+        self._per_chat[job.chat_id] = self._per_chat.get(job.chat_id, 0) + 1
+        self._size += 1
+
+    def pop(self) -> Optional[Job]:
+        for priority in sorted(self._levels):
+            chats = self._levels[priority]
+            if not chats:
+                continue
+            # Take the next job of the chat whose turn it is, then send that
+            # chat to the back of the line
+            chat_id, jobs = next(iter(chats.items()))
+            job = jobs.popleft()
+            if jobs:
+                chats.move_to_end(chat_id)
+            else:
+                del chats[chat_id]
+            self._size -= 1
+            return job
+        return None
+
+    def done(self, job: Job):
+        remaining = self._per_chat.get(job.chat_id, 0) - 1
+        if remaining > 0:
+            self._per_chat[job.chat_id] = remaining
+        else:
+            self._per_chat.pop(job.chat_id, None)
+
+    def chat_depth(self, chat_id: int) -> int:
+        """Queued plus running jobs of one chat"""
+        return self._per_chat.get(chat_id, 0)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """Persistent queue; jobs queued or running at shutdown run after a restart
+
+    Chats take turns through a per-chat "last served" counter: the next job
+    is the oldest job of the highest priority among the chats served least
+    recently.
+    """
+
+    def __init__(self, path: str = 'verify_jobs.sqlite3'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, chat_id INTEGER NOT NULL, "
+            "priority INTEGER NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL, "
+            "running INTEGER NOT NULL DEFAULT 0);"
+            "CREATE INDEX IF NOT EXISTS jobs_by_priority ON jobs (running, priority, id);"
+            "CREATE TABLE IF NOT EXISTS turns (chat_id INTEGER PRIMARY KEY, last_turn INTEGER NOT NULL);"
+        )
+        # Jobs that were running when the process stopped are queued again
+        recovered = self._db.execute("UPDATE jobs SET running = 0 WHERE running = 1").rowcount
+        self._db.commit()
+        if recovered:
+            logger.info(f"Re-queued {recovered} interrupted jobs from {path}")
+        self._turn = self._db.execute("SELECT COALESCE(MAX(last_turn), 0) FROM turns").fetchone()[0]
+
+    def push(self, job: Job):
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (kind, chat_id, priority, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job.kind, job.chat_id, job.priority, json.dumps(job.payload), job.created_at),
+            )
+            self._db.commit()
+        job.id = cursor.lastrowid
+
+    def pop(self) -> Optional[Job]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT j.id, j.kind, j.chat_id, j.priority, j.payload, j.created_at FROM jobs j "
+                "LEFT JOIN turns t ON t.chat_id = j.chat_id WHERE j.running = 0 "
+                "ORDER BY j.priority, COALESCE(t.last_turn, 0), j.id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, kind, chat_id, priority, payload, created_at = row
+            self._turn += 1
+            self._db.execute("UPDATE jobs SET running = 1 WHERE id = ?", (job_id,))
+            self._db.execute("INSERT OR REPLACE INTO turns (chat_id, last_turn) VALUES (?, ?)", (chat_id, self._turn))
+            self._db.commit()
+        return Job(kind, chat_id, json.loads(payload), priority, created_at, job_id)
+
+    def done(self, job: Job):
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+            if not self._db.execute("SELECT 1 FROM jobs WHERE chat_id = ? LIMIT 1", (job.chat_id,)).fetchone():
+                self._db.execute("DELETE FROM turns WHERE chat_id = ?", (job.chat_id,))
+            self._db.commit()
+
+    def chat_depth(self, chat_id: int) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE running = 0").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class JobQueue:
+    """Bounded job queue drained by a pool of asyncio workers
+
+    `submit()` raises QueueFull when `capacity` jobs are waiting or when the
+    chat already has `per_chat_limit` jobs queued or running, so the
+    handler can answer with a backpressure message straight away.
+    """
+
+    def __init__(self, backend=None, workers: int = 8, capacity: int = 1000, per_chat_limit: int = 20):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.workers = workers
+        self.capacity = capacity
+        self.per_chat_limit = per_chat_limit
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self._handler: Optional[Callable[[Job], Awaitable[None]]] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @classmethod
+    def from_env(cls, **overrides) -> "JobQueue":
+        """Queue configured from JOB_* environment variables
+
+        JOB_BACKEND=sqlite keeps queued jobs in JOB_DB_PATH across restarts.
+        """
+        backend = None
+        if os.getenv('JOB_BACKEND', 'memory').lower() == 'sqlite':
+            backend = SQLiteBackend(os.getenv('JOB_DB_PATH', 'verify_jobs.sqlite3'))
+        settings = {
+            'backend': backend,
+            'workers': int(os.getenv('JOB_WORKERS', '8')),
+            'capacity': int(os.getenv('JOB_CAPACITY', '1000')),
+            'per_chat_limit': int(os.getenv('JOB_PER_CHAT', '20')),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def submit(self, job: Job) -> int:
+        """Queue a job and return how many jobs are waiting ahead of it"""
+        waiting = len(self.backend)
+        if waiting >= self.capacity:
+            raise QueueFull("The verification queue is full")
+        if self.backend.chat_depth(job.chat_id) >= self.per_chat_limit:
+            raise QueueFull(f"You already have {self.per_chat_limit} receipts in progress")
+        self.backend.push(job)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return waiting
+
+    def start(self, handler: Callable[[Job], Awaitable[None]]):
+        """Start the workers on the running event loop"""
+        self._handler = handler
+        self._wakeup = asyncio.Event()
+        if len(self.backend):
+            self._wakeup.set()
+        self._tasks = [asyncio.ensure_future(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Started {self.workers} verification workers ({len(self.backend)} jobs queued)")
+
+    async def _worker(self, number: int):
+        while True:
+            job = self.backend.pop()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            self.running += 1
+            try:
+                await self._handler(job)
+                self.completed += 1
+            except asyncio.CancelledError:
+                # Shutting down: the job stays in a persistent backend and
+                # runs again after a restart
+                self.running -= 1
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Job {job.id} ({job.kind}) failed in worker {number}: {e}")
+            self.running -= 1
+            self.backend.done(job)
+
+    async def stop(self):
+        """Stop the workers; persistent backends keep unfinished jobs"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.backend.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': len(self.backend),
+            'running': self.running,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
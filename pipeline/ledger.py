@@ -0,0 +1,131 @@
+"""
+Ledger of verified receipts for duplicate detection
+Records live in SQLite (WAL) and are mirrored in a dict, so the duplicate
+check on the verification path never touches the disk.
+"""
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional, Tuple
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LedgerEntry:
+    """A verified receipt and how often it has been submitted"""
+    bank_name: str
+    transaction_id: str
+    amount: Optional[str]
+    date: Optional[str]
+    first_seen: float
+    last_seen: float
+    seen_count: int
+    first_chat: Optional[int] = None
+
+
+@dataclass
+class Sighting:
+    """Outcome of recording one verification"""
+    entry: LedgerEntry
+    is_duplicate: bool
+    same_chat: bool = False
+    amount_changed: bool = False
+
+
+def ledger_key(bank_name: str, transaction_id: str) -> Tuple[str, str]:
+    return (bank_name or '').strip().lower(), (transaction_id or '').strip().upper()
+
+
+class ReceiptLedger:
+    """Persistent (bank, transaction ID) index with seen counts"""
+
+    def __init__(self, path: str = 'verify_ledger.sqlite3'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL with NORMAL sync only fsyncs at checkpoints; a crash can lose
+        # the last few sightings but never corrupts the ledger
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS receipts ("
+            "bank_name TEXT NOT NULL, transaction_id TEXT NOT NULL, amount TEXT, date TEXT, "
+            "first_seen REAL NOT NULL, last_seen REAL NOT NULL, seen_count INTEGER NOT NULL, "
+            "first_chat INTEGER, PRIMARY KEY (bank_name, transaction_id))"
+        )
+        self._db.commit()
+        self._index: Dict[Tuple[str, str], LedgerEntry] = {}
+        for row in self._db.execute("SELECT * FROM receipts"):
+            entry = LedgerEntry(*row)
+            self._index[(entry.bank_name, entry.transaction_id)] = entry
+        logger.info(f"Loaded {len(self._index)} receipts from ledger {path}")
+
+    @classmethod
+    def from_env(cls) -> "ReceiptLedger":
+        return cls(os.getenv('LEDGER_PATH', 'verify_ledger.sqlite3'))
+
+    def lookup(self, bank_name: str, transaction_id: str) -> Optional[LedgerEntry]:
+        return self._index.get(ledger_key(bank_name, transaction_id))
+
+    def record(self, result: Mapping, chat_id: Optional[int] = None) -> Optional[Sighting]:
+        """Record a verified result; says whether it was seen before"""
+        if not result.get('transaction_id') or not result.get('bank_name'):
+            return None
+        key = ledger_key(result['bank_name'], result['transaction_id'])
+        amount, date = result.get('amount'), result.get('date')
+        now = time.time()
+
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                entry = LedgerEntry(key[0], key[1], amount, date, now, now, 1, chat_id)
+                self._index[key] = entry
+                sighting = Sighting(entry, is_duplicate=False)
+            else:
+                entry.seen_count += 1
+                entry.last_seen = now
+                sighting = Sighting(
+                    entry, is_duplicate=True,
+                    same_chat=chat_id is not None and chat_id == entry.first_chat,
+                    amount_changed=amount is not None and entry.amount is not None and amount != entry.amount,
+                )
+            self._db.execute(
+                "INSERT INTO receipts VALUES (?, ?, ?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT (bank_name, transaction_id) DO UPDATE SET "
+                "seen_count = seen_count + 1, last_seen = excluded.last_seen",
+                (key[0], key[1], amount, date, now, now, chat_id),
+            )
+            self._db.commit()
+
+        if sighting.is_duplicate:
+            logger.warning(f"Receipt {key[1]} ({key[0]}) submitted {entry.seen_count} times")
+        return sighting
+
+    def compact(self, max_age: Optional[float] = None) -> int:
+        """Drop receipts not seen for `max_age` seconds, then shrink the files
+
+        Returns the number of receipts removed.
+        """
+        with self._lock:
+            removed = 0
+            if max_age is not None:
+                cutoff = time.time() - max_age
+                removed = self._db.execute("DELETE FROM receipts WHERE last_seen < ?", (cutoff,)).rowcount
+                for key in [key for key, entry in self._index.items() if entry.last_seen < cutoff]:
+                    del self._index[key]
+            self._db.commit()
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._db.execute("VACUUM")
+        logger.info(f"Compacted ledger: removed {removed}, {len(self._index)} remain")
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
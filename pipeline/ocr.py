@@ -0,0 +1,177 @@
+"""
+OCR for receipt images and scanned PDF pages
+Pages of a PDF without a usable text layer are rasterized with PyMuPDF and
+read with Tesseract; pages that already have text are never rasterized.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import logging
+import os
+
+from .cache import LRUTier
+
+logger = logging.getLogger(__name__)
+
+TESSERACT_CONFIG = r'--oem 3 --psm 6'
+
+# OCR results do not go stale; entries only leave the cache by size
+OCR_CACHE_TTL = 30 * 86400
+
+
+def preprocess(img):
+    """Grayscale and Otsu threshold, which Tesseract reads best"""
+    import cv2
+
+    if img.ndim == 3:
+        code = cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        img = cv2.cvtColor(img, code)
+    _, thresh = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return thresh
+
+
+def ocr_array(img) -> str:
+    """Text of a decoded image (numpy array)"""
+    import pytesseract
+
+    return pytesseract.image_to_string(preprocess(img), config=TESSERACT_CONFIG)
+
+
+def ocr_image(image_data) -> str:
+    """Text of an encoded image (PNG, JPEG, ...) given as bytes"""
+    import cv2
+    import numpy as np
+
+    img = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return ocr_array(img)
+
+
+def choose_dpi(page, min_dpi: int = 150, max_dpi: int = 400, target_pixels: int = 2500) -> int:
+    """Rasterization DPI for a PyMuPDF page
+
+    A scan is read best at the resolution it was scanned at, so the DPI of
+    the largest embedded image is used. Pages without images are sized so
+    their long side is about `target_pixels`. Both are kept within bounds:
+    below ~150 DPI Tesseract misreads digits, above ~400 it only gets slower.
+    """
+    dpi = None
+    for info in page.get_image_info():
+        x0, _, x1, _ = info['bbox']
+        if x1 - x0 > 0:
+            image_dpi = info['width'] / ((x1 - x0) / 72)
+            dpi = image_dpi if dpi is None else max(dpi, image_dpi)
+    if dpi is None:
+        long_side = max(page.rect.width, page.rect.height) / 72
+        dpi = target_pixels / long_side if long_side else min_dpi
+    return int(min(max_dpi, max(min_dpi, dpi)))
+
+
+def page_hash(doc, page) -> str:
+    """Hash of a page's content stream and embedded images
+
+    Computed from the raw PDF objects, so a repeated page is recognised
+    before it is rasterized.
+    """
+    digest = hashlib.sha256(page.read_contents() or b'')
+    for image in page.get_images(full=True):
+        digest.update(doc.xref_stream_raw(image[0]) or b'')
+    return digest.hexdigest()
+
+
+def rasterize(page, dpi: int):
+    """Grayscale numpy image of a PyMuPDF page"""
+    import fitz
+    import numpy as np
+
+    pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    return np.frombuffer(pixmap.samples, np.uint8).reshape(pixmap.height, pixmap.width)
+
+
+class ScannedPageOCR:
+    """Fills in the text of PDF pages that have no text layer
+
+    Pages are rasterized one after another (a PyMuPDF document is not thread
+    safe) and recognised in parallel: each Tesseract call is a subprocess,
+    so threads are enough. Recognised text is cached by page hash.
+    """
+
+    def __init__(self, workers: int = 4, min_chars: int = 20, min_dpi: int = 150,
+                 max_dpi: int = 400, cache_size: int = 256, recognize=ocr_array):
+        self.workers = workers
+        self.min_chars = min_chars
+        self.min_dpi = min_dpi
+        self.max_dpi = max_dpi
+        self.recognize = recognize
+        self.cache = LRUTier(cache_size, ttl=OCR_CACHE_TTL)
+        self.pages_recognized = 0
+        self.cache_hits = 0
+
+    @classmethod
+    def from_env(cls) -> "ScannedPageOCR":
+        return cls(
+            workers=int(os.getenv('OCR_WORKERS', str(min(4, os.cpu_count() or 1)))),
+            min_chars=int(os.getenv('OCR_MIN_CHARS', '20')),
+            min_dpi=int(os.getenv('OCR_MIN_DPI', '150')),
+            max_dpi=int(os.getenv('OCR_MAX_DPI', '400')),
+            cache_size=int(os.getenv('OCR_CACHE_SIZE', '256')),
+        )
+
+    def blank_pages(self, pages: List[str]) -> List[int]:
+        """Indexes of pages whose text layer is empty or nearly so"""
+        return [index for index, text in enumerate(pages)
+                if len(''.join(text.split())) < self.min_chars]
+
+    def recognize_all(self, images: Dict[int, Tuple[str, object]]) -> Dict[int, str]:
+        """OCR {page index: (page hash, image)} in parallel and cache the text"""
+        if not images:
+            return {}
+        indexes = list(images)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(indexes)))) as pool:
+            texts = list(pool.map(lambda index: self.recognize(images[index][1]), indexes))
+        for index, text in zip(indexes, texts):
+            self.cache.put(images[index][0], text)
+        self.pages_recognized += len(indexes)
+        return dict(zip(indexes, texts))
+
+    def fill_pages(self, pdf_content: bytes, pages: List[str]) -> List[str]:
+        """`pages` with blank pages replaced by their OCR text"""
+        blank = self.blank_pages(pages)
+        if not blank:
+            return pages
+        try:
+            import fitz
+        except ImportError:
+            logger.warning(f"{len(blank)} page(s) have no text layer; install PyMuPDF to OCR them")
+            return pages
+
+        pages = list(pages)
+        images: Dict[int, Tuple[str, object]] = {}
+        with fitz.open(stream=bytes(pdf_content), filetype='pdf') as doc:
+            for index in blank:
+                page = doc.load_page(index)
+                key = page_hash(doc, page)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    self.cache_hits += 1
+                    pages[index] = cached
+                    continue
+                dpi = choose_dpi(page, self.min_dpi, self.max_dpi)
+                images[index] = (key, rasterize(page, dpi))
+                logger.info(f"Rasterized page {index + 1} at {dpi} DPI for OCR")
+
+        for index, text in self.recognize_all(images).items():
+            pages[index] = text
+        return pages
+
+
+_ocr: Optional[ScannedPageOCR] = None
+
+
+def get_ocr() -> ScannedPageOCR:
+    """This process's OCR helper and page cache"""
+    global _ocr
+    if _ocr is None:
+        _ocr = ScannedPageOCR.from_env()
+    return _ocr
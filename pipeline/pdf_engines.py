@@ -0,0 +1,310 @@
+"""
+Interchangeable PDF text engines
+PyPDF2 is the default; PyMuPDF is used when installed and faster. The order
+is picked by a micro-benchmark on first use in each process, and a document
+one engine cannot read is retried with the next.
+"""
+from typing import BinaryIO, Callable, List, NamedTuple, Optional, TypeVar, Union
+import io
+import logging
+import os
+import statistics
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+PdfContent = Union[bytes, bytearray, memoryview, BinaryIO]
+
+# Text of the benchmark probe; an engine must read all of it back to qualify
+PROBE_LINES = [
+    "Commercial Bank of Ethiopia",
+    "Reference No. (VAT Invoice No) FT24001PROBE",
+    "Payment Date & Time 1/15/2024, 10:30:00 AM",
+    "Transferred Amount 1,250.00 ETB",
+]
+
+
+class EngineError(Exception):
+    """An engine could not open or read a document; another engine may"""
+
+
+class TextRun(NamedTuple):
+    """A piece of text at its baseline origin, in PDF points from the bottom left"""
+    text: str
+    x: float
+    y: float
+    font: str
+    size: float
+
+
+class PageLayout(NamedTuple):
+    """Page text plus the positioned runs it was built from"""
+    width: float
+    height: float
+    text: str
+    runs: List[TextRun]
+
+
+def font_name(name) -> str:
+    """Base font name without the PDF slash or a subset prefix (ABCDEF+Arial)"""
+    name = str(name or '').lstrip('/')
+    prefix, plus, rest = name.partition('+')
+    return rest if plus and len(prefix) == 6 else name
+
+
+class PyPDF2Engine:
+    """Pure Python; always the fallback of last resort"""
+
+    name = 'pypdf2'
+
+    def __init__(self):
+        import PyPDF2
+        self._pypdf2 = PyPDF2
+
+    def open(self, content: PdfContent):
+        stream = content if hasattr(content, 'read') else io.BytesIO(content)
+        return self._pypdf2.PdfReader(stream)
+
+    def page_count(self, handle) -> int:
+        return len(handle.pages)
+
+    def page_text(self, handle, index: int) -> str:
+        return handle.pages[index].extract_text() or ""
+
+    def page_layout(self, handle, index: int) -> PageLayout:
+        page = handle.pages[index]
+        runs = []
+
+        def visit(text, cm, tm, font_dict, font_size):
+            text = text.strip()
+            if text:
+                # Text matrix origin mapped through the current transformation
+                x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+                y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+                font = font_name(font_dict.get('/BaseFont')) if font_dict else ''
+                runs.append(TextRun(text, x, y, font, float(font_size)))
+
+        text = page.extract_text(visitor_text=visit) or ""
+        return PageLayout(float(page.mediabox.width), float(page.mediabox.height), text, runs)
+
+
+class PyMuPDFEngine:
+    """MuPDF through the `fitz` module (PyMuPDF); several times faster than PyPDF2"""
+
+    name = 'pymupdf'
+
+    def __init__(self):
+        import fitz
+        self._fitz = fitz
+
+    def open(self, content: PdfContent):
+        data = content.read() if hasattr(content, 'read') else content
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return self._fitz.open(stream=data, filetype='pdf')
+
+    def page_count(self, handle) -> int:
+        return handle.page_count
+
+    def page_text(self, handle, index: int) -> str:
+        return handle.load_page(index).get_text() or ""
+
+    def page_layout(self, handle, index: int) -> PageLayout:
+        page = handle.load_page(index)
+        height = page.rect.height
+        runs = []
+        for block in page.get_text('dict')['blocks']:
+            for line in block.get('lines', ()):
+                for span in line['spans']:
+                    text = span['text'].strip()
+                    if text:
+                        # MuPDF measures from the top left
+                        x, y = span['origin']
+                        runs.append(TextRun(text, x, height - y, font_name(span['font']), span['size']))
+        return PageLayout(page.rect.width, height, page.get_text() or "", runs)
+
+
+ENGINES = {
+    PyMuPDFEngine.name: PyMuPDFEngine,
+    PyPDF2Engine.name: PyPDF2Engine,
+}
+
+
+class PdfDocument:
+    """An open PDF with the engine that reads it
+
+    Anything the engine raises comes out as EngineError, so callers can tell
+    a document the engine cannot read from a failure in their own code.
+    """
+
+    def __init__(self, engine, handle):
+        self.engine = engine
+        self.handle = handle
+
+    @classmethod
+    def open(cls, engine, content: PdfContent) -> "PdfDocument":
+        try:
+            return cls(engine, engine.open(content))
+        except Exception as e:
+            raise EngineError(str(e)) from e
+
+    def __len__(self) -> int:
+        try:
+            return self.engine.page_count(self.handle)
+        except Exception as e:
+            raise EngineError(str(e)) from e
+
+    def page_text(self, index: int) -> str:
+        try:
+            return self.engine.page_text(self.handle, index)
+        except Exception as e:
+            raise EngineError(str(e)) from e
+
+    def page_layout(self, index: int) -> PageLayout:
+        try:
+            return self.engine.page_layout(self.handle, index)
+        except Exception as e:
+            raise EngineError(str(e)) from e
+
+
+def available_engines() -> List:
+    """An instance of every engine whose library is installed"""
+    engines = []
+    for name, engine_class in ENGINES.items():
+        try:
+            engines.append(engine_class())
+        except ImportError:
+            logger.debug(f"PDF engine {name} is not installed")
+    return engines
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def render_pdf(lines: List[str], page_size=(595, 842)) -> bytes:
+    """Minimal single-page PDF with one Helvetica text line per row"""
+    width, height = page_size
+    stream_lines = ["BT", "/F1 10 Tf", "12 TL", f"40 {height - 60} Td"]
+    for line in lines:
+        stream_lines.append(f"({_pdf_escape(line)}) Tj T*")
+    stream_lines.append("ET")
+    stream = "\n".join(stream_lines).encode('latin-1', errors='replace')
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+         f"/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>").encode('ascii'),
+        b"<< /Length " + str(len(stream)).encode('ascii') + b" >>\nstream\n" + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode('ascii') + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('ascii')
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode('ascii')
+    out += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+            f"startxref\n{xref}\n%%EOF\n").encode('ascii')
+    return bytes(out)
+
+
+def probe_pdf() -> bytes:
+    return render_pdf(PROBE_LINES)
+
+
+def benchmark_engine(engine, probe: bytes, rounds: int = 5) -> Optional[float]:
+    """Median seconds to read the probe, or None if the engine misreads it"""
+    expected = set(" ".join(PROBE_LINES).split())
+    timings = []
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            handle = engine.open(probe)
+            text = " ".join(engine.page_text(handle, i) for i in range(engine.page_count(handle)))
+            timings.append(time.perf_counter() - start)
+    except Exception as e:
+        logger.warning(f"PDF engine {engine.name} failed the probe: {e}")
+        return None
+    if not expected <= set(text.split()):
+        logger.warning(f"PDF engine {engine.name} misread the probe")
+        return None
+    return statistics.median(timings)
+
+
+def rank_engines(engines: List, probe: Optional[bytes] = None, rounds: int = 5) -> List:
+    """Engines fastest first; engines that misread the probe go last"""
+    probe = probe if probe is not None else probe_pdf()
+    timings = {engine.name: benchmark_engine(engine, probe, rounds) for engine in engines}
+    ranked = sorted(engines, key=lambda engine: (timings[engine.name] is None,
+                                                 timings[engine.name] or 0.0))
+    logger.info("PDF engines: " + ", ".join(
+        f"{engine.name} ({timings[engine.name] * 1e3:.2f}ms)" if timings[engine.name] is not None
+        else f"{engine.name} (failed probe)" for engine in ranked))
+    return ranked
+
+
+class PdfEngines:
+    """Engines in order of preference; documents fall back down the list"""
+
+    def __init__(self, engines: List):
+        self.engines = engines
+        self.fallbacks = 0
+
+    @classmethod
+    def from_env(cls) -> "PdfEngines":
+        """PDF_ENGINE=auto benchmarks the installed engines; a name puts that one first"""
+        engines = available_engines()
+        choice = os.getenv('PDF_ENGINE', 'auto').lower()
+        if choice == 'auto':
+            engines = rank_engines(engines) if len(engines) > 1 else engines
+        else:
+            if choice not in [engine.name for engine in engines]:
+                logger.warning(f"PDF_ENGINE={choice} is not installed, using the others")
+            engines.sort(key=lambda engine: engine.name != choice)
+        return cls(engines)
+
+    @property
+    def primary(self) -> Optional[str]:
+        return self.engines[0].name if self.engines else None
+
+    def run(self, content: PdfContent, work: Callable[[PdfDocument], T]) -> T:
+        """Apply `work` to the document, opened by each engine in turn until one reads it
+
+        Only EngineError moves on to the next engine; any other exception
+        from `work` is raised as is.
+        """
+        if not self.engines:
+            raise Exception("No PDF engine installed (install PyPDF2 or PyMuPDF)")
+        errors = []
+        for position, engine in enumerate(self.engines):
+            if hasattr(content, 'seek'):
+                content.seek(0)
+            try:
+                result = work(PdfDocument.open(engine, content))
+            except EngineError as e:
+                errors.append(f"{engine.name}: {e}")
+                continue
+            if position:
+                self.fallbacks += 1
+                logger.warning(f"PDF read by fallback engine {engine.name} after: {'; '.join(errors)}")
+            return result
+        raise Exception("; ".join(errors))
+
+
+_engines: Optional[PdfEngines] = None
+
+
+def get_engines() -> PdfEngines:
+    """This process's engines, ranked on first use"""
+    global _engines
+    if _engines is None:
+        _engines = PdfEngines.from_env()
+    return _engines
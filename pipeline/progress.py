@@ -0,0 +1,96 @@
+"""
+Status messages for long verifications, with as few Bot API calls as possible
+"""
+from typing import Awaitable, Callable, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressReporter:
+    """Shows a status message only when a verification is slow
+
+    `start()` returns immediately, so the caller begins the real work at
+    once; the status message is only sent if the work is still running
+    after `show_after` seconds. Stage updates edit it at most every
+    `min_interval` seconds (skipped updates are simply superseded). `finish()`
+    edits the result into the status message, or sends the result as
+    the only message when the status was never shown, so a fast
+    verification costs one API call instead of five.
+
+    `send(text, **options)` sends a new message and returns it; the returned
+    message must have `edit_text(text, **options)`. Extra keyword
+    arguments (parse_mode) are passed to both.
+    """
+
+    def __init__(self, send: Callable[..., Awaitable], show_after: float = 1.0,
+                 min_interval: float = 2.0, **options):
+        self.send = send
+        self.show_after = show_after
+        self.min_interval = min_interval
+        self.options = options
+        self.message = None
+        self.api_calls = 0
+        self._text: Optional[str] = None
+        self._shown_text: Optional[str] = None
+        self._last_edit = 0.0
+        self._finished = False
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def start(self, text: str):
+        """Schedule the status message; the caller does not wait for it"""
+        self._text = text
+        self._task = asyncio.ensure_future(self._show_later())
+
+    async def _show_later(self):
+        await asyncio.sleep(self.show_after)
+        async with self._lock:
+            if self._finished or self.message is not None:
+                return
+            try:
+                self.message = await self.send(self._text, **self.options)
+                self.api_calls += 1
+                self._shown_text = self._text
+                self._last_edit = time.monotonic()
+            except Exception as e:
+                # The final result is still sent by finish()
+                logger.warning(f"Could not send status message: {e}")
+
+    async def update(self, text: str):
+        """New stage text; shown only if the status is visible and not throttled"""
+        async with self._lock:
+            self._text = text
+            if self._finished or self.message is None or text == self._shown_text:
+                return
+            if time.monotonic() - self._last_edit < self.min_interval:
+                return
+            try:
+                await self.message.edit_text(text, **self.options)
+                self.api_calls += 1
+                self._shown_text = text
+                self._last_edit = time.monotonic()
+            except Exception as e:
+                logger.warning(f"Could not update status message: {e}")
+
+    async def finish(self, text: str, **options):
+        """Deliver the final text, editing it into place when possible
+
+        Options given here override the reporter's (e.g. parse_mode=None
+        for a plain-text fallback). Errors from the Bot API propagate.
+        """
+        options = {**self.options, **options}
+        async with self._lock:
+            self._finished = True
+            if self._task is not None:
+                self._task.cancel()
+            if self.message is None:
+                self.message = await self.send(text, **options)
+            elif text != self._shown_text:
+                await self.message.edit_text(text, **options)
+            else:
+                return
+            self.api_calls += 1
+            self._shown_text = text
@@ -0,0 +1,52 @@
+"""
+In-flight request coalescing
+Concurrent requests for the same receipt share one download and parse
+"""
+from typing import Awaitable, Callable, Dict, TypeVar
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """Run at most one job per key at a time; later callers join it
+
+    The first caller for a key starts the job. Callers that arrive while
+    it is running wait for the same result, or the same exception. Each
+    waiter is shielded from the others, so one chat giving up does not
+    cancel the job for the rest. The key is forgotten once the job
+    finishes, so later requests start fresh (the result cache covers
+    repeats after that).
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, asyncio.Future] = {}
+        self.started = 0
+        self.joined = 0
+
+    async def do(self, key: str, job: Callable[[], Awaitable[T]]) -> T:
+        future = self._jobs.get(key)
+        if future is None:
+            self.started += 1
+            future = asyncio.ensure_future(job())
+            self._jobs[key] = future
+            future.add_done_callback(lambda done, key=key: self._forget(key, done))
+        else:
+            self.joined += 1
+            logger.info(f"Joining in-flight job for {key[:60]}")
+        return await asyncio.shield(future)
+
+    def _forget(self, key: str, future: asyncio.Future):
+        if self._jobs.get(key) is future:
+            del self._jobs[key]
+        # Retrieve the exception so a job nobody waits for anymore is not
+        # reported as "exception was never retrieved"
+        if not future.cancelled():
+            future.exception()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._jobs)
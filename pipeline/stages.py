@@ -0,0 +1,116 @@
+"""
+Verification stages as module-level functions
+They can be submitted to a thread or a process pool; each process keeps its
+own ExtractorManager so patterns are compiled once per process.
+"""
+from dataclasses import dataclass
+from typing import List, Optional
+import itertools
+import logging
+from extractors.extractor_manager import ExtractorManager
+from extractors.transaction_result import TransactionResult
+from .content import extract_content_text, extract_pdf_pages, iter_pdf_pages
+from .ocr import get_ocr
+from .pdf_engines import PdfDocument, get_engines
+from .templates import get_templates
+
+logger = logging.getLogger(__name__)
+
+_manager: Optional[ExtractorManager] = None
+
+
+def get_manager() -> ExtractorManager:
+    """This process's extractor manager"""
+    global _manager
+    if _manager is None:
+        _manager = ExtractorManager()
+    return _manager
+
+
+def parse_content(content: bytes, content_type: str) -> str:
+    return extract_content_text(content, content_type)
+
+
+def extract_transaction(text: str, url: str = "") -> TransactionResult:
+    return get_manager().extract_transaction_data(text, url)
+
+
+def parse_pdf_pages(pdf_content: bytes, start: int, stop: int) -> List[str]:
+    return extract_pdf_pages(pdf_content, start, stop)
+
+
+def ocr_pdf_pages(pdf_content: bytes, pages: List[str]) -> List[str]:
+    return get_ocr().fill_pages(pdf_content, pages)
+
+
+def is_final(result: TransactionResult) -> bool:
+    """Valid and extracted within the search budget
+
+    Only such results are cached or recorded: a result cut short by the
+    budget depends on how busy the process was and may be incomplete.
+    """
+    return bool(result.get('is_valid')) and not result.get('incomplete')
+
+
+def is_settled(result: TransactionResult) -> bool:
+    """Transaction ID, amount and a specific bank are known
+
+    Later pages cannot change such a result, so reading can stop. A match
+    by the generic extractor is not settled: bank keywords further down the
+    document could still select a specific one.
+    """
+    generic = get_manager().extractors[-1].bank_name
+    return bool(result.get('transaction_id') and result.get('amount') is not None
+                and result.get('extractor_used') not in (None, generic))
+
+
+@dataclass
+class PdfScan:
+    """Outcome of reading a PDF from the first page until the result settles"""
+    result: Optional[TransactionResult]
+    pages: List[str]
+    page_count: int
+    settled: bool
+
+
+def scan_pdf(pdf_content: bytes, url: str = "", max_pages: Optional[int] = None) -> PdfScan:
+    """Read pages in order, extracting as they come, until the result settles
+
+    The extractor runs after pages 1, 2, 4, 8, ... and after the last page
+    read, so a long document costs a linear amount of extraction work rather
+    than one run per page. At most `max_pages` pages are read; the caller
+    can parse the rest in parallel when the result has not settled.
+
+    When layout templates are known, the first page is read with positions
+    and a matching template settles the result without any regex work.
+    """
+    def scan(document: PdfDocument) -> PdfScan:
+        page_count = len(document)
+        stop = page_count if max_pages is None else min(page_count, max_pages)
+        first_pages: List[str] = []
+        templates = get_templates()
+        if len(templates) and page_count:
+            layout = document.page_layout(0)
+            result = templates.extract(layout, page_count, document.engine.name)
+            if result is not None:
+                logger.info(f"Read {result.bank_name} receipt from its layout template")
+                return PdfScan(result, [layout.text], page_count, True)
+            first_pages.append(layout.text)
+
+        pages: List[str] = []
+        result = None
+        for text in itertools.chain(first_pages, iter_pdf_pages(document, len(first_pages), stop)):
+            pages.append(text)
+            read = len(pages)
+            if read & (read - 1) == 0 or read == stop:
+                result = extract_transaction(" ".join(pages), url)
+                if is_settled(result):
+                    logger.info(f"Result settled after {read} of {page_count} pages")
+                    return PdfScan(result, pages, page_count, True)
+        return PdfScan(result, pages, page_count, False)
+
+    try:
+        return get_engines().run(pdf_content, scan)
+    except Exception as e:
+        logger.error(f"PDF extraction failed: {e}")
+        raise Exception(f"Failed to extract text from PDF: {str(e)}")
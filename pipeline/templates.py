@@ -0,0 +1,391 @@
+"""
+Layout templates for known bank receipt PDFs
+Receipts from one bank are printed from the same template, so once a layout
+is known its fields can be read straight from their positions on the first
+page. A layout is recognised by its shape (PDF engine, page size, page count)
+and by its anchors: the label and constant runs that every receipt of the
+layout prints in the same place. Unknown layouts go through ExtractorManager.
+
+Learn templates from sample receipts with:
+    python -m pipeline.templates learn samples/*.pdf
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+
+from extractors.transaction_result import TransactionResult
+from .pdf_engines import PageLayout, TextRun
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+
+# Result fields read from the page; the rest are set by the extractor
+TEMPLATE_FIELDS = (
+    'transaction_id', 'amount', 'date', 'payer_name', 'receiver', 'account',
+    'receiver_account', 'receiver_bank', 'transaction_type', 'charge', 'branch',
+    'payment_method', 'status',
+)
+REQUIRED_FIELDS = ('transaction_id', 'amount')
+AMOUNT_FIELDS = ('amount', 'charge')
+
+# Points a run may drift from its stored position and still match
+POSITION_TOLERANCE = 2.0
+
+# Fewest anchors that identify a layout
+MIN_ANCHORS = 2
+
+# (text, font, x, y): a run printed identically on every receipt of a layout
+Anchor = Tuple[str, str, float, float]
+
+# (x, y, prefix, suffix): where a field's run starts in the samples and the
+# label text around the value. Right-aligned or centred values start further
+# left the longer they are, so a value is looked for along its whole row.
+Placement = Tuple[float, float, str, str]
+
+
+def _normalize(field_name: str, text: str) -> str:
+    # Amounts are stored without thousands separators
+    return text.replace(',', '') if field_name in AMOUNT_FIELDS else text
+
+
+def _near(a: float, b: float) -> bool:
+    return abs(a - b) <= POSITION_TOLERANCE
+
+
+def _grid(value: float) -> int:
+    # Cells twice the tolerance wide
+    return round(value / (2 * POSITION_TOLERANCE))
+
+
+def _hash(data) -> str:
+    return hashlib.sha1(json.dumps(data).encode('utf-8')).hexdigest()[:16]
+
+
+def layout_shape(layout: PageLayout, page_count: int = 1, engine: str = '') -> str:
+    """Key of what a layout shares with every receipt printed from it
+
+    The engine is part of the key because engines split the same page into
+    runs differently.
+    """
+    return _hash([engine, round(layout.width), round(layout.height), page_count])
+
+
+def fingerprint(shape: str, anchors: Iterable[Anchor]) -> str:
+    """Identity of a template: its shape plus its anchors snapped to a grid"""
+    cells = sorted({(text, font, _grid(x), _grid(y)) for text, font, x, y in anchors})
+    return _hash([shape, cells])
+
+
+def shared_anchors(anchors: Iterable[Anchor], runs: List[TextRun]) -> List[Anchor]:
+    """The anchors that `runs` print in the same place and font"""
+    by_text: Dict[str, List[TextRun]] = defaultdict(list)
+    for run in runs:
+        by_text[run.text].append(run)
+    return [anchor for anchor in anchors
+            if any(run.font == anchor[1] and _near(run.x, anchor[2]) and _near(run.y, anchor[3])
+                   for run in by_text.get(anchor[0], ()))]
+
+
+def placements(layout: PageLayout, field_name: str, value: str) -> List[Placement]:
+    """Every run that contains `value`, with the text before and after it"""
+    value = _normalize(field_name, value)
+    found = []
+    for run in layout.runs:
+        text = _normalize(field_name, run.text)
+        start = text.find(value)
+        if start >= 0:
+            found.append((run.x, run.y, text[:start], text[start + len(value):]))
+    return found
+
+
+def common_placements(found: List[List[Placement]]) -> List[Placement]:
+    """Placements of the first sample that every other sample shares
+
+    The row and the label text must match; the column need not.
+    """
+    return [(round(x, 1), round(y, 1), prefix, suffix) for x, y, prefix, suffix in found[0]
+            if all(any(other[2:] == (prefix, suffix) and _near(other[1], y) for other in others)
+                   for others in found[1:])]
+
+
+class Template:
+    """Anchors and field placements of one layout, plus values that never vary"""
+
+    def __init__(self, bank_name: str, engine: str, shape: str, anchors: List[Anchor],
+                 fields: Dict[str, Placement], constants: Optional[Dict[str, str]] = None,
+                 samples: int = 0):
+        self.bank_name = bank_name
+        self.engine = engine
+        self.shape = shape
+        self.anchors = anchors
+        self.fields = fields
+        self.constants = constants or {}
+        self.samples = samples
+
+    @property
+    def key(self) -> str:
+        return fingerprint(self.shape, self.anchors)
+
+    def matches(self, layout: PageLayout) -> bool:
+        return len(shared_anchors(self.anchors, layout.runs)) == len(self.anchors)
+
+    def read(self, layout: PageLayout) -> Optional[TransactionResult]:
+        """Fields from their positions, or None if a required one is missing"""
+        anchored: Dict[str, List[Tuple[float, float]]] = defaultdict(list)
+        for text, _, x, y in self.anchors:
+            anchored[text].append((x, y))
+        values = dict(self.constants)
+        for field_name, placement in self.fields.items():
+            value = self._read_field(layout.runs, anchored, field_name, *placement)
+            if value:
+                values[field_name] = value
+        result = TransactionResult(bank_name=self.bank_name, extractor_used=self.bank_name, **values)
+        if not result.is_valid or any(getattr(result, name) is None for name in REQUIRED_FIELDS):
+            return None
+        return result
+
+    @staticmethod
+    def _read_field(runs: List[TextRun], anchored, field_name: str, x: float, y: float,
+                    prefix: str, suffix: str) -> Optional[str]:
+        best = None
+        for run in runs:
+            if not _near(run.y, y):
+                continue
+            # Labels on the row are never the value, unless the value is a
+            # constant printed where it was in the samples
+            if not _near(run.x, x) and any(_near(run.x, ax) and _near(run.y, ay)
+                                           for ax, ay in anchored.get(run.text, ())):
+                continue
+            text = _normalize(field_name, run.text)
+            # The label text around the value doubles as a check that this
+            # really is the field
+            if text.startswith(prefix) and text.endswith(suffix) and len(text) > len(prefix) + len(suffix):
+                if best is None or abs(run.x - x) < abs(best[0] - x):
+                    best = (run.x, text[len(prefix):len(text) - len(suffix)].strip())
+        return best[1] if best else None
+
+    def to_json(self) -> List:
+        return [self.bank_name, self.engine, self.shape, self.samples, [list(a) for a in self.anchors],
+                {name: list(placement) for name, placement in self.fields.items()}, self.constants]
+
+    @classmethod
+    def from_json(cls, data: List) -> "Template":
+        bank_name, engine, shape, samples, anchors, fields, constants = data
+        return cls(bank_name, engine, shape, [tuple(anchor) for anchor in anchors],
+                   {name: tuple(placement) for name, placement in fields.items()},
+                   constants, samples)
+
+
+class TemplateIndex:
+    """Fingerprint -> Template, stored as one compact JSON file"""
+
+    def __init__(self, templates: Optional[Dict[str, Template]] = None, path: Optional[str] = None):
+        self.templates: Dict[str, Template] = {}
+        self._shapes: Dict[str, List[Template]] = defaultdict(list)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.update(templates or {})
+
+    @classmethod
+    def load(cls, path: str) -> "TemplateIndex":
+        """The index at `path`; empty if the file does not exist yet"""
+        if not os.path.exists(path):
+            return cls(path=path)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION:
+            logger.warning(f"Ignoring template index {path} (version {data.get('version')})")
+            return cls(path=path)
+        templates = {key: Template.from_json(value) for key, value in data['templates'].items()}
+        logger.info(f"Loaded {len(templates)} receipt templates from {path}")
+        return cls(templates, path)
+
+    @classmethod
+    def from_env(cls) -> "TemplateIndex":
+        return cls.load(os.getenv('TEMPLATE_INDEX_PATH', 'verify_templates.json'))
+
+    def update(self, templates: Dict[str, Template]):
+        """Add or replace templates by fingerprint"""
+        for key, template in templates.items():
+            old = self.templates.get(key)
+            if old is not None:
+                self._shapes[old.shape].remove(old)
+            self.templates[key] = template
+            # Most anchors first: the most specific layout wins
+            shapes = self._shapes[template.shape]
+            shapes.append(template)
+            shapes.sort(key=lambda t: -len(t.anchors))
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        data = {
+            'version': INDEX_VERSION,
+            'templates': {key: template.to_json() for key, template in sorted(self.templates.items())},
+        }
+        temporary = path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temporary, path)
+
+    def match(self, layout: PageLayout, page_count: int = 1, engine: str = '') -> Optional[Template]:
+        """The template whose anchors all appear on the page"""
+        for template in self._shapes.get(layout_shape(layout, page_count, engine), ()):
+            if template.matches(layout):
+                return template
+        return None
+
+    def extract(self, layout: PageLayout, page_count: int = 1, engine: str = '') -> Optional[TransactionResult]:
+        """Result read from a known layout, or None to fall back to the extractors"""
+        template = self.match(layout, page_count, engine)
+        result = template.read(layout) if template is not None else None
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+
+class TemplateLearner:
+    """Builds templates from sample first pages and their extracted results
+
+    Samples of one bank and shape are grouped by the runs they print
+    identically; those runs become the layout's anchors, so names, amounts
+    and other runs that change between receipts never identify a layout. A
+    field is kept only when it sits on the same row, with the same label
+    text around it, in every sample of a layout; a value missing from the
+    page but equal in every sample (such as a payment method the extractor
+    fills in) is kept as a constant.
+    """
+
+    def __init__(self, min_samples: int = 2):
+        self.min_samples = min_samples
+        self._samples: Dict[Tuple[str, str, str], List[Tuple[PageLayout, TransactionResult]]] = defaultdict(list)
+
+    def add(self, layout: PageLayout, result: TransactionResult, page_count: int = 1,
+            engine: str = '') -> str:
+        """Add one sample; returns its layout shape"""
+        shape = layout_shape(layout, page_count, engine)
+        if result.get('is_valid') and result.get('extractor_used'):
+            self._samples[(shape, engine, result['extractor_used'])].append((layout, result))
+        return shape
+
+    @staticmethod
+    def _group(samples: List[Tuple[PageLayout, TransactionResult]]):
+        """Split samples into layouts: (anchors, samples) pairs"""
+        groups: List[Tuple[List[Anchor], List[Tuple[PageLayout, TransactionResult]]]] = []
+        for sample in samples:
+            runs = sample[0].runs
+            # The layout this sample shares the most runs with
+            best, best_shared = None, []
+            for index, (anchors, _) in enumerate(groups):
+                shared = shared_anchors(anchors, runs)
+                if len(shared) >= max(MIN_ANCHORS, len(best_shared) + 1):
+                    best, best_shared = index, shared
+            if best is None:
+                groups.append(([(run.text, run.font, round(run.x, 1), round(run.y, 1)) for run in runs], [sample]))
+            else:
+                groups[best] = (best_shared, groups[best][1] + [sample])
+        return groups
+
+    def build(self) -> Dict[str, Template]:
+        templates = {}
+        for (shape, engine, bank_name), samples in self._samples.items():
+            for anchors, members in self._group(samples):
+                if len(members) < self.min_samples or len(anchors) < MIN_ANCHORS:
+                    continue
+                template = self._build_one(bank_name, engine, shape, anchors, members)
+                if template is not None:
+                    templates[template.key] = template
+        return templates
+
+    @staticmethod
+    def _build_one(bank_name: str, engine: str, shape: str, anchors: List[Anchor],
+                   samples: List[Tuple[PageLayout, TransactionResult]]) -> Optional[Template]:
+        fields: Dict[str, Placement] = {}
+        constants: Dict[str, str] = {}
+        for field_name in TEMPLATE_FIELDS:
+            values = [result.get(field_name) for _, result in samples]
+            if any(value is None for value in values):
+                continue
+            common = common_placements([placements(layout, field_name, str(value))
+                                        for (layout, _), value in zip(samples, values)])
+            if common:
+                # Highest on the page, then the shortest label around the value
+                fields[field_name] = min(common, key=lambda p: (-p[1], len(p[2]) + len(p[3]), p))
+            elif len(set(values)) == 1:
+                constants[field_name] = str(values[0])
+        if not all(name in fields for name in REQUIRED_FIELDS):
+            logger.info(f"{bank_name} layout {shape}: required fields are not on fixed rows")
+            return None
+        return Template(bank_name, engine, shape, anchors, fields, constants, len(samples))
+
+
+_templates: Optional[TemplateIndex] = None
+
+
+def get_templates() -> TemplateIndex:
+    """This process's template index, loaded on first use"""
+    global _templates
+    if _templates is None:
+        _templates = TemplateIndex.from_env()
+    return _templates
+
+
+def learn_files(paths: Iterable[str], index: TemplateIndex, min_samples: int = 2) -> int:
+    """Learn templates from sample PDFs into `index`; returns how many were added"""
+    from .pdf_engines import get_engines
+    from .stages import get_manager
+
+    learner = TemplateLearner(min_samples)
+    for path in paths:
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        def sample(document):
+            layout = document.page_layout(0)
+            text = " ".join([layout.text] + [document.page_text(i) for i in range(1, len(document))])
+            result = get_manager().extract_transaction_data(text)
+            return learner.add(layout, result, len(document), document.engine.name), result
+
+        key, result = get_engines().run(content, sample)
+        logger.info(f"{path}: layout {key}, {result.get('extractor_used')}, valid={result.get('is_valid')}")
+    templates = learner.build()
+    index.update(templates)
+    return len(templates)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Learn and inspect receipt layout templates")
+    parser.add_argument('--index', default=os.getenv('TEMPLATE_INDEX_PATH', 'verify_templates.json'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    learn = commands.add_parser('learn', help='learn templates from sample receipt PDFs')
+    learn.add_argument('pdfs', nargs='+')
+    learn.add_argument('--min-samples', type=int, default=2)
+    commands.add_parser('show', help='list the templates in the index')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    index = TemplateIndex.load(args.index)
+    if args.command == 'learn':
+        added = learn_files(args.pdfs, index, args.min_samples)
+        index.save(args.index)
+        print(f"Learned {added} template(s); {len(index)} in {args.index}")
+    else:
+        for key, template in sorted(index.templates.items()):
+            print(f"{key}  {template.bank_name:<32} {template.engine:<8} {template.samples:>4} samples  "
+                  f"{len(template.anchors):>3} anchors  fields: {', '.join(sorted(template.fields))}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
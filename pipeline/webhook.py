@@ -0,0 +1,215 @@
+"""
+Webhook mode: receive Telegram updates over HTTP instead of long polling
+A small asyncio HTTP/1.1 server, so no web framework is needed. Several bot
+instances can run behind a load balancer that checks /healthz.
+"""
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import asyncio
+import hmac
+import json
+import logging
+import os
+import secrets
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+
+@dataclass
+class WebhookConfig:
+    """Where Telegram sends updates and where this process listens"""
+    public_url: str
+    listen: str = '0.0.0.0'
+    port: int = 8443
+    path: str = '/telegram'
+    secret_token: str = ''
+    max_connections: int = 40
+
+    @classmethod
+    def from_env(cls) -> Optional["WebhookConfig"]:
+        """Config from WEBHOOK_* variables, or None to keep polling
+
+        Instances behind one load balancer must share WEBHOOK_SECRET; when it
+        is unset a random secret is generated for this process.
+        """
+        public_url = os.getenv('WEBHOOK_URL', '').rstrip('/')
+        if not public_url:
+            return None
+        return cls(
+            public_url=public_url,
+            listen=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+            port=int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8443'))),
+            path='/' + os.getenv('WEBHOOK_PATH', 'telegram').strip('/'),
+            secret_token=os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32),
+            max_connections=int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40')),
+        )
+
+    @property
+    def webhook_url(self) -> str:
+        return self.public_url + self.path
+
+
+class WebhookServer:
+    """Accepts update POSTs on `path` and answers health checks on /healthz
+
+    `on_update(data)` receives each update's decoded JSON. `health()`
+    returns extra fields for /healthz (queue depth and the like); the
+    endpoint answers 503 until `ready` is set.
+    """
+
+    def __init__(self, on_update: Callable[[Dict], Awaitable[None]], secret_token: str,
+                 path: str = '/telegram', health: Optional[Callable[[], Dict]] = None,
+                 max_body: int = 1024 * 1024, idle_timeout: float = 75.0):
+        self.on_update = on_update
+        self.secret_token = secret_token
+        self.path = path
+        self.health = health
+        self.max_body = max_body
+        self.idle_timeout = idle_timeout
+        self.ready = False
+        self.updates_received = 0
+        self.rejected = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = '0.0.0.0', port: int = 8443) -> int:
+        """Start listening and return the bound port"""
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Webhook server listening on {host}:{port}{self.path}")
+        return port
+
+    async def stop(self):
+        self.ready = False
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                if not request_line:
+                    break
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    await self._respond(writer, 400, {'error': 'bad request line'}, keep_alive=False)
+                    break
+                method, target, version = parts
+
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                    if len(headers) > 100:
+                        break
+
+                length = headers.get('content-length', '0')
+                if not length.isdigit() or int(length) > self.max_body:
+                    await self._respond(writer, 413, {'error': 'body too large'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(int(length)) if int(length) else b''
+
+                status, payload = await self._route(method, urlsplit(target).path, headers, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, headers: Dict[str, str],
+                     body: bytes) -> Tuple[int, Dict]:
+        if path == '/healthz':
+            if method != 'GET':
+                return 405, {'error': 'method not allowed'}
+            return self._health()
+        if path != self.path:
+            return 404, {'error': 'not found'}
+        if method != 'POST':
+            return 405, {'error': 'method not allowed'}
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, ''), self.secret_token):
+            self.rejected += 1
+            logger.warning("Rejected webhook request with a wrong secret token")
+            return 403, {'error': 'forbidden'}
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return 400, {'error': 'invalid JSON'}
+        try:
+            await self.on_update(data)
+        except Exception as e:
+            # Telegram retries updates that are not answered with 200
+            logger.error(f"Could not queue update: {e}")
+            return 500, {'error': 'update not accepted'}
+        self.updates_received += 1
+        return 200, {}
+
+    def _health(self) -> Tuple[int, Dict]:
+        info = {
+            'status': 'ok' if self.ready else 'starting',
+            'updates_received': self.updates_received,
+            'rejected': self.rejected,
+        }
+        if self.health is not None:
+            info.update(self.health())
+        return (200 if self.ready else 503), info
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload: Dict, keep_alive: bool):
+        body = json.dumps(payload).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve_application(application, config: WebhookConfig,
+                            health: Optional[Callable[[], Dict]] = None):
+    """Run a python-telegram-bot Application in webhook mode until cancelled
+
+    Updates are decoded and put on the application's update queue, the same
+    queue polling would fill, so handlers do not change.
+    """
+    from telegram import Update
+
+    async def on_update(data: Dict):
+        await application.update_queue.put(Update.de_json(data, application.bot))
+
+    def app_health() -> Dict:
+        info = {'queue_depth': application.update_queue.qsize()}
+        if health is not None:
+            info.update(health())
+        return info
+
+    server = WebhookServer(on_update, config.secret_token, config.path, app_health)
+    await application.initialize()
+    await application.start()
+    await server.start(config.listen, config.port)
+    try:
+        await application.bot.set_webhook(
+            url=config.webhook_url,
+            secret_token=config.secret_token,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=config.max_connections,
+        )
+        server.ready = True
+        logger.info(f"Webhook set to {config.webhook_url}")
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        await application.stop()
+        await application.shutdown()
@@ -0,0 +1,52 @@
+from pipeline.admission import AdmissionControl
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_user_bucket_refuses_and_refills():
+    clock = FakeClock()
+    admission = AdmissionControl(user_rate=1.0, user_burst=3, global_rate=100, global_burst=100, clock=clock)
+
+    assert all(admission.admit(1).allowed for _ in range(3))
+    first = admission.admit(1)
+    assert not first.allowed and first.reason == 'user' and first.notify
+    assert first.retry_after == 1.0
+    # Only the first refusal of a burst asks for a reply
+    assert not admission.admit(1).notify
+
+    # Other users are unaffected
+    assert admission.admit(2).allowed
+
+    clock.now += 1.0
+    assert admission.admit(1).allowed
+    assert admission.stats()['refused'] == 2
+
+
+def test_global_bucket_protects_the_pipeline():
+    clock = FakeClock()
+    admission = AdmissionControl(user_rate=1.0, user_burst=5, global_rate=1.0, global_burst=2, clock=clock)
+    assert admission.admit(1).allowed and admission.admit(2).allowed
+    refused = admission.admit(3)
+    assert not refused.allowed and refused.reason == 'global'
+    clock.now += 1.0
+    assert admission.admit(3).allowed
+
+
+def test_idle_and_excess_users_expire():
+    clock = FakeClock()
+    admission = AdmissionControl(user_rate=1.0, user_burst=2, global_rate=1000, global_burst=1000,
+                                 max_users=3, clock=clock)
+    for user_id in range(10):
+        admission.admit(user_id)
+    assert admission.stats()['tracked_users'] == 3
+
+    # Buckets that have refilled completely are forgotten
+    clock.now += 2.0
+    admission.admit(99)
+    assert admission.stats()['tracked_users'] == 1
@@ -0,0 +1,97 @@
+import time
+
+from extractors.extractor_manager import ExtractorManager
+from pipeline.cache import (ResultCache, content_key, file_key, normalize_url,
+                            result_keys, transaction_key, url_key, url_keys)
+from test_extractors import awash_sample, awash_url, cbe_url
+
+
+def test_normalize_url():
+    assert normalize_url("HTTPS://Apps.CBE.com.et:100/?id=FT1&b=2#top") == "https://apps.cbe.com.et:100/?b=2&id=FT1"
+    assert normalize_url("https://example.com:443/receipt/") == "https://example.com/receipt"
+    assert normalize_url("http://example.com") == "http://example.com/"
+
+
+def test_url_keys_include_transaction_id_from_url():
+    manager = ExtractorManager()
+    assert manager.transaction_id_from_url(awash_url) == ('Awash Bank', 'E43406CDD679')
+    assert manager.transaction_id_from_url("https://example.com/receipt") is None
+    bank, transaction_id = manager.transaction_id_from_url(cbe_url)
+    assert bank == 'Commercial Bank of Ethiopia' and transaction_id.startswith('FT')
+    assert url_keys(awash_url, manager)[1] == transaction_key('Awash Bank', 'E43406CDD679')
+
+    # Bank-shaped URLs on other hosts never yield a transaction key
+    for url in ("https://attacker.example/x?id=FT25252MLNG86227914",
+                "https://attacker.example/awashpay.awashbank.com-E43406CDD679-"):
+        assert manager.transaction_id_from_url(url) is None
+        assert url_keys(url, manager) == [url_key(url)]
+
+
+def test_forged_receipts_cannot_answer_real_bank_links():
+    manager = ExtractorManager()
+    forged = awash_sample.replace('1,000 ETB', '999,999 ETB')
+    cache = ResultCache()
+
+    # A fake Awash receipt served from another host, or uploaded, is cached
+    # without a transaction key
+    attacker_url = "https://attacker.example/receipt.pdf"
+    fake = manager.extract_transaction_data(forged, attacker_url)
+    assert fake['bank_name'] == 'Awash Bank' and fake['transaction_id'] == 'E43406CDD679'
+    assert result_keys(fake, attacker_url, manager) == []
+    assert result_keys(fake, "", manager) == []
+    cache.put(url_keys(attacker_url, manager) + result_keys(fake, attacker_url, manager), fake)
+    assert cache.get(*url_keys(awash_url, manager)) is None
+
+    # The bank's own host vouches for the transaction ID
+    real = manager.extract_transaction_data(awash_sample, awash_url)
+    assert result_keys(real, awash_url, manager) == [transaction_key('Awash Bank', 'E43406CDD679')]
+    # ... but not for another bank's receipt it happens to serve
+    assert result_keys(real, cbe_url, manager) == []
+
+
+def test_two_tier_cache_round_trip(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    result = ExtractorManager().extract_transaction_data(awash_sample, awash_url, include_raw_text=True)
+    keys = [file_key("AgADxyz"), content_key(b"%PDF receipt")] + result_keys(result, awash_url, ExtractorManager())
+
+    cache = ResultCache(path, memory_size=2)
+    assert cache.get(*keys) is None
+    cache.put(keys, result)
+    hit = cache.get(file_key("AgADxyz"))
+    assert hit.to_dict() == {k: v for k, v in result.to_dict().items() if k != 'raw_text'}
+    cache.close()
+
+    # A new process starts with an empty memory tier and reads from disk
+    reopened = ResultCache(path)
+    assert reopened.get(content_key(b"%PDF receipt"))['transaction_id'] == result['transaction_id']
+    assert reopened.get(content_key(b"%PDF receipt")) is not None
+    assert reopened.get("url:https://unknown/") is None
+    stats = reopened.stats()
+    assert (stats['disk_hits'], stats['memory_hits'], stats['misses']) == (1, 1, 1)
+    assert round(stats['hit_rate'], 2) == 0.67
+    reopened.close()
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"), ttl=0.05)
+    cache.put(["file:a"], {'transaction_id': 'X1', 'amount': '5', 'is_valid': True})
+    assert cache.get("file:a")['amount'] == '5'
+    time.sleep(0.06)
+    assert cache.get("file:a") is None
+    assert cache.disk.purge_expired() == 1
+
+
+def test_expired_rows_are_purged_on_open_and_on_write(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache(path, ttl=0.05, purge_interval=0.05)
+    cache.put(["file:a"], {'transaction_id': 'X1', 'amount': '5', 'is_valid': True})
+    time.sleep(0.06)
+    # The next write sweeps out the expired row
+    cache.put(["file:b"], {'transaction_id': 'X2', 'amount': '6', 'is_valid': True})
+    assert cache.disk.purge_expired() == 0
+    cache.close()
+
+    time.sleep(0.06)
+    reopened = ResultCache(path, ttl=0.05)
+    assert reopened.disk.purge_expired() == 0
+    reopened.close()
@@ -0,0 +1,60 @@
+from benchmarks.corpus import render_html
+from pipeline.pdf_engines import render_pdf
+from pipeline.content import SNIFF_BYTES, extract_content_text, page_ranges, sniff_content_type
+
+
+def test_sniff_content_type_reads_only_the_head():
+    """PDF and HTML are recognised from the first bytes of the body"""
+    assert sniff_content_type(render_pdf(["Amount: 10 ETB"])) == 'pdf'
+    assert sniff_content_type(b"\r\n" + render_pdf(["x"])) == 'pdf'
+    assert sniff_content_type(render_html(["Amount | 10 ETB"])) == 'html'
+    assert sniff_content_type(bytearray(b"<HTML><BODY>receipt")) == 'html'
+    assert sniff_content_type(b"plain receipt text") is None
+    assert sniff_content_type(b" " * SNIFF_BYTES + b"<html>") is None
+
+
+def test_extract_content_text_falls_back_to_plain_text():
+    assert extract_content_text(b"Amount: 10 ETB", "text/plain") == "Amount: 10 ETB"
+
+
+def test_page_ranges_split_evenly():
+    assert page_ranges(4, 14, 3) == [(4, 8), (8, 11), (11, 14)]
+    assert page_ranges(0, 2, 8) == [(0, 1), (1, 2)]
+    assert page_ranges(5, 5, 4) == []
+
+
+class FakeEngine:
+    """Serves page texts from a list and records which pages were read"""
+    name = 'fake'
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.reads = []
+
+    def open(self, content):
+        return self.texts
+
+    def page_count(self, handle):
+        return len(handle)
+
+    def page_text(self, handle, index):
+        self.reads.append(index)
+        return handle[index]
+
+
+def test_scan_pdf_stops_once_the_result_settles(monkeypatch):
+    from pipeline import stages
+    from pipeline.pdf_engines import PdfEngines
+    from test_extractors import awash_sample, awash_url
+
+    engine = FakeEngine([awash_sample] + ["terms and conditions"] * 9)
+    monkeypatch.setattr(stages, 'get_engines', lambda: PdfEngines([engine]))
+    scan = stages.scan_pdf(b"%PDF", awash_url)
+    assert scan.settled and scan.page_count == 10
+    assert engine.reads == [0] and scan.result['transaction_id']
+
+    # Nothing to settle on: reading stops at max_pages for the caller to finish
+    engine = FakeEngine(["terms and conditions"] * 10)
+    monkeypatch.setattr(stages, 'get_engines', lambda: PdfEngines([engine]))
+    scan = stages.scan_pdf(b"%PDF", "", max_pages=3)
+    assert not scan.settled and len(scan.pages) == 3 and engine.reads == [0, 1, 2]
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from pipeline.executor import ExecutorBusy, StageExecutor
+from pipeline.stages import extract_transaction
+from test_extractors import awash_sample, awash_url
+
+
+def test_stage_runs_off_the_event_loop():
+    """Stages run on a pool thread and return their result"""
+    executor = StageExecutor(max_workers=2)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        worker_thread = await executor.run(threading.get_ident)
+        result = await executor.run(extract_transaction, awash_sample, awash_url)
+        return loop_thread, worker_thread, result
+
+    try:
+        loop_thread, worker_thread, result = asyncio.run(run())
+    finally:
+        executor.shutdown()
+    assert loop_thread != worker_thread
+    assert result['is_valid'] and result['bank_name'] == 'Awash Bank'
+
+
+def test_backpressure_rejects_when_queue_is_full():
+    """Callers beyond max_pending wait, then get ExecutorBusy"""
+    executor = StageExecutor(max_workers=1, max_pending=1, queue_timeout=0.05)
+
+    async def run():
+        slow = asyncio.ensure_future(executor.run(time.sleep, 0.3))
+        await asyncio.sleep(0.01)
+        assert executor.pending == 1
+        with pytest.raises(ExecutorBusy):
+            await executor.run(time.sleep, 0)
+        await slow
+        assert executor.pending == 0
+        await executor.run(time.sleep, 0)
+
+    try:
+        asyncio.run(run())
+    finally:
+        executor.shutdown()
+    assert executor.rejected == 1
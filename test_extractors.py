@@ -1,7 +1,11 @@
 """
 Test script for the new extraction system
 """
+from extractors.cbe_extractor import CBEExtractor
+from extractors.document import DocumentView
 from extractors.extractor_manager import ExtractorManager
+from extractors.label_table import LabelTable
+from extractors.pattern_matcher import PatternRegistry
 
 # Test data from the Awash Bank receipt
 awash_sample = """
@@ -60,5 +64,194 @@ def test_extractors():
     
     print("\n🎉 Test completed!")
 
+def test_pattern_registry_shared():
+    """Extractors built from one registry reuse the same compiled patterns"""
+    registry = PatternRegistry()
+    first = ExtractorManager(registry)
+    second = ExtractorManager(registry)
+    compiled_count = len(registry)
+
+    for a, b in zip(first.extractors, second.extractors):
+        assert a.matcher.compiled['transaction_id'][0] is b.matcher.compiled['transaction_id'][0]
+    assert len(registry) == compiled_count
+
+    result = first.extract_transaction_data(awash_sample, awash_url)
+    assert result['transaction_id'] == 'E43406CDD679'
+    assert result['amount'] == '1000'
+
+def test_single_pass_scan_matches_field_search():
+    """The single-pass scanner returns what per-field searching returns"""
+    manager = ExtractorManager()
+    cbe_text = (
+        "Commercial Bank of Ethiopia\nPayer ABEBE KEBEDE\nAccount 1****5678\n"
+        "Payment Date & Time 9/12/2025\nTransferred Amount 1,500.00 ETB\n"
+    )
+    for extractor in manager.extractors:
+        for text in (awash_sample, cbe_text, "", awash_url):
+            assert extractor.matcher.scan(text) == extractor.matcher.search_all(text)
+
+def test_label_table_layouts():
+    """Pipe rows, colon rows, column rows and single-space rows all parse"""
+    table = LabelTable.parse(awash_sample)
+    assert table.get('transaction id') == 'E43406CDD679'
+    assert table.get('amount') == '1,000 ETB'
+    assert table.get('beneficiary bank') == 'COMMERCIAL BANK OF ETHIOPIA'
+
+    table = LabelTable.parse(
+        "Amount: 250.00 ETB\n"
+        "Receiver    TOLA GUTA\n"
+        "Payment Date & Time 9/12/2025\n"
+        "Amount: 999.00 ETB\n"
+    )
+    assert table.get('amount') == '250.00 ETB'
+    assert table.get('receiver') == 'TOLA GUTA'
+    assert table.get('payment date & time') == '9/12/2025'
+    assert table.get('branch') is None
+
+def test_cbe_receipt_labels():
+    """CBE single-space rows are read through the label table"""
+    manager = ExtractorManager()
+    cbe_text = (
+        "Commercial Bank of Ethiopia\n"
+        "Payer ABEBE KEBEDE\n"
+        "Receiver TOLA GUTA\n"
+        "Payment Date & Time 9/12/2025\n"
+        "Reference No. (VAT Invoice No) FT252528MLNG\n"
+        "Transferred Amount 1,500.00 ETB\n"
+    )
+    result = manager.extract_transaction_data(cbe_text, "")
+    assert result['extractor_used'] == 'Commercial Bank of Ethiopia'
+    assert result['transaction_id'] == 'FT252528MLNG'
+    assert result['amount'] == '1500.00'
+    assert result['payer_name'] == 'ABEBE KEBEDE'
+    assert result['receiver'] == 'TOLA GUTA'
+    assert result['date'] == '9/12/2025'
+
+def test_host_dispatch():
+    """Known receipt hosts pick their extractor without text detection"""
+    manager = ExtractorManager()
+    # Awash-looking text on a CBE link still goes to CBE
+    assert manager._find_best_extractor(DocumentView(awash_sample, cbe_url)).bank_name == 'Commercial Bank of Ethiopia'
+    assert manager._find_best_extractor(DocumentView("", "https://AWASHPAY.awashbank.com:8225/x")).bank_name == 'Awash Bank'
+    assert manager._lookup_host(DocumentView("", "https://example.com/receipt")) is None
+
+    class DashenExtractor(CBEExtractor):
+        hosts = ('receipts.dashenbank.com/verify',)
+
+    dashen = DashenExtractor()
+    dashen.bank_name = 'Dashen Bank'
+    manager.add_extractor(dashen)
+    assert manager._lookup_host(DocumentView("", "https://receipts.dashenbank.com/verify/123")) is dashen
+    assert manager._lookup_host(DocumentView("", "https://receipts.dashenbank.com/other")) is None
+
+def test_bank_classifier_ranking():
+    """One keyword scan ranks every bank; short keywords need whole words"""
+    manager = ExtractorManager()
+    ranked = [(extractor.bank_name, score) for extractor, score in manager.classifier.rank(awash_sample.lower())]
+    assert ranked[1] == ('Awash Bank', 3.0)
+    assert manager._find_best_extractor(DocumentView(awash_sample, "")).bank_name == 'Awash Bank'
+
+    # "cbe" inside another word, or on its own, is not enough for CBE
+    assert manager._find_best_extractor(DocumentView("Subscribed: transfer 100 ETB", "")).bank_name == 'Generic Bank'
+    assert manager._find_best_extractor(DocumentView("CBE transfer of 100 ETB", "")).bank_name == 'Generic Bank'
+    assert manager._find_best_extractor(DocumentView("Commercial Bank of Ethiopia", "")).bank_name == 'Commercial Bank of Ethiopia'
+    assert manager._find_best_extractor(DocumentView("hello", "")) is None
+
+    # Generic indicators still match inside words, as they always have
+    for text in ("Receipt: transferred 500.00ETB to account 1000123456",
+                 "Transactions: amount 500 birr",
+                 "Paid 1,200ETB via awashbank transfer"):
+        assert manager._find_best_extractor(DocumentView(text, "")).bank_name == 'Generic Bank', text
+        assert 'No suitable extractor' not in (manager.extract_transaction_data(text).get('error') or '')
+
+def test_document_view_caches_derived_forms():
+    """Derived forms are computed once and shared by every extractor"""
+    doc = DocumentView("Amount: 10 ETB\nPayer  ABEBE", " https://apps.cbe.com.et:100/?id=FT1 ")
+    assert doc.lower is doc.lower
+    assert doc.label_table is doc.label_table
+    assert doc.collapsed == "Amount: 10 ETB Payer ABEBE"
+    assert doc.line_offsets == [0, 15]
+    assert doc.line_number(16) == 1
+    assert doc.host == 'apps.cbe.com.et'
+    assert DocumentView.coerce(doc) is doc
+
+    manager = ExtractorManager()
+    result = manager.extract_transaction_data(doc)
+    assert result['extractor_used'] == 'Commercial Bank of Ethiopia'
+    assert result['transaction_id'] == 'FT1'
+
+def test_transaction_result_is_typed_and_dict_compatible():
+    """Results carry typed values, drop raw text by default and read like the old dict"""
+    import pickle
+    from datetime import datetime
+    from decimal import Decimal
+
+    manager = ExtractorManager()
+    result = manager.extract_transaction_data(awash_sample, awash_url)
+    assert result.amount == Decimal('1000')
+    assert result.charge == Decimal('6')
+    assert result.date == datetime(2025, 9, 12, 10, 35, 43)
+    assert result['amount'] == '1000'
+    assert result['date'] == '2025-09-12 10:35:43 AM'
+    assert result.get('extractor_used') == 'Awash Bank'
+    assert 'raw_text' not in result and result.raw_text is None
+    assert not hasattr(result, '__dict__')
+    assert pickle.loads(pickle.dumps(result)) == result
+
+    with_text = manager.extract_transaction_data(awash_sample, awash_url, include_raw_text=True)
+    assert with_text['raw_text'] == awash_sample
+
+    failed = manager.extract_transaction_data("hello")
+    assert failed['is_valid'] is False
+    assert failed.get('error')
+
+def test_search_budget_and_text_window():
+    """Regex fallbacks stop when the budget is spent and only read the window"""
+    from extractors.pattern_matcher import SearchBudget, StdlibBackend
+    from pipeline.stages import is_final
+
+    manager = ExtractorManager(PatternRegistry(backend=StdlibBackend()))
+    generic = manager.extractors[-1]
+
+    budget = SearchBudget(max_searches=1)
+    values = generic.matcher.search_all("Amount: 10 ETB Ref: ABC12345", ['amount', 'transaction_id'], budget)
+    assert budget.exhausted
+    assert values == {'amount': '10'}
+
+    # Both scan modes honour the budget and mark a cut-short result incomplete
+    scanned = SearchBudget(max_searches=1)
+    assert generic.matcher.scan("Amount: 10 ETB Ref: ABC12345", ['amount', 'transaction_id'], scanned)
+    assert scanned.exhausted
+    assert set(generic.matcher.scan("Amount: 10 ETB Ref: ABC12345", ['amount'])) == {'amount'}
+    for single_pass in (False, True):
+        limited = type(generic)(PatternRegistry(backend=StdlibBackend()))
+        limited.max_searches, limited.single_pass_scan = 1, single_pass
+        result = limited.extract(DocumentView("Amount: 10 ETB Ref: ABC12345"))
+        assert result['incomplete'] is True and not is_final(result)
+    complete = generic.extract(DocumentView("Amount: 10 ETB Ref: ABC12345"))
+    assert 'incomplete' not in complete and is_final(complete)
+
+    window = generic.max_text_chars
+    late_amount = "x" * window + " 500.00 ETB transaction"
+    assert generic.extract(DocumentView(late_amount)).amount is None
+    assert generic.extract(DocumentView(late_amount[window:])).amount is not None
+
+def test_extract_many_matches_single_extraction():
+    """Batch results equal one-by-one extraction, in and out of order"""
+    manager = ExtractorManager()
+    items = [(awash_sample, awash_url), ("", cbe_url), "no receipt here"] * 5
+    expected = [manager.extract_transaction_data(text, url).to_dict()
+                for text, url in [(item, "") if isinstance(item, str) else item for item in items]]
+
+    in_process = [result.to_dict() for result in manager.extract_many(items, workers=1)]
+    assert in_process == expected
+
+    pooled = [result.to_dict() for result in manager.extract_many(iter(items), workers=2, chunksize=4)]
+    assert pooled == expected
+
+    unordered = dict(manager.extract_many(items, workers=2, chunksize=3, ordered=False))
+    assert sorted(unordered) == list(range(len(items)))
+    assert [unordered[i].to_dict() for i in range(len(items))] == expected
+
 if __name__ == "__main__":
     test_extractors()
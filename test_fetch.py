@@ -0,0 +1,15 @@
+from pipeline.fetch import Fetcher
+from pipeline.host_policy import HostPolicies
+
+
+def test_host_policies_come_from_host_settings(monkeypatch):
+    monkeypatch.setenv('FETCH_PER_HOST', '8')
+    monkeypatch.setenv('HOST_MAX_CONCURRENCY', '3')
+    monkeypatch.setenv('HOST_MAX_TIMEOUT', '12')
+    fetcher = Fetcher.from_env()
+    assert fetcher.policies.defaults['max_concurrency'] == 3
+    assert fetcher.policies.defaults['max_timeout'] == 12.0
+
+    # Policies passed in are used as they are
+    policies = HostPolicies(max_concurrency=1)
+    assert Fetcher.from_env(policies=policies).policies is policies
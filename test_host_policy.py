@@ -0,0 +1,164 @@
+"""
+HostPolicy against a local stand-in for slow and failing bank servers
+"""
+import asyncio
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pipeline.host_policy import HostPolicies, HostPolicy, HostUnavailable
+
+
+class StandInBank(BaseHTTPRequestHandler):
+    """/ok, /fail (500), /missing (404), /slow?<seconds>, /flaky (500 then 200),
+    /tail (first request slow, later ones fast)"""
+
+    hits = {}
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        cls = type(self)
+        with cls.lock:
+            cls.hits[path] = cls.hits.get(path, 0) + 1
+            hit = cls.hits[path]
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            if path == '/slow':
+                time.sleep(float(query or 0.1))
+            elif path == '/tail' and hit == 1:
+                time.sleep(1.0)
+            if path == '/fail' or (path == '/flaky' and hit == 1):
+                self.send_response(500)
+            elif path == '/missing':
+                self.send_response(404)
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'ok')
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def bank():
+    StandInBank.hits = {}
+    StandInBank.active = StandInBank.max_active = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInBank)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def get(url):
+    """One attempt: a blocking urllib request moved off the event loop"""
+    def fetch():
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.read()
+    return lambda: asyncio.to_thread(fetch)
+
+
+def not_client_error(error):
+    return not (isinstance(error, urllib.error.HTTPError) and error.code < 500)
+
+
+def test_circuit_opens_on_failures_and_recovers(bank):
+    policy = HostPolicy('bank', failure_threshold=3, reset_timeout=0.2, retries=0)
+
+    async def run():
+        for _ in range(3):
+            with pytest.raises(urllib.error.HTTPError):
+                await policy.call(get(bank + '/fail'))
+        assert policy.breaker.state == 'open'
+        with pytest.raises(HostUnavailable):
+            await policy.call(get(bank + '/ok'))
+        assert StandInBank.hits.get('/ok') is None
+
+        await asyncio.sleep(0.25)
+        assert policy.breaker.state == 'half_open'
+        assert await policy.call(get(bank + '/ok')) == b'ok'
+        assert policy.breaker.state == 'closed'
+
+    asyncio.run(run())
+    assert StandInBank.hits['/fail'] == 3
+
+
+def test_retries_transient_errors_but_not_client_errors(bank):
+    policy = HostPolicy('bank', retries=1, retry_backoff=0.01)
+
+    async def run():
+        assert await policy.call(get(bank + '/flaky'), not_client_error) == b'ok'
+        with pytest.raises(urllib.error.HTTPError):
+            await policy.call(get(bank + '/missing'), not_client_error)
+
+    asyncio.run(run())
+    assert StandInBank.hits['/flaky'] == 2
+    assert StandInBank.hits['/missing'] == 1
+    assert policy.breaker.failures == 0
+
+
+def test_concurrency_cap_per_host(bank):
+    policy = HostPolicy('bank', max_concurrency=2, hedge=False)
+
+    async def run():
+        await asyncio.gather(*(policy.call(get(bank + '/slow?0.05')) for _ in range(6)))
+
+    asyncio.run(run())
+    assert StandInBank.max_active == 2
+
+
+def test_adaptive_timeout_and_hedged_request(bank):
+    policy = HostPolicy('bank', min_samples=5, min_timeout=2.0, max_timeout=30.0, retries=0)
+    assert policy.timeout() == 30.0 and policy.hedge_delay() is None
+
+    async def run():
+        for _ in range(5):
+            await policy.call(get(bank + '/ok'))
+        assert policy.timeout() == 2.0
+        assert policy.hedge_delay() < 0.5
+
+        started = time.monotonic()
+        assert await policy.call(get(bank + '/tail')) == b'ok'
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(run())
+    assert elapsed < 0.9
+    assert (policy.hedges_sent, policy.hedges_won) == (1, 1)
+    assert StandInBank.hits['/tail'] == 2
+
+
+def test_policies_are_kept_for_a_bounded_number_of_hosts(bank):
+    policies = HostPolicies({'bank.example': {'retries': 0}}, max_hosts=4)
+    known = policies.for_host('bank.example')
+    recent = policies.for_host('recent.example')
+
+    async def run():
+        busy = policies.for_host('busy.example')
+        request = asyncio.ensure_future(busy.call(get(bank + '/slow?0.2')))
+        await asyncio.sleep(0.05)
+        for number in range(50):
+            policies.for_host(f"host{number}.example")
+            policies.for_host('recent.example')
+        await request
+        return busy
+
+    busy = asyncio.run(run())
+    # Busy and configured hosts survive; idle ones go least recently used first
+    assert policies.for_host('busy.example') is busy
+    assert policies.for_host('bank.example') is known
+    assert 'recent.example' in policies.stats() and policies.for_host('recent.example') is recent
+    assert len(policies.stats()) <= 4
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from pipeline.jobs import (PRIORITY_DOCUMENT, PRIORITY_HEAVY, PRIORITY_URL, Job, JobQueue,
+                           MemoryBackend, QueueFull, SQLiteBackend)
+
+
+def drain(backend):
+    order = []
+    while True:
+        job = backend.pop()
+        if job is None:
+            return order
+        backend.done(job)
+        order.append((job.chat_id, job.payload['n']))
+
+
+def fill(backend):
+    # Chat 1 floods the queue with links before chat 2 sends two
+    for n in range(3):
+        backend.push(Job('url', 1, {'n': n}, PRIORITY_URL))
+    backend.push(Job('document', 2, {'n': 'big'}, PRIORITY_HEAVY))
+    backend.push(Job('url', 2, {'n': 0}, PRIORITY_URL))
+    backend.push(Job('document', 1, {'n': 'small'}, PRIORITY_DOCUMENT))
+
+
+EXPECTED = [(1, 0), (2, 0), (1, 1), (1, 2), (1, 'small'), (2, 'big')]
+
+
+def test_memory_backend_priority_and_fairness():
+    backend = MemoryBackend()
+    fill(backend)
+    assert len(backend) == 6 and backend.chat_depth(1) == 4
+    assert drain(backend) == EXPECTED
+    assert backend.chat_depth(1) == 0
+
+
+def test_sqlite_backend_matches_and_survives_restart(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    backend = SQLiteBackend(path)
+    fill(backend)
+    assert len(backend) == 6 and backend.chat_depth(1) == 4
+    assert drain(backend) == EXPECTED
+
+    backend.push(Job('url', 3, {'n': 'waiting'}))
+    backend.push(Job('url', 3, {'n': 'running'}))
+    running = backend.pop()
+    backend.close()
+
+    # Queued jobs and the one that was running when the process stopped
+    # both run after a restart
+    backend = SQLiteBackend(path)
+    assert len(backend) == 2
+    assert drain(backend) == [(3, 'waiting'), (3, 'running')]
+    assert running.payload == {'n': 'waiting'}
+    backend.close()
+
+
+def test_queue_backpressure_and_workers():
+    async def scenario():
+        done = []
+        release = asyncio.Event()
+
+        async def handler(job):
+            await release.wait()
+            if job.payload['n'] == 'boom':
+                raise ValueError('bad receipt')
+            done.append(job.payload['n'])
+
+        queue = JobQueue(workers=2, capacity=2, per_chat_limit=3)
+        queue.start(handler)
+        assert queue.submit(Job('url', 1, {'n': 0})) == 0
+        assert queue.submit(Job('url', 1, {'n': 1})) == 1
+        await asyncio.sleep(0)  # both workers pick up a job
+
+        assert queue.submit(Job('url', 1, {'n': 2})) == 0
+        with pytest.raises(QueueFull):
+            queue.submit(Job('url', 1, {'n': 3}))  # chat limit
+        queue.submit(Job('url', 2, {'n': 'boom'}))
+        with pytest.raises(QueueFull):
+            queue.submit(Job('url', 3, {'n': 4}))  # queue capacity
+
+        release.set()
+        for _ in range(20):
+            await asyncio.sleep(0)
+        stats = queue.stats()
+        await queue.stop()
+        return sorted(done), stats
+
+    done, stats = asyncio.run(scenario())
+    assert done == [0, 1, 2]
+    assert stats == {'queued': 0, 'running': 0, 'completed': 3, 'failed': 1}
+
+
+def test_running_jobs_survive_a_queue_shutdown(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+
+    async def interrupted():
+        started = asyncio.Event()
+
+        async def handler(job):
+            started.set()
+            await asyncio.Event().wait()
+
+        queue = JobQueue(SQLiteBackend(path), workers=1)
+        queue.start(handler)
+        queue.submit(Job('url', 1, {'n': 'slow'}))
+        await started.wait()
+        await queue.stop()
+
+    async def restarted():
+        handled = []
+
+        async def handler(job):
+            handled.append(job.payload['n'])
+
+        queue = JobQueue(SQLiteBackend(path), workers=1)
+        queue.start(handler)
+        for _ in range(5):
+            await asyncio.sleep(0)
+        await queue.stop()
+        return handled
+
+    asyncio.run(interrupted())
+    backend = SQLiteBackend(path)
+    assert len(backend) == 1
+    backend.close()
+    assert asyncio.run(restarted()) == ['slow']
+    backend = SQLiteBackend(path)
+    assert len(backend) == 0
+    backend.close()
@@ -0,0 +1,40 @@
+import time
+
+from extractors.extractor_manager import ExtractorManager
+from pipeline.ledger import ReceiptLedger
+from test_extractors import awash_sample, awash_url
+
+
+def test_duplicate_transaction_ids_are_flagged(tmp_path):
+    path = str(tmp_path / "ledger.sqlite3")
+    result = ExtractorManager().extract_transaction_data(awash_sample, awash_url)
+
+    ledger = ReceiptLedger(path)
+    first = ledger.record(result, chat_id=1)
+    assert not first.is_duplicate and first.entry.seen_count == 1
+
+    again = ledger.record(result, chat_id=1)
+    assert again.is_duplicate and again.same_chat
+
+    reused = ledger.record(dict(result, amount='2000', transaction_id=' e43406cdd679 '), chat_id=2)
+    assert reused.is_duplicate and not reused.same_chat and reused.amount_changed
+    assert reused.entry.seen_count == 3
+    assert ledger.record({'transaction_id': None, 'bank_name': 'Awash Bank'}) is None
+    ledger.close()
+
+    # The index is rebuilt from disk on restart
+    reopened = ReceiptLedger(path)
+    entry = reopened.lookup('Awash Bank', 'E43406CDD679')
+    assert entry.seen_count == 3 and entry.amount == '1000' and entry.first_chat == 1
+    reopened.close()
+
+
+def test_compact_drops_stale_receipts(tmp_path):
+    ledger = ReceiptLedger(str(tmp_path / "ledger.sqlite3"))
+    ledger.record({'bank_name': 'CBE', 'transaction_id': 'FT1', 'amount': '5'})
+    time.sleep(0.02)
+    ledger.record({'bank_name': 'CBE', 'transaction_id': 'FT2', 'amount': '5'})
+    assert ledger.compact(max_age=0.01) == 1
+    assert ledger.lookup('CBE', 'FT1') is None and ledger.lookup('CBE', 'FT2') is not None
+    assert ledger.compact() == 0 and len(ledger) == 1
+    ledger.close()
@@ -0,0 +1,56 @@
+import threading
+import time
+
+from pipeline.ocr import ScannedPageOCR, choose_dpi
+
+
+class FakeRect:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+
+class FakePage:
+    def __init__(self, images=(), size=(595, 842)):
+        self.images = images
+        self.rect = FakeRect(*size)
+
+    def get_image_info(self):
+        return [{'bbox': bbox, 'width': width} for bbox, width in self.images]
+
+
+def test_blank_pages_are_the_ones_without_text():
+    ocr = ScannedPageOCR(min_chars=20)
+    pages = ["Transferred Amount 1,250.00 ETB", "", "  \n 12 \n", "Page 2 of 3"]
+    assert ocr.blank_pages(pages) == [1, 2, 3]
+    assert ocr.fill_pages(b"%PDF", pages[:1]) == pages[:1]
+
+
+def test_dpi_follows_the_scan_within_bounds():
+    # A 1240 px wide scan drawn across a 595 pt (8.26 in) page is 150 DPI
+    assert choose_dpi(FakePage([((0, 0, 595, 842), 1240)])) == 150
+    assert choose_dpi(FakePage([((0, 0, 595, 842), 2480)])) == 300
+    assert choose_dpi(FakePage([((0, 0, 595, 842), 9000)])) == 400
+    assert choose_dpi(FakePage([((0, 0, 595, 842), 300)])) == 150
+    # No images: long side of about 2500 px
+    assert choose_dpi(FakePage(size=(288, 576))) == 312
+
+
+def test_pages_are_recognized_in_parallel_and_cached():
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def recognize(image):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return f"text of {image}"
+
+    ocr = ScannedPageOCR(workers=3, recognize=recognize)
+    texts = ocr.recognize_all({0: ('hash-a', 'a'), 2: ('hash-b', 'b'), 5: ('hash-c', 'c')})
+    assert texts == {0: 'text of a', 2: 'text of b', 5: 'text of c'}
+    assert peak[0] > 1 and ocr.pages_recognized == 3
+    assert ocr.cache.get('hash-b') == 'text of b'
@@ -0,0 +1,70 @@
+import io
+
+import pytest
+
+from pipeline.pdf_engines import PROBE_LINES, PdfEngines, probe_pdf, rank_engines
+from test_content import FakeEngine
+
+
+class BrokenEngine(FakeEngine):
+    name = 'broken'
+
+    def open(self, content):
+        raise ValueError('cannot parse xref')
+
+
+class ProbeEngine(FakeEngine):
+    """Reads the probe back after `delay` iterations of busy work"""
+
+    def __init__(self, name, text, delay):
+        super().__init__([text])
+        self.name = name
+        self.delay = delay
+
+    def page_text(self, handle, index):
+        sum(range(self.delay))
+        return handle[index]
+
+
+def test_documents_fall_back_to_the_next_engine():
+    engines = PdfEngines([BrokenEngine([]), FakeEngine(['page one', 'page two'])])
+    stream = io.BytesIO(b'%PDF')
+    stream.read()
+    assert engines.run(stream, lambda document: [document.page_text(i) for i in range(len(document))]) \
+        == ['page one', 'page two']
+    assert engines.fallbacks == 1 and stream.tell() == 0
+
+    with pytest.raises(Exception, match='broken: cannot parse xref'):
+        PdfEngines([BrokenEngine([])]).run(b'%PDF', len)
+
+
+def test_errors_outside_the_engine_do_not_fall_back():
+    first, second = FakeEngine(['page one']), FakeEngine(['page one'])
+    engines = PdfEngines([first, second])
+
+    def work(document):
+        document.page_text(0)
+        raise KeyError('template field')
+
+    with pytest.raises(KeyError):
+        engines.run(b'%PDF', work)
+    assert engines.fallbacks == 0 and second.reads == []
+
+    # A page the engine cannot read does move on to the next engine
+    class BadPage(FakeEngine):
+        def page_text(self, handle, index):
+            raise ValueError('bad content stream')
+
+    engines = PdfEngines([BadPage([]), second])
+    assert engines.run(b'%PDF', lambda document: document.page_text(0)) == 'page one'
+    assert engines.fallbacks == 1
+
+
+def test_rank_engines_prefers_fast_engines_that_read_the_probe():
+    text = "\n".join(PROBE_LINES)
+    slow = ProbeEngine('slow', text, 200000)
+    fast = ProbeEngine('fast', text, 0)
+    wrong = ProbeEngine('wrong', 'Commercial Bank', 0)
+    ranked = rank_engines([slow, wrong, fast], probe=b'%PDF', rounds=3)
+    assert [engine.name for engine in ranked] == ['fast', 'slow', 'wrong']
+    assert probe_pdf().startswith(b'%PDF')
@@ -0,0 +1,54 @@
+import asyncio
+
+from pipeline.progress import ProgressReporter
+
+
+class FakeChat:
+    """Stands in for update.message.reply_text and the returned Message"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def reply_text(self, text, **options):
+        self.calls.append(('send', text, options))
+        return self
+
+    async def edit_text(self, text, **options):
+        self.calls.append(('edit', text, options))
+
+
+def test_fast_verification_sends_only_the_result():
+    chat = FakeChat()
+
+    async def run():
+        progress = ProgressReporter(chat.reply_text, show_after=0.05, parse_mode='Markdown')
+        progress.start("Processing...")
+        await progress.update("Analyzing...")
+        await progress.finish("Verified")
+        await asyncio.sleep(0.07)
+        return progress
+
+    progress = asyncio.run(run())
+    assert chat.calls == [('send', "Verified", {'parse_mode': 'Markdown'})]
+    assert progress.api_calls == 1
+
+
+def test_slow_verification_shows_status_throttles_and_edits_result_in_place():
+    chat = FakeChat()
+
+    async def run():
+        progress = ProgressReporter(chat.reply_text, show_after=0.01, min_interval=0.05)
+        progress.start("Downloading...")
+        await asyncio.sleep(0.02)
+        await progress.update("Extracting...")   # throttled
+        await asyncio.sleep(0.05)
+        await progress.update("Analyzing...")
+        await progress.finish("Verified")
+        await progress.finish("Failed", parse_mode=None)
+        return progress
+
+    progress = asyncio.run(run())
+    assert [call[:2] for call in chat.calls] == [
+        ('send', "Downloading..."), ('edit', "Analyzing..."), ('edit', "Verified"), ('edit', "Failed")]
+    assert chat.calls[-1][2] == {'parse_mode': None}
+    assert progress.api_calls == 4
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from pipeline.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_job():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.02)
+        return f"result for {key}"
+
+    async def run():
+        results = await asyncio.gather(
+            flight.do("url:a", lambda: fetch("a")),
+            flight.do("url:a", lambda: fetch("a")),
+            flight.do("url:b", lambda: fetch("b")),
+            flight.do("url:a", lambda: fetch("a")),
+        )
+        assert flight.in_flight == 0
+        # Finished jobs are not reused
+        results.append(await flight.do("url:a", lambda: fetch("a")))
+        return results
+
+    results = asyncio.run(run())
+    assert results == ["result for a", "result for a", "result for b", "result for a", "result for a"]
+    assert calls == ["a", "b", "a"]
+    assert (flight.started, flight.joined) == (3, 2)
+
+
+def test_errors_reach_every_waiter_and_cancelling_one_keeps_the_job():
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("bank is down")
+
+    async def slow():
+        await asyncio.sleep(0.03)
+        return 42
+
+    async def run():
+        outcomes = await asyncio.gather(
+            flight.do("x", failing), flight.do("x", failing), return_exceptions=True)
+        assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+        impatient = asyncio.ensure_future(flight.do("y", slow))
+        patient = asyncio.ensure_future(flight.do("y", slow))
+        await asyncio.sleep(0.005)
+        impatient.cancel()
+        assert await patient == 42
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+
+    asyncio.run(run())
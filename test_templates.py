@@ -0,0 +1,113 @@
+import json
+import random
+
+from benchmarks.corpus import generate_receipts
+from extractors.extractor_manager import ExtractorManager
+from pipeline.pdf_engines import PageLayout, TextRun
+from pipeline.templates import TemplateIndex, TemplateLearner
+from test_content import FakeEngine
+
+manager = ExtractorManager()
+
+
+def layout_for(receipt, jitter=0.0) -> PageLayout:
+    """First page as a PDF engine would report it: one run per table cell
+
+    Values in the last column are right-aligned, so their runs start further
+    left the longer the value is. Every run drifts by up to `jitter` points.
+    """
+    rng = random.Random(receipt.text)
+    runs = []
+    for row, line in enumerate(receipt.lines):
+        cells = [cell.strip() for cell in line.strip(' |').split(' | ')] if receipt.layout == 'pipe' else [line]
+        for column, cell in enumerate(cells):
+            x = 40.0 + 180 * column
+            if column == 2:
+                x += 150 - 5 * len(cell)
+            runs.append(TextRun(cell, x + rng.uniform(-jitter, jitter),
+                                782.0 - 14 * row + rng.uniform(-jitter, jitter), 'Helvetica', 10.0))
+    return PageLayout(595.0, 842.0, receipt.text, runs)
+
+
+def receipts(bank, layout, count, seed):
+    found = [r for r in generate_receipts(bank, count * 6, seed, noise_ratio=0.0) if r.layout == layout]
+    return found[:count]
+
+
+def learned_index(tmp_path):
+    learner = TemplateLearner(min_samples=2)
+    for receipt in receipts('awash', 'pipe', 3, 1) + receipts('cbe', 'spaced', 3, 2):
+        learner.add(layout_for(receipt, jitter=1.0), manager.extract_transaction_data(receipt.text, receipt.url),
+                    engine='fake')
+    index = TemplateIndex(learner.build(), str(tmp_path / "templates.json"))
+    index.save()
+    return TemplateIndex.load(str(tmp_path / "templates.json"))
+
+
+def test_known_layouts_are_read_from_positions(tmp_path):
+    index = learned_index(tmp_path)
+    assert len(index) == 2
+    with open(tmp_path / "templates.json") as f:
+        assert json.load(f)['version'] == 2
+    awash = next(t for t in index.templates.values() if t.bank_name == 'Awash Bank')
+    assert awash.engine == 'fake'
+    # Names, dates and amounts differ between receipts, so only labels and
+    # constant values identify the layout
+    anchor_texts = {anchor[0] for anchor in awash.anchors}
+    assert {'Customer Name', 'Amount', 'Awash Bank Share company'} <= anchor_texts
+    assert not any(text.endswith(' ETB') for text in anchor_texts)
+
+    for receipt in receipts('awash', 'pipe', 2, 7) + receipts('cbe', 'spaced', 2, 8):
+        expected = manager.extract_transaction_data(receipt.text, receipt.url)
+        result = index.extract(layout_for(receipt, jitter=1.0), engine='fake')
+        assert result is not None and result.is_valid
+        for field in ('transaction_id', 'amount', 'date', 'payer_name', 'receiver', 'account',
+                      'payment_method', 'extractor_used'):
+            assert result[field] == expected[field], field
+    assert index.hits == 4
+
+
+def test_unknown_or_mismatched_layouts_fall_back(tmp_path):
+    index = learned_index(tmp_path)
+    other = receipts('cbe', 'colon', 1, 3)[0]
+    assert index.extract(layout_for(other), engine='fake') is None
+
+    # Same anchors, but the label next to the amount does not match
+    receipt = receipts('cbe', 'spaced', 1, 4)[0]
+    layout = layout_for(receipt)
+    runs = [run._replace(text=run.text.replace('Transferred Amount', 'Total Fee')) for run in layout.runs]
+    assert index.match(layout._replace(runs=runs), engine='fake') is index.match(layout, engine='fake')
+    assert index.extract(layout._replace(runs=runs), engine='fake') is None
+
+    # Templates only apply to the engine that split the samples into runs
+    assert index.extract(layout, engine='pymupdf') is None
+
+    # A label moved further than the tolerance is a different layout
+    awash = layout_for(receipts('awash', 'pipe', 1, 5)[0])
+    runs = [run._replace(x=run.x + 6) if run.text == 'Customer Name' else run for run in awash.runs]
+    assert index.extract(awash._replace(runs=runs), engine='fake') is None
+    assert index.misses == 4
+
+
+class LayoutEngine(FakeEngine):
+    def __init__(self, layout):
+        super().__init__([layout.text])
+        self.layout = layout
+
+    def page_layout(self, handle, index):
+        return self.layout
+
+
+def test_scan_pdf_uses_a_matching_template(tmp_path, monkeypatch):
+    from pipeline import stages
+    from pipeline.pdf_engines import PdfEngines
+
+    index = learned_index(tmp_path)
+    receipt = receipts('awash', 'pipe', 1, 9)[0]
+    engine = LayoutEngine(layout_for(receipt))
+    monkeypatch.setattr(stages, 'get_engines', lambda: PdfEngines([engine]))
+    monkeypatch.setattr(stages, 'get_templates', lambda: index)
+
+    scan = stages.scan_pdf(b"%PDF", receipt.url)
+    assert scan.settled and scan.result['transaction_id'] == receipt.expected['transaction_id']
+    assert engine.reads == []
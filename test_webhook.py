@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from pipeline.webhook import SECRET_HEADER, WebhookServer
+
+
+async def http(port, method, path, body=b'', headers=None):
+    """Send one request on a fresh connection and return (status, json)"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    lines = [f"{method} {path} HTTP/1.1", "Host: localhost", f"Content-Length: {len(body)}", "Connection: close"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+def test_webhook_accepts_only_signed_updates_and_reports_health():
+    received = []
+    queue_depth = {'queue_depth': 0}
+
+    async def on_update(data):
+        received.append(data)
+        queue_depth['queue_depth'] += 1
+
+    async def run():
+        server = WebhookServer(on_update, 'sekret', '/telegram', health=lambda: dict(queue_depth))
+        port = await server.start('127.0.0.1', 0)
+        try:
+            assert await http(port, 'GET', '/healthz') == (503, {
+                'status': 'starting', 'updates_received': 0, 'rejected': 0, 'queue_depth': 0})
+            server.ready = True
+
+            update = json.dumps({'update_id': 1, 'message': {'text': 'hi'}}).encode()
+            assert (await http(port, 'POST', '/telegram', update))[0] == 403
+            assert (await http(port, 'POST', '/telegram', update, {SECRET_HEADER: 'wrong'}))[0] == 403
+            assert (await http(port, 'POST', '/telegram', update, {SECRET_HEADER: 'sekret'}))[0] == 200
+            assert (await http(port, 'POST', '/telegram', b'{nope', {SECRET_HEADER: 'sekret'}))[0] == 400
+            assert (await http(port, 'GET', '/telegram'))[0] == 405
+            assert (await http(port, 'GET', '/other'))[0] == 404
+
+            status, health = await http(port, 'GET', '/healthz')
+            assert status == 200
+            assert health == {'status': 'ok', 'updates_received': 1, 'rejected': 2, 'queue_depth': 1}
+        finally:
+            await server.stop()
+
+    asyncio.run(run())
+    assert received == [{'update_id': 1, 'message': {'text': 'hi'}}]
+
+
+def test_keep_alive_connection_serves_several_updates():
+    received = []
+
+    async def on_update(data):
+        received.append(data['update_id'])
+
+    async def run():
+        server = WebhookServer(on_update, 's', '/hook')
+        port = await server.start('127.0.0.1', 0)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for update_id in (1, 2, 3):
+            body = json.dumps({'update_id': update_id}).encode()
+            writer.write((f"POST /hook HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+                          f"{SECRET_HEADER}: s\r\n\r\n").encode() + body)
+            await writer.drain()
+            assert (await reader.readline()).startswith(b"HTTP/1.1 200")
+            while (await reader.readline()) != b"\r\n":
+                pass
+            await reader.readexactly(2)  # "{}"
+        writer.close()
+        await server.stop()
+
+    asyncio.run(run())
+    assert received == [1, 2, 3]